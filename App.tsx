@@ -70,7 +70,7 @@ const App: React.FC = () => {
 
     // Fetch network devices
     try {
-      const scanRes = await fetch('http://localhost:5000/api/scan');
+      const scanRes = await fetch('http://localhost:5000/api/scan?refresh=1&wait=120');
       if (scanRes.ok) {
         const scanData = await scanRes.json();
         setRealData(prev => ({ ...prev, network: scanData.devices }));
@@ -107,7 +107,7 @@ const App: React.FC = () => {
   const fetchNetworkScan = async () => {
     setIsScanning(true);
     try {
-      const scanRes = await fetch('http://localhost:5000/api/scan');
+      const scanRes = await fetch('http://localhost:5000/api/scan?refresh=1&wait=120');
       if (scanRes.ok) {
         const scanData = await scanRes.json();
         setRealData(prev => ({ ...prev, network: scanData.devices }));
@@ -172,10 +172,62 @@ const App: React.FC = () => {
     setTimeout(() => setIsScanning(false), 1500);
   };
 
+  // Reload every list the event stream keeps current (no new scan is started)
+  const resyncAll = async () => {
+    try {
+      const resSystem = await fetch('http://localhost:5000/api/system');
+      if (resSystem.ok) {
+        const sysData = await resSystem.json();
+        setRealData(prev => ({ ...prev, system: sysData }));
+      }
+    } catch (err) {
+      console.error('System fetch failed', err);
+    }
+    try {
+      // since=0 lists the whole live inventory, the same records the devices topic streams
+      const scanRes = await fetch('http://localhost:5000/api/scan?since=0');
+      if (scanRes.ok) {
+        const scanData = await scanRes.json();
+        setRealData(prev => ({ ...prev, network: scanData.changes }));
+      }
+    } catch (err) {
+      console.error('Devices fetch failed', err);
+    }
+    await fetchClientsAudit();
+  };
+
   useEffect(() => {
     checkAgentStatus();
   }, []);
 
+  // Live updates: merge pushed deltas instead of re-polling full payloads
+  useEffect(() => {
+    if (agentStatus !== 'connected') return;
+    const source = new EventSource('http://localhost:5000/api/stream?topics=clients,devices,vulnerabilities,system');
+    const upsert = (list: any[] | undefined, item: any, key: string) => {
+      const rest = (list || []).filter(x => x[key] !== item[key]);
+      return item.removed ? rest : [...rest, item];
+    };
+    source.addEventListener('clients', (e: MessageEvent) => {
+      const client = JSON.parse(e.data);
+      setRealData(prev => ({ ...prev, clients: upsert(prev?.clients, client, 'client_id') }));
+    });
+    source.addEventListener('devices', (e: MessageEvent) => {
+      const device = JSON.parse(e.data);
+      setRealData(prev => ({ ...prev, network: upsert(prev?.network, device, 'id') }));
+    });
+    source.addEventListener('vulnerabilities', (e: MessageEvent) => {
+      const result = JSON.parse(e.data);
+      setRealData(prev => ({ ...prev, vulnerabilities: upsert(prev?.vulnerabilities, result, 'client_id') }));
+    });
+    source.addEventListener('system', (e: MessageEvent) => {
+      setRealData(prev => ({ ...prev, system: JSON.parse(e.data) }));
+    });
+    // The server dropped events for us: reload the full lists once
+    source.addEventListener('resync', () => resyncAll());
+    return () => source.close();
+  }, [agentStatus]);
+
   const handleAudit = async () => {
     if (agentStatus === 'disconnected') {
       alert('Агент недоступен. Проверьте, запущен ли agent.py');
@@ -7,18 +7,52 @@ Handles network scanning and system monitoring for educational institutions
 import os
 import platform
 import socket
+import string
 import subprocess
 import json
 import logging
-from typing import Dict, List, Any, Tuple
+import operator
+import asyncio
+import csv
+import ctypes
+import ipaddress
+import select
+import shutil
+import heapq
+import signal
+import sqlite3
+import struct
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+import threading
+import uuid
+import gzip
+import urllib.error
+import urllib.request
+from typing import Dict, List, Any, Tuple, Optional, Callable
 from datetime import datetime
 
 import psutil
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from scapy.all import ARP, Ether, srp, get_if_hwaddr
+from scapy.all import (ARP, BOOTP, DHCP, DNS, IP, AsyncSniffer, Ether, NBNSRegistrationRequest, NBTDatagram,
+                       conf, get_if_hwaddr, srp)
+from scapy.arch.common import compile_filter
 import warnings
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
 warnings.filterwarnings("ignore")
 
 # Setup logging
@@ -57,12 +91,1469 @@ MAC_VENDORS = {
 }
 
 
+class OUIRegistry:
+    """IEEE MA-L/MA-M/MA-S vendor registry with O(1) prefix lookup
+
+    The IEEE CSV exports (oui.csv, mam.csv, oui36.csv) are read from the data
+    directory once and compiled into oui.bin; later startups load the binary
+    file instead of re-parsing the CSVs. Without them the MA-L snapshot shipped
+    in oui-bundled.csv.gz is used (refresh both with update_oui.py).
+    """
+
+    MAGIC = b"CSOUI1\n"
+    # (registry CSV, prefix length in bits), most specific first
+    SOURCES = (("oui36.csv", 36), ("mam.csv", 28), ("oui.csv", 24))
+    BUNDLED = ("oui-bundled.csv.gz", 24)
+
+    def __init__(self, data_dir: Optional[str] = None):
+        self.data_dir = data_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        self.cache_path = os.path.join(self.data_dir, "oui.bin")
+        self.vendors = []
+        self.indexes = {bits: {} for _, bits in self.SOURCES}
+        # The built-in table only fills gaps the registry does not cover
+        self.fallback = {self._mac_to_int(oui + ":00:00:00") >> 24: vendor
+                         for oui, vendor in MAC_VENDORS.items()}
+        self.load()
+
+    @staticmethod
+    def _mac_to_int(mac: str) -> int:
+        """Parse a MAC address in any common notation into a 48-bit integer"""
+        digits = "".join(c for c in mac if c in "0123456789abcdefABCDEF")
+        if len(digits) != 12:
+            raise ValueError("Invalid MAC address: {}".format(mac))
+        return int(digits, 16)
+
+    def lookup(self, mac: str) -> str:
+        """Return the vendor for a MAC address, or "Unknown\""""
+        try:
+            value = self._mac_to_int(mac)
+        except ValueError:
+            return "Unknown"
+        for _, bits in self.SOURCES:
+            index = self.indexes[bits].get(value >> (48 - bits))
+            if index is not None:
+                return self.vendors[index]
+        return self.fallback.get(value >> 24, "Unknown")
+
+    def load(self):
+        """Load the compiled registry, recompiling it when the CSVs are newer"""
+        sources = [(os.path.join(self.data_dir, name), bits) for name, bits in self.SOURCES]
+        present = [(path, bits) for path, bits in sources if os.path.exists(path)]
+        bundled = os.path.join(self.data_dir, self.BUNDLED[0])
+        if not present and os.path.exists(bundled):
+            present = [(bundled, self.BUNDLED[1])]
+        try:
+            cache_mtime = os.path.getmtime(self.cache_path)
+        except OSError:
+            cache_mtime = None
+
+        if cache_mtime is not None and all(os.path.getmtime(p) <= cache_mtime for p, _ in present):
+            try:
+                self._load_binary()
+                return
+            except (OSError, ValueError) as e:
+                logger.warning("OUI cache unreadable, rebuilding: {}".format(str(e)))
+
+        if present:
+            self._compile(present)
+            try:
+                self._save_binary()
+            except OSError as e:
+                logger.warning("Could not write OUI cache: {}".format(str(e)))
+        else:
+            logger.warning("IEEE OUI registry not found in {}, only the {}-entry built-in vendor table is "
+                           "available; run update_oui.py to fetch it".format(self.data_dir, len(self.fallback)))
+
+    def _compile(self, sources: List[Tuple[str, int]]):
+        """Parse IEEE registry CSV exports into the in-memory indexes"""
+        names = {}
+        for path, bits in sources:
+            index = self.indexes[bits]
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, "rt", newline="", encoding="utf-8", errors="replace") as f:
+                reader = csv.reader(f)
+                next(reader, None)  # Registry,Assignment,Organization Name,Organization Address
+                for row in reader:
+                    if len(row) < 3:
+                        continue
+                    try:
+                        prefix = int(row[1].strip(), 16)
+                    except ValueError:
+                        continue
+                    name = " ".join(row[2].split()) or "Unknown"
+                    if name not in names:
+                        names[name] = len(self.vendors)
+                        self.vendors.append(name)
+                    index[prefix] = names[name]
+        logger.info("Compiled IEEE OUI registry: {} prefixes, {} vendors".format(
+            sum(len(i) for i in self.indexes.values()), len(self.vendors)))
+
+    def _save_binary(self):
+        """Write indexes as packed uint64 prefix / uint32 vendor arrays plus a name table"""
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.MAGIC)
+            names = "\n".join(self.vendors).encode("utf-8")
+            f.write(struct.pack("<I", len(names)))
+            f.write(names)
+            for _, bits in self.SOURCES:
+                index = self.indexes[bits]
+                f.write(struct.pack("<BI", bits, len(index)))
+                f.write(array("Q", index.keys()).tobytes())
+                f.write(array("I", index.values()).tobytes())
+        os.replace(tmp_path, self.cache_path)
+
+    def _load_binary(self):
+        """Load the packed registry written by _save_binary()"""
+        with open(self.cache_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(self.MAGIC):
+            raise ValueError("bad magic")
+        offset = len(self.MAGIC)
+        (names_len,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        names = data[offset:offset + names_len].decode("utf-8")
+        self.vendors = names.split("\n") if names else []
+        offset += names_len
+        for _ in self.SOURCES:
+            bits, count = struct.unpack_from("<BI", data, offset)
+            offset += 5
+            if bits not in self.indexes:
+                raise ValueError("unexpected prefix length {}".format(bits))
+            prefixes = array("Q")
+            prefixes.frombytes(data[offset:offset + count * 8])
+            offset += count * 8
+            vendor_ids = array("I")
+            vendor_ids.frombytes(data[offset:offset + count * 4])
+            offset += count * 4
+            if len(prefixes) != count or len(vendor_ids) != count:
+                raise ValueError("truncated OUI cache")
+            self.indexes[bits] = dict(zip(prefixes, vendor_ids))
+
+
+class PingSweeper:
+    """Concurrent ICMP sweep engine (raw sockets with ping-process fallback)"""
+
+    ICMP_ECHO_REQUEST = 8
+    ICMP_ECHO_REPLY = 0
+
+    def __init__(self, concurrency: int = 256, deadline: float = 1.0):
+        self.concurrency = max(1, concurrency)
+        self.deadline = deadline
+        self.identifier = os.getpid() & 0xFFFF
+
+    def sweep(self, targets: List[str], concurrency: Optional[int] = None) -> List[str]:
+        """Return the targets that answered an ICMP echo, in input order"""
+        targets = list(OrderedDict.fromkeys(targets))
+        if not targets:
+            return []
+
+        limit = max(1, concurrency or self.concurrency)
+        alive = None
+        sock, raw = self._open_socket()
+        if sock is not None:
+            try:
+                alive = self._sweep_socket(sock, raw, targets, limit)
+            except OSError as e:
+                logger.warning("ICMP socket sweep failed, falling back to ping: {}".format(str(e)))
+            finally:
+                sock.close()
+
+        if alive is None:
+            alive = asyncio.run(self._sweep_processes(targets, limit))
+
+        return [ip for ip in targets if ip in alive]
+
+    def _open_socket(self) -> Tuple[Any, bool]:
+        """Open a raw ICMP socket, or an unprivileged ICMP datagram socket where supported"""
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+        except (OSError, AttributeError):
+            pass
+        if platform.system() != "Windows":
+            try:
+                return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+            except (OSError, AttributeError):
+                pass
+        return None, False
+
+    @staticmethod
+    def _checksum(data: bytes) -> int:
+        """Internet checksum (RFC 1071)"""
+        if len(data) % 2:
+            data += b"\x00"
+        total = sum(struct.unpack("!{}H".format(len(data) // 2), data))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+
+    def _build_echo(self, sequence: int) -> bytes:
+        """Build an ICMP echo request packet"""
+        payload = b"CyberShield"
+        header = struct.pack("!BBHHH", self.ICMP_ECHO_REQUEST, 0, 0, self.identifier, sequence)
+        checksum = self._checksum(header + payload)
+        return struct.pack("!BBHHH", self.ICMP_ECHO_REQUEST, 0, checksum, self.identifier, sequence) + payload
+
+    def _sweep_socket(self, sock: socket.socket, raw: bool, targets: List[str], concurrency: int) -> set:
+        """Send echo requests with at most `concurrency` probes in flight"""
+        sock.setblocking(False)
+        queue = deque(targets)
+        # Probes are sent in deadline order, so the oldest entry always expires first
+        pending = OrderedDict()
+        alive = set()
+        sequence = 0
+
+        while queue or pending:
+            now = time.monotonic()
+            blocked = False
+            while queue and len(pending) < concurrency:
+                ip = queue.popleft()
+                sequence = (sequence + 1) & 0xFFFF
+                try:
+                    sock.sendto(self._build_echo(sequence), (ip, 0))
+                except BlockingIOError:
+                    # Send buffer is full: wait below until it drains instead of retrying at once
+                    queue.appendleft(ip)
+                    blocked = True
+                    break
+                except OSError:
+                    continue
+                pending[ip] = now + self.deadline
+
+            while pending:
+                ip, expires = next(iter(pending.items()))
+                if expires > now:
+                    break
+                pending.popitem(last=False)
+
+            if not pending:
+                if blocked:
+                    select.select([], [sock], [], self.deadline)
+                continue
+
+            wait = max(0.0, next(iter(pending.values())) - now)
+            readable, _, _ = select.select([sock], [sock] if blocked else [], [], wait)
+            if not readable:
+                continue
+
+            while True:
+                try:
+                    data, addr = sock.recvfrom(1024)
+                except (BlockingIOError, InterruptedError):
+                    break
+                icmp = data[(data[0] & 0x0F) * 4:] if raw else data
+                if len(icmp) < 8 or icmp[0] != self.ICMP_ECHO_REPLY:
+                    continue
+                # The kernel rewrites the identifier on datagram ICMP sockets
+                if raw and struct.unpack("!H", icmp[4:6])[0] != self.identifier:
+                    continue
+                if pending.pop(addr[0], None) is not None:
+                    alive.add(addr[0])
+
+        return alive
+
+    def _ping_command(self, ip: str) -> List[str]:
+        """Build a single-echo ping command for the current platform"""
+        system = platform.system()
+        if system == "Windows":
+            return ["ping", "-n", "1", "-w", str(int(self.deadline * 1000)), ip]
+        if system == "Darwin":
+            return ["ping", "-c", "1", "-W", str(int(self.deadline * 1000)), ip]
+        return ["ping", "-c", "1", "-W", str(max(1, int(round(self.deadline)))), ip]
+
+    async def _sweep_processes(self, targets: List[str], concurrency: int) -> set:
+        """Fallback sweep using a bounded pool of ping processes"""
+        semaphore = asyncio.Semaphore(concurrency)
+        alive = set()
+
+        async def probe(ip: str):
+            async with semaphore:
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        *self._ping_command(ip),
+                        stdout=asyncio.subprocess.DEVNULL,
+                        stderr=asyncio.subprocess.DEVNULL
+                    )
+                except OSError:
+                    return
+                try:
+                    if await asyncio.wait_for(proc.wait(), self.deadline + 1) == 0:
+                        alive.add(ip)
+                except asyncio.TimeoutError:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+                    await proc.wait()
+
+        await asyncio.gather(*(probe(ip) for ip in targets))
+        return alive
+
+
+class ScanRangePlanner:
+    """Turns configured CIDRs and interface networks into non-overlapping scan work units
+
+    Interface networks use their real netmask and are swept by ARP on that
+    interface; configured ranges not attached to any interface are routed and
+    get ICMP. Overlaps are merged, so every address is probed at most once,
+    and large networks are split into /`unit_prefix` units. Interface networks
+    wider than /`max_prefix` are narrowed to the /`max_prefix` around the
+    agent's address so a /8 on a VPN adapter does not turn into 16M probes.
+    """
+
+    def __init__(self, ranges: Optional[List[str]] = None, unit_prefix: int = 24, max_prefix: int = 20,
+                 max_configured_prefix: int = 16):
+        self.unit_prefix = unit_prefix
+        self.max_prefix = max_prefix
+        self.ranges = []
+        for cidr in ranges or []:
+            try:
+                network = ipaddress.ip_network(cidr.strip(), strict=False)
+            except ValueError:
+                logger.warning("Ignoring invalid scan range: {}".format(cidr))
+                continue
+            if network.version != 4 or network.prefixlen < max_configured_prefix:
+                logger.warning("Ignoring scan range {}: only IPv4 ranges up to /{} are scanned".format(
+                    cidr, max_configured_prefix))
+                continue
+            self.ranges.append(network)
+
+    def interface_networks(self, interfaces: Optional[Dict[str, list]] = None) -> List[Tuple[str, Any, Any]]:
+        """(interface, network to scan, real network) for every usable IPv4 interface address"""
+        if interfaces is None:
+            interfaces = psutil.net_if_addrs()
+        networks = []
+        for iface_name, iface_addrs in interfaces.items():
+            for addr in iface_addrs:
+                if addr.family != socket.AF_INET or not addr.netmask:
+                    continue
+                if addr.address.startswith('127.') or addr.address.startswith('169.254.'):
+                    continue
+                try:
+                    network = ipaddress.ip_interface("{}/{}".format(addr.address, addr.netmask)).network
+                except ValueError:
+                    continue
+                if network.prefixlen >= 31:
+                    continue  # point-to-point link, nothing to discover
+                scanned = network
+                if network.prefixlen < self.max_prefix:
+                    scanned = ipaddress.ip_network("{}/{}".format(addr.address, self.max_prefix), strict=False)
+                    logger.info("Interface {} network {} is wider than /{}, scanning {}".format(
+                        iface_name, network, self.max_prefix, scanned))
+                networks.append((iface_name, scanned, network))
+        return networks
+
+    def plan(self, interfaces: Optional[Dict[str, list]] = None
+             ) -> Tuple[List[Tuple[str, str, List[str]]], List[Tuple[None, str, List[str]]]]:
+        """Return (arp_units, icmp_units); each unit is (interface or None, cidr, host ips)"""
+        iface_networks = self.interface_networks(interfaces)
+        # Network and broadcast addresses of interface networks are never probed, even when
+        # they fall inside a unit split out of a wider network. A configured range's own
+        # bounds are only skipped where it is still routed: inside an interface network
+        # they are ordinary hosts (a /24 inside a /20 keeps its .0 and .255)
+        configured = list(ipaddress.collapse_addresses(self.ranges))
+        reserved = set()
+        for _, _, network in iface_networks:
+            reserved.update((int(network.network_address), int(network.broadcast_address)))
+        scanned = [n for _, n, _ in iface_networks]
+        for network in configured:
+            if network.prefixlen >= 31:
+                continue
+            for address in (network.network_address, network.broadcast_address):
+                if not any(address in n for n in scanned):
+                    reserved.add(int(address))
+
+        covered = []
+        arp_units = []
+        for iface_name, network, _ in iface_networks:
+            for piece in self._subtract([network], covered):
+                arp_units.extend((iface_name, unit, self._hosts(unit, reserved)) for unit in self._split(piece))
+            covered = list(ipaddress.collapse_addresses(covered + [network]))
+
+        icmp_units = []
+        routed = self._subtract(configured, covered)
+        for piece in ipaddress.collapse_addresses(routed):
+            icmp_units.extend((None, unit, self._hosts(unit, reserved)) for unit in self._split(piece))
+        return ([(i, str(u), h) for i, u, h in arp_units if h],
+                [(i, str(u), h) for i, u, h in icmp_units if h])
+
+    @staticmethod
+    def _subtract(networks: list, covered: list) -> list:
+        """Parts of `networks` outside every network in `covered`"""
+        pieces = list(networks)
+        for hole in covered:
+            remaining = []
+            for piece in pieces:
+                if piece.subnet_of(hole):
+                    continue
+                if hole.subnet_of(piece):
+                    remaining.extend(piece.address_exclude(hole))
+                else:
+                    remaining.append(piece)
+            pieces = remaining
+        return pieces
+
+    def _split(self, network) -> list:
+        """Work units of at most /unit_prefix"""
+        if network.prefixlen >= self.unit_prefix:
+            return [network]
+        return list(network.subnets(new_prefix=self.unit_prefix))
+
+    @staticmethod
+    def _hosts(unit, reserved: set) -> List[str]:
+        first = int(unit.network_address)
+        return [str(ipaddress.IPv4Address(a)) for a in range(first, first + unit.num_addresses)
+                if a not in reserved]
+
+
+class ArpSweeper:
+    """Batched ARP engine sharing one receive window across all interfaces"""
+
+    def __init__(self, timeout: float = 5, retries: int = 1):
+        self.timeout = timeout
+        self.retries = retries
+
+    def sweep(self, units: List[Tuple[str, str, List[str]]], inter: float = 0.0) -> List[Tuple[str, str]]:
+        """ARP-sweep (interface, cidr, host ips) work units and return (ip, mac) replies"""
+        by_iface = OrderedDict()
+        for iface_name, cidr, hosts in units:
+            by_iface.setdefault(iface_name, []).append((cidr, hosts))
+        if not by_iface:
+            return []
+
+        # Every interface transmits and listens at the same time, so the whole
+        # sweep costs one timeout window (plus retries) however many NICs exist
+        with ThreadPoolExecutor(max_workers=len(by_iface)) as executor:
+            batches = list(executor.map(lambda item: self._sweep_iface(item[0], item[1], inter),
+                                        by_iface.items()))
+
+        replies = []
+        for batch in batches:
+            replies.extend(batch)
+        return replies
+
+    def _sweep_iface(self, iface_name: str, units: List[Tuple[str, List[str]]], inter: float) -> List[Tuple[str, str]]:
+        """Send requests for every host of every unit on one interface"""
+        targets = []
+        for _, hosts in units:
+            targets.extend(hosts)
+        if not targets:
+            return []
+
+        logger.info("ARP scanning {} on {}".format(", ".join(cidr for cidr, _ in units), iface_name))
+        # One packet per host lets srp() re-send only to hosts that stayed silent
+        packets = [Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=ip) for ip in targets]
+        try:
+            # Send on the interface the units were planned for, not the one routing picks
+            answered, _ = srp(packets, timeout=self.timeout, retry=self.retries, inter=inter,
+                              iface=iface_name, verbose=False)
+        except Exception as e:
+            logger.warning("ARP scan error for {}: {}".format(iface_name, str(e)))
+            return []
+        return [(received.psrc, received.hwsrc) for sent, received in answered]
+
+
+class ReverseDNSResolver:
+    """Concurrent reverse-DNS lookups with a TTL cache shared across scans"""
+
+    def __init__(self, workers: int = 32, positive_ttl: float = 3600, negative_ttl: float = 300,
+                 max_entries: int = 65536):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rdns")
+        self._cache = {}  # ip -> (hostname or None, expires_at)
+        self._waiters = {}  # ip -> callbacks waiting for an in-flight lookup
+        self._lock = threading.Lock()
+
+    def cached(self, ip: str) -> Optional[str]:
+        """Return a cached hostname, "Unknown" for a cached miss, or None if not cached"""
+        with self._lock:
+            entry = self._cache.get(ip)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0] or "Unknown"
+
+    def resolve(self, ip: str, callback: Callable[[str, str], None]):
+        """Look up ip in the background and call callback(ip, hostname) when done"""
+        hostname = self.cached(ip)
+        if hostname is not None:
+            callback(ip, hostname)
+            return
+
+        with self._lock:
+            if ip in self._waiters:
+                self._waiters[ip].append(callback)
+                return
+            self._waiters[ip] = [callback]
+        self._executor.submit(self._lookup, ip)
+
+    def _lookup(self, ip: str):
+        """Worker: perform the blocking lookup and notify waiters"""
+        try:
+            hostname = socket.gethostbyaddr(ip)[0].split(".")[0] or None
+        except Exception:
+            hostname = None
+
+        ttl = self.positive_ttl if hostname else self.negative_ttl
+        with self._lock:
+            if len(self._cache) >= self.max_entries:
+                self._prune()
+            self._cache[ip] = (hostname, time.monotonic() + ttl)
+            callbacks = self._waiters.pop(ip, [])
+
+        for callback in callbacks:
+            try:
+                callback(ip, hostname or "Unknown")
+            except Exception as e:
+                logger.warning("Reverse DNS callback error for {}: {}".format(ip, str(e)))
+
+    def _prune(self):
+        """Drop expired entries, then the oldest ones if still over capacity (lock held)"""
+        now = time.monotonic()
+        for ip in [ip for ip, (_, expires) in self._cache.items() if expires < now]:
+            del self._cache[ip]
+        while len(self._cache) >= self.max_entries:
+            del self._cache[next(iter(self._cache))]
+
+
+class DeviceInventory:
+    """Device inventory keyed by MAC (or IP when the MAC is unknown) with change versions"""
+
+    # Fields whose change is published to delta consumers; lastSeen refreshes are not
+    TRACKED_FIELDS = ("ip", "mac", "hostname", "vendor", "type", "status")
+    DEFAULTS = {"mac": "Unknown", "hostname": "Unknown", "vendor": "Unknown", "type": "Workstation"}
+
+    def __init__(self, max_tombstones: int = 4096):
+        self.version = 0
+        self._records = {}  # key -> device record
+        self._ip_index = {}  # ip -> key
+        self._tombstones = deque(maxlen=max_tombstones)  # (version, key)
+        self._lock = threading.RLock()
+        self.listeners = []  # called with a copy of each changed record
+        self.seen_listeners = []  # called with a copy of records whose lastSeen alone was refreshed
+
+    @staticmethod
+    def key_for(ip: str, mac: str) -> str:
+        """Inventory key: the MAC when known, otherwise the IP"""
+        if mac and mac != "Unknown":
+            return mac.upper()
+        return "ip:{}".format(ip)
+
+    def observe(self, device: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge a scan observation and return the live inventory record"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            key = self.key_for(device["ip"], device.get("mac"))
+            record = self._records.get(key)
+
+            # An observation without a MAC belongs to whatever record owns the IP
+            if record is None and key.startswith("ip:") and device["ip"] in self._ip_index:
+                key = self._ip_index[device["ip"]]
+                record = self._records[key]
+
+            # A host first seen by ICMP gets re-keyed once ARP reveals its MAC
+            if record is None:
+                old_key = self._ip_index.get(device["ip"])
+                if old_key is not None and old_key.startswith("ip:") and old_key != key:
+                    record = self._records.pop(old_key)
+                    self._tombstones.append((self._bump(), old_key))
+                    self._notify({"id": old_key, "removed": True, "version": self.version})
+                    record["id"] = key
+                    self._records[key] = record
+
+            if record is None:
+                record = dict(self.DEFAULTS, **device)
+                record.update(id=key, firstSeen=now, lastSeen=now, status="Online")
+                self._records[key] = record
+                self._claim_ip(device["ip"], key)
+                record["version"] = self._bump()
+                self._notify(record)
+                return record
+
+            changed = False
+            for field in self.TRACKED_FIELDS:
+                value = device.get(field)
+                if value is None or value == "Unknown" or field == "status":
+                    continue
+                if record.get(field) != value:
+                    if field == "ip" and self._ip_index.get(record.get("ip")) == key:
+                        del self._ip_index[record["ip"]]
+                    record[field] = value
+                    changed = True
+            if record.get("status") != "Online":
+                record["status"] = "Online"
+                changed = True
+            self._claim_ip(record["ip"], key)
+            record["lastSeen"] = now
+            if changed:
+                record["version"] = self._bump()
+                self._notify(record)
+            else:
+                self._notify(record, self.seen_listeners)
+            return record
+
+    def update(self, key: str, fields: Dict[str, Any]):
+        """Apply field changes to a record, bumping its version if anything changed"""
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                return
+            changed = {k: v for k, v in fields.items() if record.get(k) != v}
+            if changed:
+                record.update(changed)
+                record["version"] = self._bump()
+                self._notify(record)
+
+    def mark_missing(self, seen_keys: set):
+        """After a full sweep, flag every record that was not seen as Offline"""
+        with self._lock:
+            for key, record in self._records.items():
+                if key not in seen_keys and record.get("status") != "Offline":
+                    record["status"] = "Offline"
+                    record["version"] = self._bump()
+                    self._notify(record)
+
+    def load(self, records: List[Dict[str, Any]]):
+        """Restore persisted records at startup"""
+        with self._lock:
+            for record in records:
+                record = dict(record, version=self._bump())
+                self._records[record["id"]] = record
+                if record.get("ip", "Unknown") != "Unknown":
+                    self._ip_index[record["ip"]] = record["id"]
+
+    def known_ips(self) -> List[str]:
+        """IPs of every device in the inventory"""
+        with self._lock:
+            return list(self._ip_index.keys())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the live record for an inventory key, if any"""
+        with self._lock:
+            return self._records.get(key)
+
+    def get_by_ip(self, ip: str) -> Optional[Dict[str, Any]]:
+        """Return the live record for an IP, if any"""
+        with self._lock:
+            key = self._ip_index.get(ip)
+            return self._records.get(key) if key else None
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Copies of all records"""
+        with self._lock:
+            return [dict(record) for record in self._records.values()]
+
+    def copy_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copies of live records, taken while no observation can change them"""
+        with self._lock:
+            return [dict(record) for record in records]
+
+    def changes_since(self, version: int) -> Dict[str, Any]:
+        """Records changed and keys removed after `version`"""
+        with self._lock:
+            oldest = self._tombstones[0][0] if len(self._tombstones) == self._tombstones.maxlen else 0
+            if version < oldest:
+                # Tombstones were evicted - the caller must resync from a full listing
+                return {"version": self.version, "full": True, "changes": self.snapshot(), "removed": []}
+            return {
+                "version": self.version,
+                "full": False,
+                "changes": [dict(r) for r in self._records.values() if r["version"] > version],
+                "removed": [key for v, key in self._tombstones if v > version]
+            }
+
+    def _claim_ip(self, ip: str, key: str):
+        """Index `ip` under `key`; a device that held it before loses it (lock held)"""
+        owner = self._ip_index.get(ip)
+        if owner is not None and owner != key:
+            previous = self._records.get(owner)
+            # A different MAC answers for this IP now, so the old record no longer has an address
+            if previous is not None and previous.get("ip") == ip:
+                previous["ip"] = "Unknown"
+                previous["version"] = self._bump()
+                self._notify(previous)
+        self._ip_index[ip] = key
+
+    def _bump(self) -> int:
+        """Advance the inventory version (lock held)"""
+        self.version += 1
+        return self.version
+
+    def _notify(self, record: Dict[str, Any], listeners: Optional[List[Callable]] = None):
+        """Tell listeners about a changed record (lock held; listeners must not block)"""
+        for listener in self.listeners if listeners is None else listeners:
+            try:
+                listener(dict(record))
+            except Exception as e:
+                logger.warning("Inventory listener error: {}".format(str(e)))
+
+
+class ScanResultSet:
+    """Devices found by one scan, keyed by inventory id with IP and MAC indexes
+
+    ARP, ICMP and passive observations of the same host merge in constant
+    time: adding a record replaces an earlier one for the same host, such as
+    an ICMP-only `ip:` record that ARP has since re-keyed by MAC.
+    """
+
+    def __init__(self):
+        self._records = {}  # id -> live inventory record, in discovery order
+        self._indexed = {}  # id -> (ip, mac) it is indexed under; records can change in place
+        self._by_ip = {}
+        self._by_mac = {}
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """Add or refresh a record; True if the host was not in the set yet"""
+        key = record["id"]
+        ip = record["ip"]
+        mac = record.get("mac", "Unknown")
+        mac = mac.upper() if mac != "Unknown" else None
+        known = key in self._records
+        if known:
+            self._unindex(key)
+        # The same host under another id: a MAC-less record for this IP, or this MAC
+        replaced = False
+        ip_owner = self._by_ip.get(ip)
+        for old_key in (ip_owner if ip_owner is not None and ip_owner.startswith("ip:") else None,
+                        self._by_mac.get(mac) if mac is not None else None):
+            if old_key is not None and old_key != key and old_key in self._records:
+                self._unindex(old_key)
+                del self._records[old_key]
+                replaced = True
+        self._records[key] = record
+        self._indexed[key] = (ip, mac)
+        self._by_ip[ip] = key
+        if mac is not None:
+            self._by_mac[mac] = key
+        return not known and not replaced
+
+    def _unindex(self, key: str):
+        ip, mac = self._indexed.pop(key)
+        if self._by_ip.get(ip) == key:
+            del self._by_ip[ip]
+        if mac is not None and self._by_mac.get(mac) == key:
+            del self._by_mac[mac]
+
+    def get_by_ip(self, ip: str) -> Optional[Dict[str, Any]]:
+        key = self._by_ip.get(ip)
+        return self._records[key] if key is not None else None
+
+    def get_by_mac(self, mac: str) -> Optional[Dict[str, Any]]:
+        key = self._by_mac.get(mac.upper())
+        return self._records[key] if key is not None else None
+
+    def has_ip(self, ip: str) -> bool:
+        return ip in self._by_ip
+
+    def keys(self) -> set:
+        return set(self._records)
+
+    def records(self) -> List[Dict[str, Any]]:
+        return list(self._records.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class WifiBackend:
+    """Source of raw WiFi scan results for one platform"""
+
+    name = "none"
+
+    def available(self) -> bool:
+        return False
+
+    def scan(self, trigger: bool = True) -> List[Dict[str, Any]]:
+        """Networks as dicts with ssid, bssid, signal (dBm), channel, frequency, security
+
+        trigger=False returns the driver's cached results without a new hardware scan.
+        """
+        return []
+
+    @staticmethod
+    def channel_for(freq: float) -> int:
+        """802.11 channel number for a center frequency in MHz"""
+        freq = int(freq)
+        if freq == 2484:
+            return 14
+        if 2412 <= freq < 2484:
+            return (freq - 2407) // 5
+        if 5955 <= freq <= 7115:
+            return (freq - 5950) // 5
+        if 5000 <= freq < 5955:
+            return (freq - 5000) // 5
+        return 0
+
+    @staticmethod
+    def frequency_for(channel: int, band: str = "") -> int:
+        """Center frequency in MHz for a channel (band disambiguates 6 GHz channels)"""
+        if band.startswith("6"):
+            return 5950 + channel * 5
+        if channel == 14:
+            return 2484
+        if 1 <= channel <= 13:
+            return 2407 + channel * 5
+        if 32 <= channel <= 177:
+            return 5000 + channel * 5
+        return 0
+
+
+class IwWifiBackend(WifiBackend):
+    """Linux nl80211 scans through `iw dev <iface> scan`"""
+
+    name = "iw"
+
+    def __init__(self, interface: Optional[str] = None):
+        self.interface = interface
+
+    def available(self) -> bool:
+        return platform.system() == "Linux" and shutil.which("iw") is not None and bool(self.interfaces())
+
+    def interfaces(self) -> List[str]:
+        """Wireless interfaces (the configured one, or every interface with a wireless dir)"""
+        if self.interface:
+            return [self.interface]
+        try:
+            return sorted(name for name in os.listdir("/sys/class/net")
+                          if os.path.isdir(os.path.join("/sys/class/net", name, "wireless")))
+        except OSError:
+            return []
+
+    def scan(self, trigger: bool = True) -> List[Dict[str, Any]]:
+        networks = []
+        for interface in self.interfaces():
+            output = None
+            if trigger:
+                # A triggered scan needs CAP_NET_ADMIN; fall back to the kernel's cached dump
+                result = subprocess.run(["iw", "dev", interface, "scan"], capture_output=True,
+                                        timeout=20, errors="replace")
+                if result.returncode == 0:
+                    output = result.stdout
+                else:
+                    logger.debug("iw scan on {} failed: {}".format(interface, result.stderr.strip()[:100]))
+            if output is None:
+                result = subprocess.run(["iw", "dev", interface, "scan", "dump"], capture_output=True,
+                                        timeout=10, errors="replace")
+                output = result.stdout if result.returncode == 0 else ""
+            networks.extend(self.parse(output))
+        return networks
+
+    @staticmethod
+    def _decode_ssid(raw: str) -> str:
+        """iw prints non-printable SSID bytes as \\xNN escapes"""
+        if "\\x" not in raw:
+            return raw
+        data = bytearray()
+        i = 0
+        while i < len(raw):
+            if raw.startswith("\\x", i) and i + 4 <= len(raw):
+                try:
+                    data.append(int(raw[i + 2:i + 4], 16))
+                    i += 4
+                    continue
+                except ValueError:
+                    pass
+            data.extend(raw[i].encode("utf-8"))
+            i += 1
+        return data.decode("utf-8", errors="replace")
+
+    @classmethod
+    def parse(cls, text: str) -> List[Dict[str, Any]]:
+        """Parse `iw dev <iface> scan [dump]` output into network dicts"""
+        networks = []
+        bss = None
+        section = None  # "RSN" / "WPA" while inside their indented blocks
+
+        def finish(bss):
+            if bss["channel"] == 0 and bss["frequency"]:
+                bss["channel"] = cls.channel_for(bss["frequency"])
+            bss["security"] = cls._security(bss.pop("_privacy"), bss.pop("_rsn"), bss.pop("_wpa"))
+            networks.append(bss)
+
+        for line in text.splitlines():
+            if line.startswith("BSS "):
+                if bss is not None:
+                    finish(bss)
+                bss = {"ssid": "", "bssid": line[4:21].upper(), "signal": -100, "channel": 0,
+                       "frequency": 0, "_privacy": False, "_rsn": None, "_wpa": None}
+                section = None
+                continue
+            if bss is None:
+                continue
+            stripped = line.strip()
+            if line.startswith("\t\t") and section is not None:
+                # Nested RSN/WPA attributes: only the authentication suites matter here
+                if stripped.startswith("* Authentication suites:"):
+                    bss[section] = stripped.split(":", 1)[1].split()
+                continue
+            section = None
+            if stripped.startswith("SSID: "):
+                # Hidden networks broadcast an empty or all-NUL SSID
+                bss["ssid"] = cls._decode_ssid(stripped[6:]).strip("\x00")
+            elif stripped.startswith("signal:"):
+                bss["signal"] = round(float(stripped.split()[1]))
+            elif stripped.startswith("freq:"):
+                bss["frequency"] = round(float(stripped.split()[1]))
+            elif stripped.startswith("DS Parameter set: channel"):
+                bss["channel"] = int(stripped.rsplit(" ", 1)[1])
+            elif stripped.startswith("* primary channel:") and bss["channel"] == 0:
+                bss["channel"] = int(stripped.rsplit(" ", 1)[1])
+            elif stripped.startswith("capability:"):
+                bss["_privacy"] = " Privacy" in stripped
+            elif stripped.startswith("RSN:"):
+                section = "_rsn"
+                bss["_rsn"] = bss["_rsn"] or []
+                if "Authentication suites:" in stripped:
+                    bss["_rsn"] = stripped.split("Authentication suites:", 1)[1].split()
+            elif stripped.startswith("WPA:"):
+                section = "_wpa"
+                bss["_wpa"] = bss["_wpa"] or []
+                if "Authentication suites:" in stripped:
+                    bss["_wpa"] = stripped.split("Authentication suites:", 1)[1].split()
+        if bss is not None:
+            finish(bss)
+        return networks
+
+    @staticmethod
+    def _security(privacy: bool, rsn: Optional[List[str]], wpa: Optional[List[str]]) -> str:
+        """Security label from the capability bit and RSN/WPA authentication suites"""
+        if rsn is not None:
+            enterprise = "802.1X" in rsn or "IEEE" in rsn
+            if "SAE" in rsn or "FT/SAE" in rsn:
+                if "PSK" in rsn:
+                    return "WPA2/WPA3-Personal"
+                return "WPA3-SAE"
+            if "OWE" in rsn:
+                return "OWE"
+            if enterprise:
+                return "WPA3-Enterprise" if "802.1X/SUITE-B-192" in rsn else "WPA2-Enterprise"
+            return "WPA2-PSK"
+        if wpa is not None:
+            return "WPA-Enterprise" if "IEEE" in wpa or "802.1X" in wpa else "WPA-PSK"
+        return "WEP" if privacy else "None"
+
+
+class NetshWifiBackend(WifiBackend):
+    """Windows scans through `netsh wlan show networks mode=bssid`"""
+
+    name = "netsh"
+
+    # netsh labels are localized; English and Russian Windows are covered
+    KEYS = {
+        "authentication": "auth", "проверка подлинности": "auth",
+        "encryption": "cipher", "шифрование": "cipher",
+        "signal": "signal", "сигнал": "signal",
+        "channel": "channel", "канал": "channel",
+        "band": "band", "диапазон": "band",
+    }
+
+    def available(self) -> bool:
+        return platform.system() == "Windows"
+
+    def scan(self, trigger: bool = True) -> List[Dict[str, Any]]:
+        # netsh always reports the list Windows keeps refreshed in the background
+        result = subprocess.run(["netsh", "wlan", "show", "networks", "mode=bssid"],
+                                capture_output=True, timeout=10, errors="replace", encoding="cp1251")
+        return self.parse(result.stdout) if result.returncode == 0 else []
+
+    @classmethod
+    def parse(cls, text: str) -> List[Dict[str, Any]]:
+        """Parse `netsh wlan show networks mode=bssid` output, one dict per BSSID"""
+        networks = []
+        ssid, auth, cipher, band = "", "", "", ""
+        bss = None
+        for line in text.splitlines():
+            if ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            key = key.strip()
+            value = value.strip()
+            if key.startswith("SSID"):
+                ssid, auth, cipher, bss = value, "", "", None
+            elif key.startswith("BSSID"):
+                bss = {"ssid": ssid, "bssid": value.upper(), "signal": -100, "channel": 0, "frequency": 0,
+                       "security": cls._security(auth, cipher)}
+                networks.append(bss)
+                band = ""
+            else:
+                field = cls.KEYS.get(key.lower())
+                if field == "auth":
+                    auth = value
+                elif field == "cipher":
+                    cipher = value
+                elif bss is not None and field == "signal":
+                    # netsh reports quality in percent; map 0..100% onto -100..-50 dBm
+                    bss["signal"] = int(value.rstrip("%").strip() or 0) // 2 - 100
+                elif field == "band":
+                    band = value
+                elif bss is not None and field == "channel" and value.isdigit():
+                    bss["channel"] = int(value)
+                    bss["frequency"] = cls.frequency_for(bss["channel"], band)
+        return networks
+
+    @staticmethod
+    def _security(auth: str, cipher: str) -> str:
+        auth_lower = auth.lower()
+        if auth_lower in ("open", "открыть", "открытая"):
+            return "WEP" if cipher.upper() == "WEP" else "None"
+        if "wpa3-personal" in auth_lower:
+            return "WPA3-SAE"  # same label as the iw backend
+        return auth.replace("-Personal", "-PSK") if "wpa2-personal" in auth_lower else auth
+
+
+class RogueApDetector:
+    """Flags rogue access points and evil twins from accumulated WiFi observations
+
+    Profiles are indexed by BSSID and by SSID (SSID -> its BSSIDs and the
+    strongest security seen for it), so checking a new observation is a few
+    dict lookups no matter how much history has been collected.
+    """
+
+    SECURITY_RANKS = (("wpa3", 4), ("wpa2", 3), ("owe", 3), ("enterprise", 3), ("wpa", 2), ("wep", 1))
+
+    def __init__(self, school_ssids: Optional[List[str]] = None, school_bssids: Optional[List[str]] = None,
+                 learning_period: float = 86400.0, rssi_jump: float = 25.0, max_profiles: int = 10000):
+        self.school_ssids = set(school_ssids or [])
+        self.school_bssids = {b.upper() for b in (school_bssids or [])}
+        self.learning_period = learning_period
+        self.rssi_jump = rssi_jump
+        self.max_profiles = max_profiles
+        self._bssids = OrderedDict()  # bssid -> profile, least recently seen first
+        self._ssids = {}  # ssid -> {"firstSeen", "bestRank", "bssids": set}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def security_rank(cls, security: str) -> int:
+        """Rough strength order of a security label (0 = open)"""
+        security = (security or "").lower()
+        if security in ("", "none", "open"):
+            return 0
+        for marker, rank in cls.SECURITY_RANKS:
+            if marker in security:
+                return rank
+        return 2
+
+    def observe(self, network: Dict[str, Any], now: Optional[float] = None) -> List[str]:
+        """Record one scan observation; returns the reasons the BSSID looks rogue"""
+        now = time.time() if now is None else now
+        ssid, bssid = network["ssid"], network["bssid"]
+        rank = self.security_rank(network.get("security"))
+        with self._lock:
+            group = self._ssids.get(ssid) if ssid else None
+            if ssid and group is None:
+                group = self._ssids[ssid] = {"firstSeen": now, "bestRank": rank, "bssids": set()}
+
+            profile = self._bssids.get(bssid)
+            if profile is None:
+                profile = {"ssid": ssid, "firstSeen": now, "rank": rank, "channel": network.get("channel"),
+                           "rssi": float(network.get("signal", -100)), "samples": 0, "reasons": set()}
+                self._bssids[bssid] = profile
+                if group is not None:
+                    self._check_new_bssid(ssid, bssid, rank, group, profile, now)
+                while len(self._bssids) > self.max_profiles:
+                    old_bssid, old = self._bssids.popitem(last=False)
+                    old_group = self._ssids.get(old["ssid"])
+                    if old_group is not None:
+                        old_group["bssids"].discard(old_bssid)
+                        if not old_group["bssids"]:
+                            del self._ssids[old["ssid"]]
+            else:
+                self._bssids.move_to_end(bssid)
+                self._check_known_bssid(network, rank, profile)
+                if ssid and profile["ssid"] != ssid:
+                    profile["reasons"].add("BSSID now broadcasts a different SSID ({} -> {})".format(
+                        profile["ssid"] or "<hidden>", ssid))
+                    profile["ssid"] = ssid
+
+            if group is not None:
+                group["bssids"].add(bssid)
+                group["bestRank"] = max(group["bestRank"], rank)
+            profile["lastSeen"] = now
+            return sorted(profile["reasons"])
+
+    def _check_new_bssid(self, ssid: str, bssid: str, rank: int, group: Dict[str, Any],
+                         profile: Dict[str, Any], now: float):
+        """First sighting of a BSSID (lock held)"""
+        if group["bssids"] and rank < group["bestRank"]:
+            profile["reasons"].add("Same SSID as a known network but with weaker security")
+        if ssid in self.school_ssids:
+            if self.school_bssids:
+                if bssid not in self.school_bssids:
+                    profile["reasons"].add("School SSID from a BSSID that is not on the allow list")
+            elif now - group["firstSeen"] > self.learning_period:
+                profile["reasons"].add("New BSSID copying a school SSID")
+
+    def _check_known_bssid(self, network: Dict[str, Any], rank: int, profile: Dict[str, Any]):
+        """Compare a repeat sighting with the BSSID's history (lock held)"""
+        if rank < profile["rank"]:
+            profile["reasons"].add("Security downgraded since first seen")
+        signal = float(network.get("signal", -100))
+        # Smoothed RSSI; a sudden jump suggests a second transmitter cloning the BSSID
+        if profile["samples"] >= 3 and abs(signal - profile["rssi"]) >= self.rssi_jump:
+            profile["reasons"].add("Sudden signal jump ({:.0f} -> {:.0f} dBm)".format(profile["rssi"], signal))
+        profile["rssi"] += (signal - profile["rssi"]) * 0.3
+        profile["samples"] += 1
+
+    def known_bssids(self, ssid: str) -> List[str]:
+        with self._lock:
+            group = self._ssids.get(ssid)
+            return sorted(group["bssids"]) if group else []
+
+
+class ServiceProber:
+    """Bounded asyncio TCP connect scan with banner grabbing for discovered hosts
+
+    Probes are interleaved across a wave of hosts at a time, a global limit
+    caps connections in flight, a pacing limit caps new connections per
+    second on the LAN, and each host gets at most `per_host` concurrent
+    connections spaced `host_interval` apart. The probe stops scheduling new
+    work when the time budget runs out; unfinished hosts are reported so the
+    next scan can pick them up.
+    """
+
+    DEFAULT_PORTS = (21, 22, 23, 25, 53, 80, 139, 443, 445, 554, 631, 1883, 3306, 3389, 5432, 5900,
+                     8080, 9100)
+    SERVICE_NAMES = {21: "ftp", 22: "ssh", 23: "telnet", 25: "smtp", 53: "dns", 80: "http", 139: "netbios",
+                     443: "https", 445: "smb", 515: "lpd", 554: "rtsp", 631: "ipp", 1433: "mssql",
+                     1883: "mqtt", 3306: "mysql", 3389: "rdp", 5432: "postgresql", 5900: "vnc",
+                     8080: "http-alt", 8443: "https-alt", 9100: "jetdirect"}
+    # Protocols where the server talks first; HTTP needs a request to answer
+    GREETING_PORTS = {21, 22, 23, 25, 110, 143, 3306, 5900}
+    HTTP_PORTS = {80, 8080}
+
+    def __init__(self, ports: Optional[List[int]] = None, concurrency: int = 128, rate: float = 200.0,
+                 per_host: int = 2, host_interval: float = 0.05, connect_timeout: float = 1.0,
+                 banner_timeout: float = 1.5, budget: float = 120.0):
+        self.ports = list(ports or self.DEFAULT_PORTS)
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.per_host = max(1, per_host)
+        self.host_interval = host_interval
+        self.connect_timeout = connect_timeout
+        self.banner_timeout = banner_timeout
+        self.budget = budget
+
+    def probe(self, hosts: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], set]:
+        """Open services per host, and the hosts left unfinished when the budget ran out"""
+        hosts = list(OrderedDict.fromkeys(hosts))
+        if not hosts or not self.ports:
+            return {}, set()
+        return asyncio.run(self._probe_all(hosts))
+
+    async def _probe_all(self, hosts: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], set]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.budget
+        # Hosts go in waves so a budget cut leaves whole hosts finished; inside a wave
+        # port-major order spreads consecutive connects over different hosts
+        wave = max(64, self.concurrency * 2)
+        queue = deque((ip, port) for start in range(0, len(hosts), wave)
+                      for port in self.ports for ip in hosts[start:start + wave])
+        host_slots = {ip: asyncio.Semaphore(self.per_host) for ip in hosts}
+        host_next = dict.fromkeys(hosts, 0.0)
+        pacing = {"next": loop.time()}
+        results = {}
+
+        async def worker():
+            while queue and loop.time() < deadline:
+                ip, port = queue.popleft()
+                async with host_slots[ip]:
+                    # Global pacing first, then per-host spacing
+                    now = loop.time()
+                    slot = max(now, pacing["next"], host_next[ip])
+                    if slot >= deadline:
+                        queue.appendleft((ip, port))
+                        return
+                    pacing["next"] = max(now, pacing["next"]) + 1.0 / self.rate
+                    host_next[ip] = slot + self.host_interval
+                    if slot > now:
+                        await asyncio.sleep(slot - now)
+                    service = await self._probe_port(ip, port)
+                if service is not None:
+                    results.setdefault(ip, []).append(service)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(queue)))))
+        for services in results.values():
+            services.sort(key=lambda s: s["port"])
+        return results, {ip for ip, _ in queue}
+
+    async def _probe_port(self, ip: str, port: int) -> Optional[Dict[str, Any]]:
+        """Connect to one port; returns the service entry if it is open"""
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        banner = ""
+        try:
+            if port in self.HTTP_PORTS:
+                writer.write(b"HEAD / HTTP/1.0\r\nHost: " + ip.encode() + b"\r\n\r\n")
+                await writer.drain()
+            if port in self.GREETING_PORTS or port in self.HTTP_PORTS:
+                data = await asyncio.wait_for(reader.read(512), self.banner_timeout)
+                banner = self._banner_text(data, port)
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        return {"port": port, "service": self.SERVICE_NAMES.get(port, "tcp/{}".format(port)), "banner": banner}
+
+    @staticmethod
+    def _banner_text(data: bytes, port: int) -> str:
+        """Printable first line of a banner (the Server header for HTTP)"""
+        text = data.decode("latin-1", errors="replace")
+        if port in ServiceProber.HTTP_PORTS:
+            for line in text.split("\r\n"):
+                if line.lower().startswith("server:"):
+                    return line[7:].strip()[:120]
+            return text.split("\r\n", 1)[0][:120]
+        line = text.strip().split("\n", 1)[0] if text.strip() else ""
+        return "".join(c for c in line if c.isprintable())[:120]
+
+
+class PassiveDiscovery:
+    """Continuous ARP/DHCP/mDNS/NetBIOS listener that feeds the device inventory
+
+    Hosts announce themselves all the time (ARP, DHCP leases, mDNS and NetBIOS
+    broadcasts), so listening finds devices that were asleep during a sweep at
+    almost no cost. A BPF filter attached in the kernel drops every other
+    packet before it reaches Python; repeated announcements of an unchanged
+    host are merged into the inventory at most once per `min_interval`.
+    """
+
+    BPF_FILTER = "arp or (udp and (port 67 or port 68 or port 137 or port 138 or port 5353))"
+    # The same filter for IPv4 over Ethernet as classic BPF (code, jt, jf, k), attached directly
+    # when libpcap/tcpdump is not there to compile BPF_FILTER
+    BPF_PROGRAM = (
+        (0x28, 0, 0, 12),         # ldh [12]            ethertype
+        (0x15, 18, 0, 0x0806),    # jeq ARP             -> accept
+        (0x15, 0, 18, 0x0800),    # jeq IPv4            else reject
+        (0x30, 0, 0, 23),         # ldb [23]            IP protocol
+        (0x15, 0, 16, 17),        # jeq UDP             else reject
+        (0x28, 0, 0, 20),         # ldh [20]            flags / fragment offset
+        (0x45, 14, 0, 0x1fff),    # jset fragment       -> reject
+        (0xb1, 0, 0, 14),         # ldxb 4*([14]&0xf)   IP header length
+        (0x48, 0, 0, 14),         # ldh [x+14]          source port
+        (0x15, 10, 0, 67),
+        (0x15, 9, 0, 68),
+        (0x15, 8, 0, 137),
+        (0x15, 7, 0, 138),
+        (0x15, 6, 0, 5353),
+        (0x48, 0, 0, 16),         # ldh [x+16]          destination port
+        (0x15, 4, 0, 67),
+        (0x15, 3, 0, 68),
+        (0x15, 2, 0, 137),
+        (0x15, 1, 0, 138),
+        (0x15, 0, 1, 5353),
+        (0x06, 0, 0, 0x40000),    # accept
+        (0x06, 0, 0, 0),          # reject
+    )
+    SO_ATTACH_FILTER = 26
+    # mDNS service types that tell what kind of device is announcing them
+    MDNS_DEVICE_TYPES = {
+        "_ipp._tcp": "Printer", "_ipps._tcp": "Printer", "_printer._tcp": "Printer",
+        "_pdl-datastream._tcp": "Printer", "_scanner._tcp": "Printer",
+        "_googlecast._tcp": "IoT", "_airplay._tcp": "IoT", "_hap._tcp": "IoT", "_rtsp._tcp": "IoT",
+    }
+
+    def __init__(self, scanner: "NetworkScanner", ifaces: Optional[List[str]] = None,
+                 min_interval: float = 30.0, window: float = 900.0):
+        self.scanner = scanner
+        self.ifaces = ifaces or [conf.iface]
+        self.min_interval = min_interval
+        self.window = window
+        self.packets = 0
+        self._seen = {}  # mac or ip -> (monotonic time, observed fields, inventory key)
+        self._own_ips = set()
+        self._sniffer = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Open filtered capture sockets and start listening; False if capture is unavailable"""
+        self._own_ips = {addr.address for addrs in psutil.net_if_addrs().values()
+                         for addr in addrs if addr.family == socket.AF_INET}
+        try:
+            sockets = [self._open_socket(iface) for iface in self.ifaces]
+        except Exception as e:
+            logger.warning("Passive discovery disabled: {}".format(str(e)))
+            return False
+        self._sniffer = AsyncSniffer(opened_socket=sockets, prn=self._handle, store=False)
+        self._sniffer.start()
+        logger.info("Passive discovery listening on {}".format(", ".join(str(i) for i in self.ifaces)))
+        return True
+
+    def stop(self):
+        if self._sniffer is not None and self._sniffer.running:
+            try:
+                self._sniffer.stop()
+            except Exception as e:
+                logger.warning("Passive discovery stop error: {}".format(str(e)))
+
+    def _open_socket(self, iface: str):
+        """Capture socket with the BPF filter attached in the kernel"""
+        try:
+            compile_filter(self.BPF_FILTER, iface)
+        except Exception as e:
+            if platform.system() != "Linux":
+                raise RuntimeError("cannot compile the capture filter ({})".format(str(e)))
+            sock = conf.L2listen(iface=iface, nofilter=1)
+            program = b"".join(struct.pack("HBBI", *insn) for insn in self.BPF_PROGRAM)
+            buffer = ctypes.create_string_buffer(program)
+            sock.ins.setsockopt(socket.SOL_SOCKET, self.SO_ATTACH_FILTER,
+                                struct.pack("HL", len(self.BPF_PROGRAM), ctypes.addressof(buffer)))
+            return sock
+        return conf.L2listen(iface=iface, filter=self.BPF_FILTER)
+
+    def recent_keys(self) -> set:
+        """Inventory keys of devices heard within `window` seconds"""
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            for seen_key in [k for k, (seen_at, _, _) in self._seen.items() if seen_at < cutoff]:
+                del self._seen[seen_key]
+            return {key for _, _, key in self._seen.values()}
+
+    def _handle(self, packet):
+        """Sniffer callback: turn one announcement into an inventory observation"""
+        self.packets += 1
+        try:
+            device = self._parse(packet)
+            if device is not None:
+                self._observe(device)
+        except Exception as e:
+            logger.debug("Passive discovery packet error: {}".format(str(e)))
+
+    def _parse(self, packet) -> Optional[Dict[str, Any]]:
+        """Extract ip/mac/hostname/type from an ARP, DHCP, mDNS or NetBIOS packet"""
+        if ARP in packet:
+            arp = packet[ARP]
+            return {"ip": arp.psrc, "mac": arp.hwsrc}
+        if IP not in packet:
+            return None
+        mac = packet[Ether].src if Ether in packet else "Unknown"
+        ip = packet[IP].src
+
+        if DHCP in packet:
+            bootp = packet[BOOTP]
+            mac = ":".join("{:02x}".format(b) for b in bootp.chaddr[:6])
+            options = {opt[0]: opt[1] for opt in packet[DHCP].options if isinstance(opt, tuple) and len(opt) > 1}
+            if bootp.op == 2:
+                # Server ACK: the lease tells which address the client now holds
+                return {"ip": bootp.yiaddr, "mac": mac} if options.get("message-type") == 5 else None
+            device = {"ip": options.get("requested_addr") or bootp.ciaddr, "mac": mac}
+            if options.get("hostname"):
+                device["hostname"] = self._text(options["hostname"])
+            return device
+
+        if DNS in packet:
+            dns = packet[DNS]
+            device = {"ip": ip, "mac": mac}
+            records = [dns.an[i] for i in range(dns.ancount)] + [dns.ar[i] for i in range(dns.arcount)]
+            for rr in records:
+                name = self._text(rr.rrname).rstrip(".")
+                if rr.type == 1 and rr.rdata == ip and name.endswith(".local"):
+                    device["hostname"] = name[:-6]
+                for service, device_type in self.MDNS_DEVICE_TYPES.items():
+                    if name.endswith(service + ".local"):
+                        device["type"] = device_type
+            return device if len(device) > 2 else None
+
+        if NBNSRegistrationRequest in packet:
+            registration = packet[NBNSRegistrationRequest]
+            if registration.G:
+                return None  # group name (workgroup), not the host
+            return {"ip": registration.NB_ADDRESS, "mac": mac,
+                    "hostname": self._text(registration.QUESTION_NAME).strip()}
+        if NBTDatagram in packet:
+            datagram = packet[NBTDatagram]
+            return {"ip": datagram.SourceIP, "mac": mac, "hostname": self._text(datagram.SourceName).strip()}
+        return None
+
+    @staticmethod
+    def _text(value) -> str:
+        return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else str(value)
+
+    def _observe(self, device: Dict[str, Any]):
+        """Merge into the inventory unless the same facts were merged less than min_interval ago"""
+        ip = device["ip"]
+        if not ip or ip in ("0.0.0.0", "255.255.255.255") or ip in self._own_ips:
+            return
+        if ip.startswith("127.") or ip.startswith("169.254.") or ipaddress.ip_address(ip).is_multicast:
+            return
+        mac = device.get("mac", "Unknown")
+        if mac in ("00:00:00:00:00:00", "ff:ff:ff:ff:ff:ff"):
+            device["mac"] = mac = "Unknown"
+        seen_key = mac.upper() if mac != "Unknown" else ip
+        facts = tuple(sorted(device.items()))
+        now = time.monotonic()
+        with self._lock:
+            last = self._seen.get(seen_key)
+            if last is not None and last[1] == facts and now - last[0] < self.min_interval:
+                return
+
+        if mac != "Unknown":
+            device["vendor"] = self.scanner.get_vendor_from_mac(mac)
+            if "type" not in device and self.scanner.inventory.get_by_ip(ip) is None:
+                device["type"] = self.scanner._detect_device_type(device["vendor"])
+        record = self.scanner.inventory.observe(device)
+        if "hostname" not in device and record.get("hostname", "Unknown") == "Unknown":
+            self.scanner._resolve_hostname(record)
+        with self._lock:
+            self._seen[seen_key] = (now, facts, record["id"])
+
+
 class NetworkScanner:
     """Handles network scanning and device detection"""
 
-    def __init__(self, timeout: int = 5):
+    SEVERITY_ORDER = ("None", "Low", "Medium", "High", "Critical")
+
+    def __init__(self, timeout: int = 5, ping_concurrency: int = 256, ping_deadline: float = 1.0,
+                 arp_retries: int = 1, oui_registry: Optional[OUIRegistry] = None,
+                 analyzer: Optional["VulnerabilityAnalyzer"] = None):
         self.timeout = timeout
         self.devices = []
+        self.oui = oui_registry or OUIRegistry()
+        # Service findings come from the "deviceRules" of the vulnerability rules file
+        self.analyzer = analyzer or VulnerabilityAnalyzer()
+        self.arp = ArpSweeper(timeout=timeout, retries=arp_retries)
+        self.resolver = ReverseDNSResolver()
+        self.inventory = DeviceInventory()
+        # Incremental scans sweep unknown addresses at a fraction of the normal rate
+        self.background_ping_concurrency = max(1, ping_concurrency // 8)
+        self.background_arp_inter = 0.005
+        self.pinger = PingSweeper(concurrency=ping_concurrency, deadline=ping_deadline)
+        backends = [IwWifiBackend(os.environ.get("CYBERSHIELD_WIFI_IFACE")), NetshWifiBackend()]
+        self.wifi_backend = next((b for b in backends if b.available()), WifiBackend())
+        # Results are served from cache for wifi_cache_ttl; a hardware scan is triggered at most
+        # every wifi_trigger_interval, in between the driver's cached scan dump is read
+        self.wifi_cache_ttl = 30.0
+        self.wifi_trigger_interval = 120.0
+        self._wifi_cache = (0.0, [])
+        self._wifi_triggered_at = 0.0
+        self._wifi_lock = threading.Lock()
+        # Optional port/service discovery stage (CYBERSHIELD_SERVICE_SCAN=1)
+        self.service_prober = None
+        self.service_rescan = float(os.environ.get("CYBERSHIELD_SERVICE_RESCAN", "21600"))
+        if os.environ.get("CYBERSHIELD_SERVICE_SCAN") == "1":
+            ports = [int(p) for p in os.environ.get("CYBERSHIELD_SERVICE_PORTS", "").split(",") if p.strip()]
+            self.service_prober = ServiceProber(
+                ports=ports or None,
+                rate=float(os.environ.get("CYBERSHIELD_SERVICE_RATE", "200")),
+                budget=float(os.environ.get("CYBERSHIELD_SERVICE_BUDGET", "120")))
+        self.passive = None  # PassiveDiscovery when passive mode is on
+        # Routed ranges to ICMP-sweep in addition to the interface networks (CYBERSHIELD_SCAN_RANGES)
+        self.range_planner = ScanRangePlanner(
+            ranges=[r for r in os.environ.get("CYBERSHIELD_SCAN_RANGES", "192.168.0.0/24,10.160.46.0/24").split(",") if r.strip()],
+            unit_prefix=int(os.environ.get("CYBERSHIELD_SCAN_UNIT", "24")),
+            max_prefix=int(os.environ.get("CYBERSHIELD_SCAN_MAX_PREFIX", "20")))
+        self.rogue_detector = RogueApDetector(
+            school_ssids=[s for s in os.environ.get("CYBERSHIELD_SCHOOL_SSIDS", "").split(",") if s],
+            school_bssids=[b for b in os.environ.get("CYBERSHIELD_SCHOOL_BSSIDS", "").split(",") if b])
 
     def get_network_interface(self) -> Tuple[str, str]:
         """Get primary network interface IP and MAC"""
@@ -82,150 +1573,124 @@ class NetworkScanner:
         except Exception:
             return "192.168.1.100", "00:00:00:00:00:00"
 
-    def get_network_range(self, ip: str) -> str:
-        """Convert IP to network range for ARP scan"""
-        parts = ip.split(".")
-        return "{}.{}.{}.0/24".format(parts[0], parts[1], parts[2])
-
     def get_vendor_from_mac(self, mac: str) -> str:
         """Lookup vendor name from MAC address OUI"""
-        mac_upper = mac.upper()
-        mac_prefix = mac_upper[:8]
-        
-        for oui, vendor in MAC_VENDORS.items():
-            if mac_prefix.startswith(oui.upper()):
-                return vendor
-        return "Unknown"
+        return self.oui.lookup(mac)
+
+    def _resolve_hostname(self, record: Dict[str, Any]):
+        """Fill in the record's hostname now if cached, otherwise once the lookup finishes"""
+        def on_resolved(ip: str, hostname: str):
+            if hostname != "Unknown":
+                self.inventory.update(record["id"], {"hostname": hostname})
+
+        cached = self.resolver.cached(record["ip"])
+        if cached is not None:
+            on_resolved(record["ip"], cached)
+        else:
+            self.resolver.resolve(record["ip"], on_resolved)
+
+    def scan_network(self, progress: Optional[Callable[[str, float], None]] = None,
+                     incremental: bool = False) -> List[Dict[str, Any]]:
+        """Perform fast network scan using ARP and targeted ICMP
+
+        In incremental mode, hosts already in the inventory are re-probed first and
+        the rest of each range is swept at a reduced rate.
+        """
+        def report(phase: str, fraction: float):
+            if progress:
+                progress(phase, fraction)
 
-    def scan_network(self) -> List[Dict[str, Any]]:
-        """Perform fast network scan using ARP and targeted ICMP"""
         try:
             my_ip, my_mac = self.get_network_interface()
-            devices = []
-            scanned_ranges = set()
+            results = ScanResultSet()
+            ping_concurrency = None
+            arp_inter = 0.0
             
-            # Target subnets to scan
-            target_ranges = [
-                '192.168.0.0/24',
-                '10.160.46.0/24'
-            ]
+            # Interface networks are swept by ARP, configured ranges elsewhere by ICMP
+            arp_units, icmp_units = self.range_planner.plan()
+
+            # Incremental mode: confirm known hosts quickly before the slow sweep
+            known_alive = set()
+            if incremental:
+                known_ips = self.inventory.known_ips()
+                if known_ips:
+                    report("known", 0.02)
+                    for target_ip in self.pinger.sweep(known_ips):
+                        record = self.inventory.get_by_ip(target_ip)
+                        if record is not None:
+                            results.add(self.inventory.observe(record))
+                            known_alive.add(target_ip)
+                    logger.info("Re-probed {} known hosts, {} online".format(len(known_ips), len(known_alive)))
+                ping_concurrency = self.background_ping_concurrency
+                arp_inter = self.background_arp_inter
             
-            # Try ARP scan first on all available interfaces
+            # Try ARP scan first on all available interfaces in one batch
             try:
-                interfaces = psutil.net_if_addrs()
-                
-                for iface_name, iface_addrs in interfaces.items():
-                    for addr in iface_addrs:
-                        # Only scan IPv4 addresses
-                        if addr.family != socket.AF_INET:
-                            continue
-                        
-                        interface_ip = addr.address
-                        if interface_ip.startswith('127.') or interface_ip.startswith('169.254.'):
-                            continue
-                        
-                        # Get network range for this interface
-                        network_range = self.get_network_range(interface_ip)
-                        
-                        # Skip if already scanned
-                        if network_range in scanned_ranges:
-                            continue
-                        scanned_ranges.add(network_range)
-                        
-                        logger.info("ARP scanning network range: {}".format(network_range))
-                        
-                        try:
-                            arp_request = ARP(pdst=network_range)
-                            ether = Ether(dst="ff:ff:ff:ff:ff:ff")
-                            packet = ether / arp_request
-                            
-                            result = srp(packet, timeout=self.timeout, verbose=False)
-                            
-                            for sent, received in result[0]:
-                                device_ip = received.psrc
-                                device_mac = received.hwsrc
-                                
-                                # Skip own IP
-                                if device_mac == my_mac or device_ip == my_ip:
-                                    continue
-                                
-                                # Check if device already added
-                                if any(d['ip'] == device_ip for d in devices):
-                                    continue
-                                
-                                try:
-                                    hostname = socket.gethostbyaddr(device_ip)[0].split(".")[0]
-                                except (socket.herror, socket.gaierror):
-                                    hostname = "Unknown"
-                                
-                                vendor = self.get_vendor_from_mac(device_mac)
-                                
-                                device = {
-                                    "ip": device_ip,
-                                    "mac": device_mac,
-                                    "hostname": hostname,
-                                    "vendor": vendor,
-                                    "type": self._detect_device_type(vendor),
-                                    "status": "Online",
-                                    "lastSeen": "Just now"
-                                }
-                                devices.append(device)
-                                logger.info("Found device via ARP: {} ({})".format(device_ip, hostname))
-                        except Exception as e:
-                            logger.warning("ARP scan error for range {}: {}".format(network_range, str(e)))
+                report("arp", 0.05)
+                for device_ip, device_mac in self.arp.sweep(arp_units, inter=arp_inter):
+                    # Skip own IP
+                    if device_mac == my_mac or device_ip == my_ip:
+                        continue
+                    
+                    # Check if device already added
+                    found = results.get_by_ip(device_ip)
+                    if found is not None and found["mac"] != "Unknown":
+                        continue
+                    
+                    vendor = self.get_vendor_from_mac(device_mac)
+                    # Keep the type derived from open ports once service discovery has run
+                    known = self.inventory.get_by_ip(device_ip)
+                    ports = {s["port"] for s in known.get("services", [])} if known else None
+                    
+                    record = self.inventory.observe({
+                        "ip": device_ip,
+                        "mac": device_mac,
+                        "hostname": "Unknown",
+                        "vendor": vendor,
+                        "type": self._detect_device_type(vendor, ports),
+                    })
+                    self._resolve_hostname(record)
+                    results.add(record)
+                    logger.info("Found device via ARP: {}".format(device_ip))
             except Exception as e:
                 logger.warning("ARP interface scan error: {}".format(str(e)))
             
-            # Fallback: ICMP ping scan for target ranges
+            # Concurrent ICMP sweep for configured ranges that are not on a local link
             try:
                 logger.info("Starting ICMP ping scan for target ranges")
-                for target_range in target_ranges:
-                    base_parts = target_range.split('.0/24')[0].split('.')
-                    base_ip = '.'.join(base_parts)
-                    
+                targets = []
+                for _, target_range, hosts in icmp_units:
                     logger.info("ICMP scanning range: {}".format(target_range))
-                    
-                    # Scan IPs in range (1-254)
-                    for i in range(1, 255):
-                        target_ip = "{}.{}".format(base_ip, i)
-                        
-                        # Skip own IP and broadcast
-                        if target_ip == my_ip or target_ip.endswith('.0') or target_ip.endswith('.255'):
-                            continue
-                        
-                        # Skip if already found
-                        if any(d['ip'] == target_ip for d in devices):
-                            continue
-                        
-                        # Ping with timeout (fast ping)
-                        try:
-                            result = subprocess.run(
-                                ["ping", "-n", "1", "-w", "200", target_ip],
-                                capture_output=True, text=True, timeout=1
-                            )
-                            if result.returncode == 0:
-                                try:
-                                    hostname = socket.gethostbyaddr(target_ip)[0].split(".")[0]
-                                except:
-                                    hostname = "Unknown"
-                                
-                                device = {
-                                    "ip": target_ip,
-                                    "mac": "Unknown",
-                                    "hostname": hostname,
-                                    "vendor": "Unknown",
-                                    "type": "Workstation",
-                                    "status": "Online",
-                                    "lastSeen": "Just now"
-                                }
-                                devices.append(device)
-                                logger.info("Found device via ICMP: {} ({})".format(target_ip, hostname))
-                        except:
-                            pass
+                    # Skip own IP and hosts already confirmed by the incremental re-probe
+                    targets.extend(ip for ip in hosts if ip != my_ip and not results.has_ip(ip))
+
+                report("icmp", 0.5)
+                for target_ip in self.pinger.sweep(targets, concurrency=ping_concurrency):
+                    record = self.inventory.observe({"ip": target_ip})
+                    self._resolve_hostname(record)
+                    results.add(record)
+                    logger.info("Found device via ICMP: {}".format(target_ip))
             except Exception as e:
                 logger.warning("ICMP scan error: {}".format(str(e)))
             
-            self.devices = devices
+            # Devices heard by the passive listener are online even if they ignored the sweep
+            if self.passive is not None:
+                for key in self.passive.recent_keys():
+                    record = self.inventory.get(key)
+                    if record is not None:
+                        results.add(record)
+
+            devices = results.records()
+            if self.service_prober is not None:
+                report("services", 0.8)
+                try:
+                    self.discover_services(devices)
+                except Exception as e:
+                    logger.warning("Service discovery error: {}".format(str(e)))
+
+            self.inventory.mark_missing(results.keys())
+            self.devices = devices
+            report("done", 1.0)
             logger.info("Found {} devices total".format(len(devices)))
             return devices
         except Exception as e:
@@ -234,87 +1699,38 @@ class NetworkScanner:
 
     def scan_wifi(self) -> List[Dict[str, Any]]:
         """Scan for all available Wi-Fi networks and analyze vulnerabilities"""
-        try:
-            networks = []
-            
-            if platform.system() == "Windows":
-                # Force Wi-Fi scan to refresh network list
-                # This ensures we get all available networks, not just cached ones
-                try:
-                    subprocess.run(
-                        ["netsh", "wlan", "show", "networks", "mode=refresh"],
-                        capture_output=True, timeout=5
-                    )
-                except:
-                    pass  # If refresh fails, continue with regular scan
-                
-                # Get list of available networks
-                result = subprocess.run(
-                    ["netsh", "wlan", "show", "networks"],
-                    capture_output=True, timeout=10, errors='replace',
-                    encoding='cp1251'
-                )
-                
-                if result.returncode == 0:
-                    output = result.stdout
-                    lines = output.split('\n')
-                    
-                    for line in lines:
-                        line_clean = line.strip()
-                        
-                        # Look for lines with SSID pattern "SSID X :"
-                        if "SSID" in line_clean and ":" in line_clean:
-                            parts = line_clean.split(":", 1)
-                            if len(parts) == 2:
-                                ssid = parts[1].strip()
-                                # Filter out empty and numeric-only SSID values
-                                if ssid and len(ssid) > 0 and not ssid.isdigit():
-                                    network = {
-                                        "ssid": ssid,
-                                        "bssid": "{}:{}:{}:{}:{}:{}".format(
-                                            "AA", "BB", "CC", "DD", "EE", 
-                                            "{:02X}".format(len(networks) % 256)
-                                        ),
-                                        "signal": -50 - (len(networks) * 3),  # Vary signal by network
-                                        "security": self._get_wifi_security_by_ssid(ssid),
-                                        "channel": 1 + (len(networks) % 13),
-                                        "isRogue": False
-                                    }
-                                    network["vulnerability"] = self._analyze_wifi_security(network.get("security", ""))
-                                    networks.append(network)
-                    
-                    # If we found networks, log them
-                    if networks:
-                        logger.info("Found {} WiFi networks".format(len(networks)))
-                        for net in networks:
-                            logger.info("WiFi: SSID={}, Security={}".format(
-                                net.get("ssid", "?"), 
-                                net.get("security", "?")
-                            ))
-                        return networks
-            
-            # Fallback: return empty list
-            return []
-        except Exception as e:
-            logger.error("WiFi scan error: {}".format(str(e)[:100]))
-            return []
-    
-    def _get_wifi_security_by_ssid(self, ssid: str) -> str:
-        """Infer WiFi security based on SSID patterns"""
-        ssid_lower = ssid.lower()
-        
-        # Common patterns
-        if "guest" in ssid_lower or "public" in ssid_lower:
-            return "WPA2-PSK"
-        elif "open" in ssid_lower or "free" in ssid_lower:
-            return "None"
-        elif "enterprise" in ssid_lower or "corp" in ssid_lower or "work" in ssid_lower:
-            return "WPA3-Enterprise"
-        elif "secure" in ssid_lower or "internal" in ssid_lower:
-            return "WPA3-PSK"
-        else:
-            # Default to WPA2 for unknown networks
-            return "WPA2-PSK"
+        with self._wifi_lock:
+            cached_at, cached = self._wifi_cache
+            now = time.monotonic()
+            if cached_at and now - cached_at < self.wifi_cache_ttl:
+                return [dict(n) for n in cached]
+            try:
+                trigger = now - self._wifi_triggered_at >= self.wifi_trigger_interval
+                raw = self.wifi_backend.scan(trigger=trigger)
+                if trigger:
+                    self._wifi_triggered_at = now
+            except Exception as e:
+                logger.error("WiFi scan error ({}): {}".format(self.wifi_backend.name, str(e)[:100]))
+                return [dict(n) for n in cached]
+
+            # Several interfaces may hear the same AP; keep the strongest reading
+            by_bssid = {}
+            for network in raw:
+                known = by_bssid.get(network["bssid"])
+                if known is None or network["signal"] > known["signal"]:
+                    by_bssid[network["bssid"]] = network
+            networks = sorted(by_bssid.values(), key=lambda n: n["signal"], reverse=True)
+            seen_at = time.time()
+            for network in networks:
+                reasons = self.rogue_detector.observe(network, seen_at)
+                network["isRogue"] = bool(reasons)
+                network["rogueReasons"] = reasons
+                network["vulnerability"] = self._analyze_wifi_security(network["security"])
+
+            if networks:
+                logger.info("Found {} WiFi networks via {}".format(len(networks), self.wifi_backend.name))
+            self._wifi_cache = (now, networks)
+            return [dict(n) for n in networks]
 
     def _analyze_wifi_security(self, security: str) -> Dict[str, Any]:
         """Analyze WiFi network for security vulnerabilities"""
@@ -378,10 +1794,51 @@ class NetworkScanner:
             "recommendation": "Verify network security before connecting"
         }
 
-    def _detect_device_type(self, vendor: str) -> str:
-        """Heuristic device type detection based on vendor"""
+    def service_findings(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Vulnerability findings for a device's open services"""
+        return self.analyzer.analyze_services(services)
+
+    def discover_services(self, devices: List[Dict[str, Any]]):
+        """Probe open ports of devices not probed within service_rescan and update their records"""
+        now = time.time()
+        due = [d for d in devices if now - d.get("servicesAt", 0) >= self.service_rescan]
+        if not due:
+            return
+        results, unfinished = self.service_prober.probe([d["ip"] for d in due])
+        logger.info("Service discovery: {} hosts probed, {} with open ports{}".format(
+            len(due) - len(unfinished), len(results),
+            ", {} left for the next scan (time budget exhausted)".format(len(unfinished)) if unfinished else ""))
+        for device in due:
+            if device["ip"] in unfinished:
+                continue  # not every port was tried before the budget ran out
+            services = results.get(device["ip"], [])
+            findings = self.service_findings(services)
+            severity = max((f["severity"] for f in findings), key=self.SEVERITY_ORDER.index, default="None")
+            self.inventory.update(device["id"], {
+                "services": services,
+                "findings": findings,
+                "severity": severity,
+                "servicesAt": now,
+                "type": self._detect_device_type(device.get("vendor", "Unknown"),
+                                                 {s["port"] for s in services})
+            })
+
+    def _detect_device_type(self, vendor: str, ports: Optional[set] = None) -> str:
+        """Heuristic device type detection based on open ports, then vendor"""
         vendor_lower = vendor.lower()
-        
+
+        if ports:
+            if ports & {9100, 515, 631}:
+                return "Printer"
+            if ports & {554, 1883}:
+                return "IoT"
+            if 53 in ports and ports & {80, 443}:
+                return "Router"
+            if 3389 in ports or 139 in ports:
+                return "Workstation"
+            if ports & {3306, 5432, 1433, 25} or (22 in ports and ports & {80, 443}):
+                return "Server"
+
         if "cisco" in vendor_lower or "router" in vendor_lower:
             return "Router"
         elif "vmware" in vendor_lower or "qemu" in vendor_lower or "hyper" in vendor_lower:
@@ -396,349 +1853,1843 @@ class NetworkScanner:
             return "Workstation"
 
 
-class SystemMonitor:
-    """Handles system monitoring and health checks"""
+class PostureProbe:
+    """Runs slow security-posture checks in the background and caches the results
+
+    Each check is re-run when its TTL expires or when refresh() asks for it
+    early; readers always get the cached value immediately.
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], str]], ttl: float = 300):
+        self.checks = checks
+        self.ttl = ttl
+        self._results = {name: {"value": "Unknown", "checkedAt": None, "expires": 0.0} for name in checks}
+        self._requested = set(checks)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the background probe thread (idempotent)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="posture-probe", daemon=True)
+                self._thread.start()
+
+    def get(self, name: str) -> str:
+        """Cached value of a check ("Unknown" until it first completes)"""
+        self.start()
+        with self._lock:
+            return self._results[name]["value"]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Cached values with their check times"""
+        with self._lock:
+            return {name: {"value": r["value"], "checkedAt": r["checkedAt"]} for name, r in self._results.items()}
+
+    def refresh(self, name: Optional[str] = None):
+        """Ask for one check (or all) to be re-run ahead of its TTL"""
+        with self._lock:
+            self._requested.update([name] if name else self.checks)
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.monotonic()
+            with self._lock:
+                due = [n for n, r in self._results.items() if n in self._requested or r["expires"] <= now]
+                self._requested.difference_update(due)
+            for name in due:
+                try:
+                    value = self.checks[name]()
+                except Exception as e:
+                    logger.warning("Posture check {} failed: {}".format(name, str(e)))
+                    value = "Unknown"
+                with self._lock:
+                    self._results[name] = {
+                        "value": value,
+                        "checkedAt": datetime.now().isoformat(),
+                        "expires": time.monotonic() + self.ttl
+                    }
+            with self._lock:
+                wait = min(r["expires"] for r in self._results.values()) - time.monotonic()
+            self._wake.wait(max(0.0, wait))
+
+
+class SystemMonitor:
+    """Handles system monitoring and health checks
+
+    A background sampler thread refreshes CPU/RAM/disk/temperature/net-IO at a
+    fixed cadence, so get_system_stats() only reads the latest snapshot.
+    """
+
+    def __init__(self, sample_interval: float = 2.0, posture_ttl: float = 300):
+        try:
+            self.boot_time = datetime.fromtimestamp(psutil.boot_time()).strftime("%Y-%m-%d %H:%M:%S")
+        except:
+            self.boot_time = "Unknown"
+        self.sample_interval = sample_interval
+        self._snapshot = None
+        self._sampler = None
+        self._sampler_lock = threading.Lock()
+        self.posture = PostureProbe({
+            "firewall": self._check_firewall,
+            "avStatus": self._check_antivirus
+        }, ttl=posture_ttl)
+        try:
+            # Prime the counter so the first non-blocking reading is meaningful
+            psutil.cpu_percent(interval=None)
+        except:
+            pass
+
+    def start_sampler(self):
+        """Start the background sampler thread (idempotent)"""
+        with self._sampler_lock:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sampler_loop, name="system-sampler", daemon=True)
+                self._sampler.start()
+
+    def _sampler_loop(self):
+        while True:
+            try:
+                self._snapshot = self._sample()
+            except Exception as e:
+                logger.warning("System sampler error: {}".format(str(e)))
+            time.sleep(self.sample_interval)
+
+    def _sample(self) -> Dict[str, Any]:
+        """Collect the metrics that change continuously"""
+        # Non-blocking: utilisation since the previous call, i.e. one sampler period
+        try:
+            cpu_percent = psutil.cpu_percent(interval=None)
+        except:
+            cpu_percent = 0.0
+        
+        try:
+            ram = psutil.virtual_memory()
+        except:
+            ram = None
+        
+        try:
+            if platform.system() == "Windows":
+                disk = psutil.disk_usage("C:\\")
+            else:
+                disk = psutil.disk_usage("/")
+        except:
+            disk = None
+        
+        cpu_temp = 0.0
+        try:
+            temps = psutil.sensors_temperatures()
+            if temps and len(temps) > 0:
+                for name, entries in temps.items():
+                    if entries and len(entries) > 0:
+                        cpu_temp = float(entries[0].current)
+                        break
+        except:
+            cpu_temp = 0.0
+
+        processes = 0
+        try:
+            processes = len(psutil.pids())
+        except:
+            pass
+
+        return {
+            "cpu": round(cpu_percent, 1) if cpu_percent else 0.0,
+            "ram": round(ram.percent, 1) if ram else 0.0,
+            "disk": round(disk.percent, 1) if disk else 0.0,
+            "temp": round(cpu_temp, 1) if cpu_temp else 0.0,
+            "processes": processes,
+            "networkIO": self._get_network_io()
+        }
+
+    def get_system_stats(self) -> Dict[str, Any]:
+        """Collect comprehensive system statistics"""
+        try:
+            self.start_sampler()
+            snapshot = self._snapshot or self._sample()
+
+            firewall_status = self.posture.get("firewall")
+            antivirus_status = self.posture.get("avStatus")
+            uptime_str = self._get_uptime()
+            
+            stats = {
+                "name": "Computer",
+                "os": "Windows",
+                "cpu": snapshot["cpu"],
+                "ram": snapshot["ram"],
+                "disk": snapshot["disk"],
+                "temp": snapshot["temp"],
+                "bootTime": self.boot_time,
+                "uptime": uptime_str,
+                "firewall": firewall_status,
+                "avStatus": antivirus_status,
+                "processes": snapshot["processes"],
+                "networkIO": snapshot["networkIO"]
+            }
+            
+            try:
+                stats["name"] = socket.gethostname()
+            except:
+                pass
+            
+            return stats
+        except Exception as e:
+            return self._get_default_stats()
+
+    @staticmethod
+    def _run_probe(command: List[str], timeout: float = 10) -> Optional[subprocess.CompletedProcess]:
+        """Run a probe command if the tool exists; None if it is missing or fails to start"""
+        if shutil.which(command[0]) is None:
+            return None
+        try:
+            return subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def _check_firewall(self) -> str:
+        """Check host firewall status"""
+        try:
+            system = platform.system()
+            if system == "Windows":
+                result = subprocess.run(
+                    ["powershell", "-Command", 
+                     "(Get-NetFirewallProfile -Profile Domain | Select-Object -ExpandProperty Enabled)"],
+                    capture_output=True, text=True, timeout=10
+                )
+                if result.returncode == 0 and "True" in result.stdout:
+                    return "Enabled"
+                else:
+                    return "Disabled"
+            if system == "Linux":
+                return self._check_firewall_linux()
+            return "Unknown"
+        except:
+            return "Unknown"
+
+    def _check_firewall_linux(self) -> str:
+        """ufw / firewalld / nftables / iptables, in that order"""
+        probed = False
+
+        result = self._run_probe(["ufw", "status"])
+        if result is not None and result.returncode == 0:
+            probed = True
+            if "Status: active" in result.stdout:
+                return "Enabled"
+
+        result = self._run_probe(["firewall-cmd", "--state"])
+        if result is not None:
+            probed = True
+            if result.stdout.strip() == "running":
+                return "Enabled"
+
+        result = self._run_probe(["nft", "list", "ruleset"])
+        if result is not None and result.returncode == 0:
+            probed = True
+            ruleset = result.stdout.lower()
+            if "hook input" in ruleset and ("drop" in ruleset or "reject" in ruleset):
+                return "Enabled"
+
+        result = self._run_probe(["iptables", "-S", "INPUT"])
+        if result is not None and result.returncode == 0:
+            probed = True
+            rules = result.stdout
+            if "-P INPUT DROP" in rules or "-j DROP" in rules or "-j REJECT" in rules:
+                return "Enabled"
+
+        # Tools answered but nothing filters inbound traffic; without root nothing answers
+        return "Disabled" if probed else "Unknown"
+
+    def _check_antivirus(self) -> str:
+        """Check Antivirus status"""
+        try:
+            system = platform.system()
+            if system == "Windows":
+                result = subprocess.run(
+                    ["powershell", "-Command", 
+                     "(Get-MpComputerStatus | Select-Object -ExpandProperty AntivirusEnabled)"],
+                    capture_output=True, text=True, timeout=10
+                )
+                if result.returncode == 0 and "True" in result.stdout:
+                    return "Active"
+                else:
+                    return "Disabled"
+            if system == "Linux":
+                return self._check_antivirus_linux()
+            return "Unknown"
+        except:
+            return "Unknown"
+
+    def _check_antivirus_linux(self) -> str:
+        """ClamAV: Active if clamd is running, Disabled if only installed"""
+        for proc in psutil.process_iter(["name"]):
+            try:
+                if proc.info["name"] in ("clamd", "clamonacc"):
+                    return "Active"
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        if shutil.which("clamscan") or shutil.which("clamd") or os.path.exists("/usr/sbin/clamd"):
+            return "Disabled"
+        return "Unknown"
+
+    def _get_network_io(self) -> Dict[str, float]:
+        """Get network I/O statistics"""
+        try:
+            io = psutil.net_io_counters()
+            return {
+                "bytesSent": round(io.bytes_sent / 1024 / 1024, 2),
+                "bytesRecv": round(io.bytes_recv / 1024 / 1024, 2),
+                "packetsSent": io.packets_sent,
+                "packetsRecv": io.packets_recv
+            }
+        except:
+            return {"bytesSent": 0, "bytesRecv": 0, "packetsSent": 0, "packetsRecv": 0}
+
+    def _get_uptime(self) -> str:
+        """Get system uptime as human-readable string"""
+        try:
+            uptime_seconds = int(datetime.now().timestamp() - psutil.boot_time())
+            days = uptime_seconds // 86400
+            hours = (uptime_seconds % 86400) // 3600
+            minutes = (uptime_seconds % 3600) // 60
+            return "{}d {}h {}m".format(days, hours, minutes)
+        except:
+            return "Unknown"
+
+    def _get_default_stats(self) -> Dict[str, Any]:
+        """Return default stats if monitoring fails"""
+        return {
+            "name": "Computer",
+            "os": "Windows",
+            "cpu": 0,
+            "ram": 0,
+            "disk": 0,
+            "temp": 0,
+            "bootTime": "Unknown",
+            "uptime": "Unknown",
+            "firewall": "Unknown",
+            "avStatus": "Unknown",
+            "processes": 0,
+            "networkIO": {"bytesSent": 0, "bytesRecv": 0, "packetsSent": 0, "packetsRecv": 0}
+        }
+
+
+class VulnerabilityAnalyzer:
+    """Analyze vulnerabilities in connected systems with predefined recommendations
+
+    Rules are loaded from a JSON file (metric, comparator, threshold levels,
+    severity, message templates) and compiled once into per-metric matchers.
+    "rules" apply to agent telemetry, "deviceRules" to scanned network devices.
+    The file is re-read automatically when it changes on disk.
+    """
+
+    SEVERITY_RANK = {"None": 0, "Low": 0, "Medium": 1, "High": 2, "Critical": 3}
+    SEVERITY_NAMES = ("Low", "Medium", "High", "Critical")
+
+    # comparator -> (how to read the metric, predicate(value, threshold))
+    COMPARATORS = {
+        ">": ("number", operator.gt),
+        ">=": ("number", operator.ge),
+        "<": ("number", operator.lt),
+        "<=": ("number", operator.le),
+        "==": ("text", lambda v, t: v == t.lower()),
+        "!=": ("text", lambda v, t: v != t.lower()),
+        "contains": ("text", lambda v, t: t.lower() in v),
+        "contains_any": ("text", lambda v, t: any(x.lower() in v for x in t)),
+        "includes": ("set", lambda v, t: t in v),
+    }
+
+    DEFAULTS = {"number": 0, "text": "Unknown", "set": ()}
+
+    def __init__(self, rules_path: Optional[str] = None):
+        self.rules_path = rules_path or os.environ.get("CYBERSHIELD_RULES") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "vulnerability_rules.json")
+        self.rules = []
+        self.device_rules = []
+        self.healthy = None
+        self.generation = 0  # bumped on every (re)load so caches know to recompute
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self, force: bool = False):
+        """Recompile rules if the rules file changed since the last load"""
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+        except OSError:
+            if self._mtime is None and not self.rules:
+                logger.error("Vulnerability rules file not found: {}".format(self.rules_path))
+            return
+        if mtime == self._mtime and not force:
+            return
+        with self._lock:
+            if mtime == self._mtime and not force:
+                return
+            try:
+                with open(self.rules_path, encoding="utf-8") as f:
+                    spec = json.load(f)
+                rules = [self._compile_rule(rule) for rule in spec.get("rules", [])]
+                device_rules = [self._compile_rule(rule, emit_id=True) for rule in spec.get("deviceRules", [])]
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Keep serving the previous rule set if an edit broke the file
+                logger.error("Invalid vulnerability rules in {}: {}".format(self.rules_path, str(e)))
+                self._mtime = mtime
+                return
+            self.rules = rules
+            self.device_rules = device_rules
+            self.healthy = spec.get("healthy")
+            self._mtime = mtime
+            self.generation += 1
+            logger.info("Loaded {} vulnerability rules and {} device rules from {}".format(
+                len(rules), len(device_rules), self.rules_path))
+
+    def _compile_rule(self, rule: Dict[str, Any], emit_id: bool = False
+                      ) -> Tuple[str, str, Callable, List[Tuple[Any, int, Dict, Optional[Dict]]]]:
+        """Turn a rule spec into (metric, kind, predicate, levels)
+
+        Level ids only name rules in errors; device findings also carry them in
+        their output, as service findings always have. Client findings do not.
+        """
+        kind, predicate = self.COMPARATORS[rule["comparator"]]
+        levels = []
+        for level in rule["levels"]:
+            vuln = {
+                "type": level["type"],
+                "severity": level["severity"],
+                "description": level["description"],
+                "recommendation": level["recommendation"]
+            }
+            if emit_id and "id" in level:
+                vuln = dict(id=level["id"], **vuln)
+            threshold = level["threshold"]
+            if kind == "number":
+                threshold = float(threshold)
+            # Reject bad placeholders now rather than on the request path
+            fields = {name for _, name, _, _ in string.Formatter().parse(level["description"]) if name is not None}
+            try:
+                level["description"].format(value=0 if kind == "number" else "unknown")
+            except (KeyError, IndexError, ValueError) as e:
+                raise ValueError("rule '{}': bad description template {!r} ({})".format(
+                    level.get("id", rule["metric"]), level["description"], str(e)))
+            # Templated findings are formatted once per distinct value and then shared
+            cache = {} if fields else None
+            levels.append((threshold, self.SEVERITY_RANK.get(level["severity"], 0), vuln, cache))
+        return rule["metric"], kind, predicate, levels
+
+    def analyze_client(self, client_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyze vulnerabilities in a single client with predefined recommendations"""
+        return self.analyze_all_clients({client_data.get("client_id"): client_data})[0]
+
+    def analyze_services(self, services: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Findings of the device rules for one device's open services"""
+        self.reload()
+        record = {
+            "openPorts": {s.get("port") for s in services},
+            "banners": "\n".join(s.get("banner") or "" for s in services),
+        }
+        findings, _ = self._evaluate(self.device_rules, [record])
+        return findings[0]
+
+    def analyze_all_clients(self, clients: Dict[str, Dict]) -> List[Dict[str, Any]]:
+        """Evaluate every rule over all clients, one metric column at a time"""
+        self.reload()
+        records = list(clients.values())
+        findings, ranks = self._evaluate(self.rules, records)
+
+        timestamp = datetime.now().isoformat()
+        results = []
+        for record, vulnerabilities, rank in zip(records, findings, ranks):
+            if not vulnerabilities:
+                vulnerabilities = [dict(self.healthy)] if self.healthy else []
+            results.append({
+                "client_id": record.get("client_id"),
+                "hostname": record.get("hostname"),
+                "severity": self.SEVERITY_NAMES[rank],
+                "count": len([v for v in vulnerabilities if v.get("severity") != "None"]),
+                "vulnerabilities": vulnerabilities,
+                "timestamp": timestamp
+            })
+        return results
+
+    def _evaluate(self, rules: List, records: List[Dict[str, Any]]) -> Tuple[List[List[Dict]], List[int]]:
+        """Per-record findings and highest severity rank for a compiled rule set"""
+        findings = [[] for _ in records]
+        ranks = [0] * len(records)
+
+        for metric, kind, predicate, levels in rules:
+            default = self.DEFAULTS[kind]
+            if kind == "number":
+                column = [r.get(metric, default) for r in records]
+            elif kind == "set":
+                column = [set(r.get(metric) or default) for r in records]
+            else:
+                column = [str(r.get(metric, default)).lower() for r in records]
+
+            for i, value in enumerate(column):
+                # First matching level wins (levels are ordered most severe first)
+                for threshold, rank, vuln, cache in levels:
+                    if predicate(value, threshold):
+                        if cache is not None:
+                            formatted = cache.get(value)
+                            if formatted is None:
+                                shown = int(value) if kind == "number" else value
+                                formatted = dict(vuln, description=vuln["description"].format(value=shown))
+                                if len(cache) < 4096:
+                                    cache[value] = formatted
+                            vuln = formatted
+                        findings[i].append(vuln)
+                        if rank > ranks[i]:
+                            ranks[i] = rank
+                        break
+        return findings, ranks
+
+
+class ClientRecord:
+    """Compact per-client state (slots instead of a per-client dict)"""
+
+    __slots__ = ("client_id", "hostname", "ip", "os", "cpu", "ram", "disk", "temp", "processes",
+                 "firewall", "avStatus", "lastSeen", "status", "uptime", "reportInterval", "version")
+
+    def __init__(self, client_id: str):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.client_id = client_id
+
+    def apply(self, fields: Dict[str, Any]):
+        """Copy known fields onto the record"""
+        for field, value in fields.items():
+            if field in ClientRecord.__slots__ and field not in ("client_id", "version"):
+                setattr(self, field, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready view of the fields that have been set"""
+        result = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is not None:
+                result[field] = value
+        return result
+
+
+class ClientStore:
+    """Thread-safe registry of reporting client PCs, sharded by client_id
+
+    Writers only lock their shard; snapshot() takes every shard lock in a fixed
+    order so readers see one consistent point in time. Every write stamps the
+    record with a store-wide version and appends it to a bounded change
+    journal, so consumers can ask what changed since the version they last saw.
+    """
+
+    def __init__(self, shards: int = 16, journal_size: int = 100000):
+        self._shards = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.version = 0
+        self._journal = deque(maxlen=journal_size)  # (version, client_id)
+        self._journal_lock = threading.Lock()
+
+    def _index(self, client_id: str) -> int:
+        return hash(client_id) % len(self._shards)
+
+    def _stamp(self, client_id: str) -> int:
+        """Allocate the next store version and journal the change (shard lock held)"""
+        with self._journal_lock:
+            self.version += 1
+            self._journal.append((self.version, client_id))
+            return self.version
+
+    def changed_since(self, version: int) -> Tuple[Optional[set], int]:
+        """Client ids written after `version` and the current version
+
+        Returns None instead of a set when the journal no longer reaches back
+        that far and the caller has to rescan everything.
+        """
+        with self._journal_lock:
+            current = self.version
+            if version >= current:
+                return set(), current
+            if not self._journal or self._journal[0][0] > version + 1:
+                return None, current
+            changed = set()
+            for entry_version, client_id in reversed(self._journal):
+                if entry_version <= version:
+                    break
+                changed.add(client_id)
+            return changed, current
+
+    def register(self, client_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a client record"""
+        i = self._index(client_id)
+        record = ClientRecord(client_id)
+        record.apply(fields)
+        with self._locks[i]:
+            record.version = self._stamp(client_id)
+            self._shards[i][client_id] = record
+            return record.to_dict()
+
+    def update(self, client_id: str, fields: Dict[str, Any],
+               defaults: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """Update a client, creating it from defaults if unknown; returns (record, created)"""
+        i = self._index(client_id)
+        with self._locks[i]:
+            record = self._shards[i].get(client_id)
+            created = record is None
+            if created:
+                record = ClientRecord(client_id)
+                record.apply(defaults or {})
+                self._shards[i][client_id] = record
+            record.apply(fields)
+            record.version = self._stamp(client_id)
+            return record.to_dict(), created
+
+    def update_if(self, client_id: str, fields: Dict[str, Any],
+                  condition: Callable[["ClientRecord"], bool]) -> Optional[Dict[str, Any]]:
+        """Update an existing client only if `condition` holds for it under the shard lock"""
+        i = self._index(client_id)
+        with self._locks[i]:
+            record = self._shards[i].get(client_id)
+            if record is None or not condition(record):
+                return None
+            record.apply(fields)
+            record.version = self._stamp(client_id)
+            return record.to_dict()
+
+    def get(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of one client record"""
+        i = self._index(client_id)
+        with self._locks[i]:
+            record = self._shards[i].get(client_id)
+            return record.to_dict() if record else None
+
+    def remove(self, client_id: str) -> bool:
+        """Drop a client record"""
+        i = self._index(client_id)
+        with self._locks[i]:
+            if self._shards[i].pop(client_id, None) is None:
+                return False
+            self._stamp(client_id)
+            return True
+
+    def load(self, records: Dict[str, Dict[str, Any]]):
+        """Restore persisted records at startup"""
+        for client_id, fields in records.items():
+            i = self._index(client_id)
+            record = ClientRecord(client_id)
+            record.apply(fields)
+            with self._locks[i]:
+                record.version = self._stamp(client_id)
+                self._shards[i][client_id] = record
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Consistent copy of every client record"""
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return {client_id: record.to_dict()
+                    for shard in self._shards for client_id, record in shard.items()}
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def __contains__(self, client_id: str) -> bool:
+        i = self._index(client_id)
+        with self._locks[i]:
+            return client_id in self._shards[i]
+
+
+class RollupRing:
+    """Fixed-size ring of time buckets holding min/max/avg per metric
+
+    Buckets are direct-mapped (slot = bucket number % capacity), so late or
+    backfilled samples land in their bucket in O(1) as long as it is still
+    inside the retention window.
+    """
+
+    __slots__ = ("resolution", "capacity", "starts", "counts", "mins", "maxs", "sums")
+
+    def __init__(self, resolution: int, capacity: int, metrics: Tuple[str, ...]):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.starts = array("d", bytes(8 * capacity))
+        self.counts = array("I", bytes(4 * capacity))
+        self.mins = {m: array("f", bytes(4 * capacity)) for m in metrics}
+        self.maxs = {m: array("f", bytes(4 * capacity)) for m in metrics}
+        self.sums = {m: array("f", bytes(4 * capacity)) for m in metrics}
+
+    def add(self, timestamp: float, values: Dict[str, float]):
+        """Fold a sample into its bucket, recycling the slot if it holds an older bucket"""
+        start = timestamp - timestamp % self.resolution
+        i = int(start // self.resolution) % self.capacity
+        if self.counts[i] and self.starts[i] > start:
+            return  # Older than the retention window
+        if self.starts[i] != start:
+            self.starts[i] = start
+            self.counts[i] = 0
+
+        first = self.counts[i] == 0
+        for metric, value in values.items():
+            if metric not in self.sums:
+                continue
+            if first:
+                self.mins[metric][i] = self.maxs[metric][i] = self.sums[metric][i] = value
+            else:
+                if value < self.mins[metric][i]:
+                    self.mins[metric][i] = value
+                if value > self.maxs[metric][i]:
+                    self.maxs[metric][i] = value
+                self.sums[metric][i] += value
+        self.counts[i] += 1
+
+    def query(self, metric: str, start: float, end: float) -> List[Dict[str, Any]]:
+        """Buckets overlapping [start, end], oldest first"""
+        points = []
+        for i in range(self.capacity):
+            t = self.starts[i]
+            if t + self.resolution < start or t > end or not self.counts[i]:
+                continue
+            points.append({
+                "t": t,
+                "min": round(self.mins[metric][i], 2),
+                "max": round(self.maxs[metric][i], 2),
+                "avg": round(self.sums[metric][i] / self.counts[i], 2)
+            })
+        points.sort(key=lambda point: point["t"])
+        return points
+
+    def nbytes(self) -> int:
+        """Bytes held by the bucket arrays"""
+        columns = [self.starts, self.counts]
+        for table in (self.mins, self.maxs, self.sums):
+            columns.extend(table.values())
+        return sum(column.itemsize * len(column) for column in columns)
+
+
+class MetricSeries:
+    """Raw ring buffer of recent samples plus 1m/15m/1h rollups for one client"""
+
+    def __init__(self, metrics: Tuple[str, ...], raw_capacity: int, rollups: Tuple[Tuple[int, int], ...]):
+        self.metrics = metrics
+        self.raw_capacity = raw_capacity
+        self.raw_head = -1
+        self.raw_size = 0
+        self.raw_times = array("d", bytes(8 * raw_capacity))
+        self.raw_values = {m: array("f", bytes(4 * raw_capacity)) for m in metrics}
+        self.rollups = OrderedDict((resolution, RollupRing(resolution, capacity, metrics))
+                                   for resolution, capacity in rollups)
+        self.lock = threading.Lock()
+
+    def add(self, timestamp: float, values: Dict[str, float]):
+        """Append a sample to the raw ring and fold it into every rollup"""
+        with self.lock:
+            self.raw_head = (self.raw_head + 1) % self.raw_capacity
+            self.raw_size = min(self.raw_size + 1, self.raw_capacity)
+            self.raw_times[self.raw_head] = timestamp
+            for metric in self.metrics:
+                self.raw_values[metric][self.raw_head] = values.get(metric, 0.0)
+            for ring in self.rollups.values():
+                ring.add(timestamp, values)
+
+    def query_raw(self, metric: str, start: float, end: float) -> List[Dict[str, Any]]:
+        """Raw samples within [start, end], oldest first"""
+        with self.lock:
+            points = []
+            values = self.raw_values[metric]
+            for n in range(self.raw_size - 1, -1, -1):
+                i = (self.raw_head - n) % self.raw_capacity
+                t = self.raw_times[i]
+                if start <= t <= end:
+                    points.append({"t": t, "value": round(values[i], 2)})
+            # Backfilled samples may have been appended out of order
+            points.sort(key=lambda point: point["t"])
+            return points
+
+    def query_rollup(self, resolution: int, metric: str, start: float, end: float) -> List[Dict[str, Any]]:
+        """Rollup buckets of one resolution within [start, end]"""
+        with self.lock:
+            return self.rollups[resolution].query(metric, start, end)
+
+    def raw_covers(self, start: float) -> bool:
+        """True if the raw ring still holds every sample since `start`"""
+        with self.lock:
+            if self.raw_size < self.raw_capacity:
+                return True
+            return self.raw_times[(self.raw_head + 1) % self.raw_capacity] <= start
+
+    def nbytes(self) -> int:
+        """Bytes held by the raw ring and all rollups"""
+        columns = [self.raw_times] + list(self.raw_values.values())
+        raw = sum(column.itemsize * len(column) for column in columns)
+        return raw + sum(ring.nbytes() for ring in self.rollups.values())
+
+
+class MetricsStore:
+    """Bounded in-memory time-series store for client telemetry"""
+
+    METRICS = ("cpu", "ram", "disk", "temp")
+    RESOLUTIONS = {"1m": 60, "15m": 900, "1h": 3600}
+
+    def __init__(self, raw_capacity: int = 120, rollups: Tuple[Tuple[int, int], ...] = ((60, 240), (900, 288), (3600, 336))):
+        # Defaults: ~2h of 1-minute samples, 4h of 1m, 3 days of 15m, 14 days of 1h buckets
+        self.raw_capacity = raw_capacity
+        self.rollup_config = rollups
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, client_id: str, timestamp: float, values: Dict[str, Any]):
+        """Store one telemetry sample for a client"""
+        series = self._series.get(client_id)
+        if series is None:
+            with self._lock:
+                series = self._series.get(client_id)
+                if series is None:
+                    series = MetricSeries(self.METRICS, self.raw_capacity, self.rollup_config)
+                    self._series[client_id] = series
+        numeric = {}
+        for metric in self.METRICS:
+            try:
+                numeric[metric] = float(values.get(metric) or 0)
+            except (TypeError, ValueError):
+                numeric[metric] = 0.0
+        series.add(timestamp, numeric)
+
+    def query(self, client_id: str, metric: str, start: float, end: float,
+              resolution: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return points for [start, end]; picks the finest resolution covering the range if unset"""
+        series = self._series.get(client_id)
+        if series is None:
+            return None
+        if metric not in self.METRICS:
+            raise ValueError("Unknown metric: {}".format(metric))
+
+        if resolution is None:
+            if series.raw_covers(start):
+                resolution = "raw"
+            else:
+                span = end - start
+                resolution = "1m" if span <= 4 * 3600 else ("15m" if span <= 3 * 86400 else "1h")
+
+        if resolution == "raw":
+            points = series.query_raw(metric, start, end)
+        elif resolution in self.RESOLUTIONS:
+            points = series.query_rollup(self.RESOLUTIONS[resolution], metric, start, end)
+        else:
+            raise ValueError("Unknown resolution: {}".format(resolution))
+
+        return {"client_id": client_id, "metric": metric, "resolution": resolution, "points": points}
+
+    def remove(self, client_id: str):
+        """Forget a client's history"""
+        with self._lock:
+            self._series.pop(client_id, None)
+
+    def bytes_per_client(self) -> int:
+        """Fixed memory footprint of one client's series (array storage only)"""
+        return MetricSeries(self.METRICS, self.raw_capacity, self.rollup_config).nbytes()
+
+
+class TelemetryIngestor:
+    """Decodes batched, delta-encoded telemetry uploads from client agents
+
+    Each client sends samples whose "fields" hold only values that changed since
+    the previous sample; the chain starts from the state the server last acked.
+    If the client's base does not match (e.g. after a server restart) the
+    server asks it to resend full state.
+    """
+
+    MAX_BODY = 8 * 1024 * 1024
+
+    def __init__(self, max_seen_ids: int = 20000):
+        self.max_seen_ids = max_seen_ids
+        self._acked = {}  # client_id -> (seq, full field state)
+        self._seen = {}  # client_id -> OrderedDict of recently applied sample ids
+        self._latest = {}  # client_id -> timestamp of the newest applied sample
+        self._lock = threading.Lock()
+
+    def _first_time(self, client_id: str, sample_id: Optional[str]) -> bool:
+        """Remember a sample id; False if it was already applied (lock held)"""
+        if sample_id is None:
+            return True
+        seen = self._seen.setdefault(client_id, OrderedDict())
+        if sample_id in seen:
+            return False
+        seen[sample_id] = True
+        if len(seen) > self.max_seen_ids:
+            seen.popitem(last=False)
+        return True
+
+    @classmethod
+    def decode_body(cls, body: bytes, encoding: str) -> Dict[str, Any]:
+        """Decompress (gzip/zstd) and parse an upload body"""
+        encoding = (encoding or "identity").lower()
+        if encoding == "gzip":
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                body = inflater.decompress(body, cls.MAX_BODY)
+            except zlib.error as e:
+                raise ValueError("Invalid gzip body: {}".format(str(e)))
+            if inflater.unconsumed_tail:
+                raise ValueError("Decompressed body too large")
+        elif encoding == "zstd":
+            if zstandard is None:
+                raise ValueError("zstd encoding not supported on this server")
+            try:
+                body = zstandard.ZstdDecompressor().decompress(body, max_output_size=cls.MAX_BODY)
+            except zstandard.ZstdError as e:
+                raise ValueError("Invalid zstd body: {}".format(str(e)))
+        elif encoding != "identity":
+            raise ValueError("Unsupported Content-Encoding: {}".format(encoding))
+        return json.loads(body)
+
+    def ingest(self, payload: Dict[str, Any],
+               apply: Callable[[str, Dict[str, Any], float], None]) -> Tuple[bool, Optional[int]]:
+        """Replay samples through apply(client_id, full_fields, ts); return (accepted, ack seq)
+
+        accepted is False when the client's base is stale and it must resend full state.
+        """
+        client_id = payload.get("client_id")
+        if not client_id:
+            raise ValueError("client_id is required")
+        samples = payload.get("samples") or []
+        base = payload.get("base")
+
+        # The shared lock only guards decoder state; samples are applied after it
+        # is released so uploads from different clients do not queue behind each other
+        updates = []
+        with self._lock:
+            acked_seq, state = self._acked.get(client_id, (None, None))
+            if base is not None and base != acked_seq:
+                return False, acked_seq
+            state = dict(state) if base is not None else {}
+            seq = acked_seq if base is not None else None
+            for sample in samples:
+                sample_seq = sample.get("seq")
+                if seq is not None and sample_seq is not None and sample_seq <= seq:
+                    continue  # Already applied
+                state.update(sample.get("fields") or {})
+                seq = sample_seq
+                # A full resend after a lost ack repeats samples that were already applied
+                if not self._first_time(client_id, sample.get("id")):
+                    continue
+                ts = float(sample.get("ts") or time.time())
+                self._latest[client_id] = max(ts, self._latest.get(client_id, 0.0))
+                updates.append((dict(state), ts))
+            self._acked[client_id] = (seq, state)
+
+        for fields, ts in updates:
+            apply(client_id, fields, ts)
+        return True, seq
+
+    def forget(self, client_id: str):
+        """Drop all per-client decoder state (expired client)"""
+        with self._lock:
+            self._acked.pop(client_id, None)
+            self._seen.pop(client_id, None)
+            self._latest.pop(client_id, None)
+
+    def note_live(self, client_id: str, timestamp: float):
+        """Record a sample delivered outside ingest() so backfill never overrides it"""
+        with self._lock:
+            self._latest[client_id] = max(timestamp, self._latest.get(client_id, 0.0))
+
+    def backfill(self, payload: Dict[str, Any],
+                 apply: Callable[[str, Dict[str, Any], float, bool], None]) -> int:
+        """Idempotently apply spooled full-state samples; returns how many were new
+
+        apply(client_id, fields, ts, history_only) is told to touch only history
+        when the sample is older than what the client already reported live.
+        """
+        client_id = payload.get("client_id")
+        if not client_id:
+            raise ValueError("client_id is required")
+        updates = []
+        with self._lock:
+            for sample in sorted(payload.get("samples") or [], key=lambda x: x.get("ts") or 0):
+                if not self._first_time(client_id, sample.get("id")):
+                    continue
+                ts = float(sample.get("ts") or time.time())
+                latest = self._latest.get(client_id, 0.0)
+                updates.append((sample.get("fields") or {}, ts, ts < latest))
+                self._latest[client_id] = max(ts, latest)
+
+        for fields, ts, history_only in updates:
+            apply(client_id, fields, ts, history_only)
+        return len(updates)
+
+
+class ClientLiveness:
+    """Online -> Stale -> Offline status of reporting clients, driven by a deadline heap
+
+    A report only updates the client's entry; each entry has one pending
+    deadline in the heap. When it comes due the worker re-checks the last
+    report and either moves the client on or reschedules it, so no request ever
+    scans the whole fleet. Clients silent for expire_after are dropped.
+    """
+
+    def __init__(self, default_interval: float = 60.0, stale_after: float = 3, offline_after: float = 10,
+                 expire_after: float = 7 * 86400,
+                 on_transition: Optional[Callable[[str, str, str, float], None]] = None,
+                 on_expire: Optional[Callable[[str], None]] = None):
+        self.default_interval = default_interval
+        self.stale_after = stale_after  # in report intervals
+        self.offline_after = offline_after  # in report intervals
+        self.expire_after = expire_after  # seconds
+        self.on_transition = on_transition
+        self.on_expire = on_expire
+        self._clients = {}  # client_id -> [last_seen, interval, state, deadline]
+        self._heap = []  # (deadline, client_id); entries whose deadline moved are skipped
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="client-liveness", daemon=True)
+                self._thread.start()
+
+    def touch(self, client_id: str, seen_at: Optional[float] = None,
+              interval: Optional[float] = None) -> Optional[str]:
+        """Record a report; returns the previous state if the client was not Online"""
+        seen_at = seen_at or time.time()
+        with self._cond:
+            entry = self._clients.get(client_id)
+            if entry is None:
+                entry = self._clients[client_id] = [seen_at, interval or self.default_interval, "Online", None]
+                previous = None
+            else:
+                entry[0] = max(entry[0], seen_at)
+                if interval:
+                    entry[1] = interval
+                previous = entry[2] if entry[2] != "Online" else None
+                entry[2] = "Online"
+            self._schedule(client_id, entry)
+            return previous
+
+    def forget(self, client_id: str):
+        with self._cond:
+            self._clients.pop(client_id, None)
+
+    def state(self, client_id: str) -> Optional[str]:
+        with self._cond:
+            entry = self._clients.get(client_id)
+            return entry[2] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of tracked clients per state"""
+        result = {"Online": 0, "Stale": 0, "Offline": 0}
+        with self._cond:
+            for entry in self._clients.values():
+                result[entry[2]] += 1
+        return result
+
+    def _target(self, entry: List[Any], now: float) -> str:
+        """State a client should be in now, or "Expired" once it is past expire_after"""
+        silent = now - entry[0]
+        if silent >= self.expire_after:
+            return "Expired"
+        if silent >= self.offline_after * entry[1]:
+            return "Offline"
+        if silent >= self.stale_after * entry[1]:
+            return "Stale"
+        return "Online"
+
+    def _next_deadline(self, entry: List[Any]) -> float:
+        """When the client's current state runs out (lock held)"""
+        if entry[2] == "Online":
+            return entry[0] + self.stale_after * entry[1]
+        if entry[2] == "Stale":
+            return entry[0] + self.offline_after * entry[1]
+        return entry[0] + self.expire_after
+
+    def _schedule(self, client_id: str, entry: List[Any]):
+        """Push a heap entry only if the deadline moved earlier (lock held)
+
+        Later deadlines are found lazily: the old entry fires, is re-checked and
+        rescheduled, which keeps the heap at about one entry per client.
+        """
+        deadline = self._next_deadline(entry)
+        if entry[3] is None or deadline < entry[3]:
+            entry[3] = deadline
+            heapq.heappush(self._heap, (deadline, client_id))
+            if self._heap[0][1] == client_id:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            transitions, expired = [], []
+            with self._cond:
+                now = time.time()
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, client_id = heapq.heappop(self._heap)
+                    entry = self._clients.get(client_id)
+                    if entry is None or entry[3] != deadline:
+                        continue
+                    entry[3] = None
+                    target = self._target(entry, now)
+                    if target == "Expired":
+                        del self._clients[client_id]
+                        expired.append(client_id)
+                        continue
+                    if target != entry[2]:
+                        transitions.append((client_id, entry[2], target, entry[0]))
+                        entry[2] = target
+                    self._schedule(client_id, entry)
+                if not transitions and not expired:
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                    continue
+
+            # Callbacks run outside the lock so they may touch other stores
+            try:
+                for client_id, old, new, seen_at in transitions:
+                    logger.info("Client {} is now {} (was {})".format(client_id, new, old))
+                    if self.on_transition:
+                        # seen_at is the last report the new state was judged from
+                        self.on_transition(client_id, old, new, seen_at)
+                for client_id in expired:
+                    logger.info("Client {} expired after {:.1f} days without reports".format(
+                        client_id, self.expire_after / 86400))
+                    if self.on_expire:
+                        self.on_expire(client_id)
+            except Exception as e:
+                logger.error("Client liveness callback error: {}".format(str(e)))
+
+
+class VulnerabilityCache:
+    """Memoizes per-client analysis by client version and keeps fleet counters current
+
+    Each refresh re-analyzes only clients written since the last refresh; a
+    rule reload or an overrun change journal falls back to a full pass.
+    """
+
+    def __init__(self, analyzer: VulnerabilityAnalyzer, store: ClientStore,
+                 on_severity_change: Optional[Callable[[Dict[str, Any], Optional[str]], None]] = None):
+        self.analyzer = analyzer
+        self.store = store
+        self.on_severity_change = on_severity_change
+        self.results = {}  # client_id -> analysis result
+        self.counts = {"Critical": 0, "High": 0, "Medium": 0, "Low": 0}
+        # Last severity passed to on_severity_change; survives rule reloads and restarts (see seed)
+        self.severities = {}
+        self._store_version = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Bring results up to date; returns (details, severity counts)"""
+        with self._lock:
+            self._update()
+            return list(self.results.values()), dict(self.counts)
+
+    def update(self):
+        """Bring results up to date without building the response payload"""
+        with self._lock:
+            self._update()
+
+    def seed(self, severities: Dict[str, str]):
+        """Start from severities recorded before a restart so unchanged clients are not reported again"""
+        with self._lock:
+            self.severities.update(severities)
+
+    def severity_counts(self) -> Dict[str, int]:
+        """Up-to-date severity histogram of the fleet"""
+        with self._lock:
+            self._update()
+            return dict(self.counts)
+
+    def _update(self):
+        """Re-analyze clients changed since the last call (lock held)"""
+        self.analyzer.reload()
+        changed, version = self.store.changed_since(self._store_version)
+        if changed is None or self._generation != self.analyzer.generation:
+            self.results = {}
+            self.counts = dict.fromkeys(self.counts, 0)
+            changed = None
+
+        if changed is None:
+            records = self.store.snapshot()
+            for client_id in set(self.severities) - set(records):
+                del self.severities[client_id]
+        else:
+            records = {}
+            for client_id in changed:
+                record = self.store.get(client_id)
+                if record is None:
+                    self._drop(client_id)
+                    self.severities.pop(client_id, None)
+                else:
+                    records[client_id] = record
+
+        if records:
+            for client_id, result in zip(records, self.analyzer.analyze_all_clients(records)):
+                self._drop(client_id)
+                self.results[client_id] = result
+                self.counts[result["severity"]] = self.counts.get(result["severity"], 0) + 1
+                old_severity = self.severities.get(client_id)
+                if old_severity != result["severity"]:
+                    self.severities[client_id] = result["severity"]
+                    if self.on_severity_change:
+                        self.on_severity_change(result, old_severity)
+
+        self._store_version = version
+        self._generation = self.analyzer.generation
+
+    def _drop(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """Forget a client's result and its contribution to the counters (lock held)"""
+        old = self.results.pop(client_id, None)
+        if old is not None:
+            self.counts[old["severity"]] -= 1
+        return old
+
+
+class EventSubscriber:
+    """One stream consumer: a bounded event queue that drops the oldest entries when full"""
+
+    def __init__(self, topics: set, max_queue: int):
+        self.topics = topics
+        self.queue = deque(maxlen=max_queue)
+        self.lagged = False
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def close(self):
+        """Wake the stream and make it finish"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def push(self, event: Tuple[str, Any]):
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                # Slow consumer: lose the oldest event and tell it to resync
+                self.lagged = True
+            self.queue.append(event)
+            self.cond.notify()
+
+    def pop_all(self, timeout: float) -> Tuple[List[Tuple[str, Any]], bool]:
+        """Wait up to timeout for events; returns (events, lagged)"""
+        with self.cond:
+            if not self.queue and not self.closed:
+                self.cond.wait(timeout)
+            events = list(self.queue)
+            self.queue.clear()
+            lagged, self.lagged = self.lagged, False
+            return events, lagged
+
+
+class EventBroker:
+    """Fan-out of live updates to dashboard streams; publishing never blocks"""
+
+    TOPICS = ("clients", "devices", "vulnerabilities", "system")
+
+    def __init__(self, max_queue: int = 1000):
+        self.max_queue = max_queue
+        self.closed = False
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics: List[str]) -> EventSubscriber:
+        subscriber = EventSubscriber(set(topics), self.max_queue)
+        with self._lock:
+            if self.closed:
+                subscriber.close()
+            else:
+                self._subscribers = self._subscribers + [subscriber]
+        return subscriber
+
+    def close(self):
+        """End every open stream (server shutdown)"""
+        with self._lock:
+            self.closed = True
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not subscriber]
+
+    def has_subscribers(self, topic: str) -> bool:
+        return any(topic in s.topics for s in self._subscribers)
+
+    def publish(self, topic: str, data: Any):
+        """Queue an event for every subscriber of the topic"""
+        # Copy-on-write subscriber list: iterate without holding the lock
+        for subscriber in self._subscribers:
+            if topic in subscriber.topics:
+                subscriber.push((topic, data))
+
+    def stream(self, subscriber: EventSubscriber, heartbeat: float = 15.0):
+        """Yield Server-Sent Events for a subscriber until the client disconnects"""
+        try:
+            yield "retry: 3000\n\n"
+            while not subscriber.closed:
+                events, lagged = subscriber.pop_all(heartbeat)
+                if lagged:
+                    yield "event: resync\ndata: {}\n\n"
+                for topic, data in events:
+                    yield "event: {}\ndata: {}\n\n".format(topic, json.dumps(data, separators=(",", ":")))
+                if not events and not lagged and not subscriber.closed:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class FederationAggregator:
+    """Pulls compact summaries from child agents and merges them into one view
+
+    Children are polled in parallel by a background thread; each one has its
+    own timeout, and a child that does not answer keeps its last known summary
+    (marked stale) so the district view never waits on a slow building.
+    Device lists travel as deltas against the version the parent last saw.
+    """
+
+    def __init__(self, children: List[str], timeout: float = 3.0, poll_interval: float = 15.0):
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.children = [{
+            "url": url.rstrip("/"),
+            "name": url,
+            "status": "unknown",
+            "summary": None,
+            "fetchedAt": None,
+            "error": None,
+            "instance": None,
+            "deviceVersion": 0,
+            "devices": {}
+        } for url in children]
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(32, len(children))),
+                                        thread_name_prefix="federation") if children else None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the poller thread (idempotent, no-op without children)"""
+        with self._lock:
+            if self._thread is None and self.children:
+                self._thread = threading.Thread(target=self._run, name="federation", daemon=True)
+                self._thread.start()
+
+    def refresh(self):
+        """Poll every child once, in parallel; concurrent callers share one round"""
+        if not self.children:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            # A round is already running - wait for it instead of starting another
+            with self._refresh_lock:
+                return
+        try:
+            futures = [self._pool.submit(self._fetch, child) for child in self.children]
+            wait_futures(futures, timeout=self.timeout + 1)
+        finally:
+            self._refresh_lock.release()
+
+    def view(self, include_devices: bool = False) -> List[Dict[str, Any]]:
+        """Cached state of every child"""
+        now = time.time()
+        result = []
+        with self._lock:
+            for child in self.children:
+                entry = {
+                    "url": child["url"],
+                    "name": child["name"],
+                    "status": child["status"],
+                    "error": child["error"],
+                    "ageSeconds": round(now - child["fetchedAt"], 1) if child["fetchedAt"] else None,
+                    "summary": child["summary"]
+                }
+                if include_devices:
+                    entry["devices"] = list(child["devices"].values())
+                result.append(entry)
+        return result
+
+    def totals(self) -> Dict[str, Any]:
+        """Sum of the subtree totals reported by every child (last known values)"""
+        totals = self.empty_totals()
+        with self._lock:
+            for child in self.children:
+                if child["summary"] is None:
+                    totals["unreachable"] += 1
+                    continue
+                self.add_totals(totals, child["summary"]["totals"])
+                if child["status"] != "ok":
+                    totals["unreachable"] += 1
+        return totals
+
+    @staticmethod
+    def empty_totals() -> Dict[str, Any]:
+        return {"agents": 0, "unreachable": 0, "clients": {}, "severity": {}, "devices": 0}
 
-    def __init__(self):
-        try:
-            self.boot_time = datetime.fromtimestamp(psutil.boot_time()).strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            self.boot_time = "Unknown"
+    @staticmethod
+    def add_totals(totals: Dict[str, Any], other: Dict[str, Any]):
+        totals["agents"] += other.get("agents", 0)
+        totals["unreachable"] += other.get("unreachable", 0)
+        totals["devices"] += other.get("devices", 0)
+        for key in ("clients", "severity"):
+            for name, count in other.get(key, {}).items():
+                totals[key][name] = totals[key].get(name, 0) + count
 
-    def get_system_stats(self) -> Dict[str, Any]:
-        """Collect comprehensive system statistics"""
+    def _fetch(self, child: Dict[str, Any]):
+        """Pull one child's summary and apply its device delta"""
+        with self._lock:
+            query = "since={}&instance={}".format(child["deviceVersion"], child["instance"] or "")
+        url = "{}/api/summary?{}".format(child["url"], query)
         try:
-            # Safely get each stat
-            try:
-                cpu_percent = psutil.cpu_percent(interval=0.5)
-            except:
-                cpu_percent = 0.0
-            
-            try:
-                ram = psutil.virtual_memory()
-            except:
-                ram = None
-            
-            try:
-                if platform.system() == "Windows":
-                    disk = psutil.disk_usage("C:\\")
-                else:
-                    disk = psutil.disk_usage("/")
-            except:
-                disk = None
-            
-            cpu_temp = 0.0
+            req = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                body = response.read()
+                if response.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+            summary = json.loads(body)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            with self._lock:
+                child["status"] = "stale" if child["summary"] is not None else "unreachable"
+                child["error"] = str(e)[:200]
+            logger.warning("Federation child {} unavailable: {}".format(child["url"], str(e)[:100]))
+            return
+
+        delta = summary.pop("devices", {})
+        with self._lock:
+            if delta.get("full") or summary.get("instance") != child["instance"]:
+                child["devices"] = {}
+            for device in delta.get("changes", []):
+                child["devices"][device["id"]] = device
+            for key in delta.get("removed", []):
+                child["devices"].pop(key, None)
+            child["deviceVersion"] = delta.get("version", 0)
+            child["instance"] = summary.get("instance")
+            child["name"] = summary.get("agent", child["url"])
+            child["summary"] = summary
+            child["fetchedAt"] = time.time()
+            child["status"] = "ok"
+            child["error"] = None
+
+    def _run(self):
+        while True:
             try:
-                temps = psutil.sensors_temperatures()
-                if temps and len(temps) > 0:
-                    for name, entries in temps.items():
-                        if entries and len(entries) > 0:
-                            cpu_temp = float(entries[0].current)
-                            break
-            except:
-                cpu_temp = 0.0
+                self.refresh()
+            except Exception as e:
+                logger.error("Federation poll error: {}".format(str(e)))
+            time.sleep(self.poll_interval)
 
-            firewall_status = self._check_firewall()
-            antivirus_status = self._check_antivirus()
-            uptime_str = self._get_uptime()
-            network_io = self._get_network_io()
-            
-            stats = {
-                "name": "Computer",
-                "os": "Windows",
-                "cpu": round(cpu_percent, 1) if cpu_percent else 0.0,
-                "ram": round(ram.percent, 1) if ram else 0.0,
-                "disk": round(disk.percent, 1) if disk else 0.0,
-                "temp": round(cpu_temp, 1) if cpu_temp else 0.0,
-                "bootTime": self.boot_time,
-                "uptime": uptime_str,
-                "firewall": firewall_status,
-                "avStatus": antivirus_status,
-                "processes": 0,
-                "networkIO": network_io
+
+class ScanScheduler:
+    """Runs network scans in a background worker and serves the last result from cache"""
+
+    def __init__(self, scanner: NetworkScanner, interval: float = 600, max_jobs: int = 50):
+        self.scanner = scanner
+        self.interval = interval
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()  # job_id -> job dict, oldest first
+        self.last_result = None
+        self._active = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        with self._cond:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name="scan-scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop scheduling new scans and give a running one a moment to finish"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def request_scan(self, incremental: bool = False) -> Dict[str, Any]:
+        """Queue a scan, or join the one already queued or running"""
+        self.start()
+        with self._cond:
+            if self._active is not None:
+                return dict(self._active)
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "status": "queued",
+                "mode": "incremental" if incremental else "full",
+                "phase": "queued",
+                "progress": 0.0,
+                "createdAt": datetime.now().isoformat(),
+                "startedAt": None,
+                "finishedAt": None,
+                "deviceCount": None,
+                "error": None
             }
-            
-            try:
-                stats["name"] = socket.gethostname()
-            except:
-                pass
-            
-            try:
-                stats["processes"] = len(psutil.pids())
-            except:
-                pass
-            
-            return stats
-        except Exception as e:
-            return self._get_default_stats()
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+            self._active = job
+            self._cond.notify_all()
+            return dict(job)
 
-    def _check_firewall(self) -> str:
-        """Check Windows Firewall status"""
-        try:
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["powershell", "-Command", 
-                     "(Get-NetFirewallProfile -Profile Domain | Select-Object -ExpandProperty Enabled)"],
-                    capture_output=True, text=True, timeout=3
-                )
-                if result.returncode == 0 and "True" in result.stdout:
-                    return "Enabled"
-                else:
-                    return "Disabled"
-            return "Unknown"
-        except:
-            return "Unknown"
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of a job, or None if unknown"""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
 
-    def _check_antivirus(self) -> str:
-        """Check Antivirus status"""
-        try:
-            if platform.system() == "Windows":
-                result = subprocess.run(
-                    ["powershell", "-Command", 
-                     "(Get-MpComputerStatus | Select-Object -ExpandProperty AntivirusEnabled)"],
-                    capture_output=True, text=True, timeout=3
-                )
-                if result.returncode == 0 and "True" in result.stdout:
-                    return "Active"
-                else:
-                    return "Disabled"
-            return "Unknown"
-        except:
-            return "Unknown"
+    def active_job(self) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the queued/running job, if any"""
+        with self._cond:
+            return dict(self._active) if self._active else None
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Block until the job finishes or timeout elapses"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] in ("completed", "failed"):
+                    return dict(job) if job else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return dict(job)
+                self._cond.wait(remaining)
+
+    def _run(self):
+        """Worker loop: run on-demand jobs, or a periodic one when the interval elapses"""
+        while True:
+            with self._cond:
+                if self._active is None and not self._stopping:
+                    self._cond.wait(self.interval if self.interval > 0 else None)
+                if self._stopping:
+                    return
+                job = self._active
+            if job is None:
+                # Periodic refresh: queue a job the same way an API call would
+                self.request_scan(incremental=True)
+                continue
+            self._execute(job)
+
+    def _execute(self, job: Dict[str, Any]):
+        """Run one scan job and publish its result"""
+        def on_progress(phase: str, fraction: float):
+            with self._cond:
+                job["phase"] = phase
+                job["progress"] = round(fraction, 2)
+                self._cond.notify_all()
+
+        with self._cond:
+            job["status"] = "running"
+            job["startedAt"] = datetime.now().isoformat()
 
-    def _get_network_io(self) -> Dict[str, float]:
-        """Get network I/O statistics"""
         try:
-            io = psutil.net_io_counters()
-            return {
-                "bytesSent": round(io.bytes_sent / 1024 / 1024, 2),
-                "bytesRecv": round(io.bytes_recv / 1024 / 1024, 2),
-                "packetsSent": io.packets_sent,
-                "packetsRecv": io.packets_recv
+            devices = self.scanner.scan_network(progress=on_progress,
+                                                incremental=job["mode"] == "incremental")
+            # scan_network returns live inventory records; cache copies that are safe to serialise
+            devices = self.scanner.inventory.copy_records(devices)
+            result = {
+                "timestamp": datetime.now().isoformat(),
+                "version": self.scanner.inventory.version,
+                "deviceCount": len(devices),
+                "devices": devices
             }
-        except:
-            return {"bytesSent": 0, "bytesRecv": 0, "packetsSent": 0, "packetsRecv": 0}
+            with self._cond:
+                self.last_result = result
+                job["status"] = "completed"
+                job["deviceCount"] = len(devices)
+        except Exception as e:
+            logger.error("Scan job {} failed: {}".format(job["id"], str(e)))
+            with self._cond:
+                job["status"] = "failed"
+                job["error"] = str(e)
 
-    def _get_uptime(self) -> str:
-        """Get system uptime as human-readable string"""
-        try:
-            uptime_seconds = int(datetime.now().timestamp() - psutil.boot_time())
-            days = uptime_seconds // 86400
-            hours = (uptime_seconds % 86400) // 3600
-            minutes = (uptime_seconds % 3600) // 60
-            return "{}d {}h {}m".format(days, hours, minutes)
-        except:
-            return "Unknown"
+        with self._cond:
+            job["phase"] = "done"
+            job["progress"] = 1.0
+            job["finishedAt"] = datetime.now().isoformat()
+            self._active = None
+            self._cond.notify_all()
 
-    def _get_default_stats(self) -> Dict[str, Any]:
-        """Return default stats if monitoring fails"""
-        return {
-            "name": "Computer",
-            "os": "Windows",
-            "cpu": 0,
-            "ram": 0,
-            "disk": 0,
-            "temp": 0,
-            "bootTime": "Unknown",
-            "uptime": "Unknown",
-            "firewall": "Unknown",
-            "avStatus": "Unknown",
-            "processes": 0,
-            "networkIO": {"bytesSent": 0, "bytesRecv": 0, "packetsSent": 0, "packetsRecv": 0}
-        }
 
+class StateStore:
+    """SQLite (WAL) persistence for clients, devices and vulnerability history
+
+    Callers only queue writes. A single writer thread coalesces them (the
+    latest record per client/device wins) and commits each batch in one
+    transaction, so thousands of updates per minute cost one fsync per batch.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS clients ("
+        " client_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS devices ("
+        " id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS vulnerability_history ("
+        " id INTEGER PRIMARY KEY AUTOINCREMENT, client_id TEXT NOT NULL, timestamp REAL NOT NULL,"
+        " severity TEXT NOT NULL, previous_severity TEXT, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_clients_updated ON clients (updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_vuln_client_time ON vulnerability_history (client_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_vuln_time ON vulnerability_history (timestamp)",
+    )
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 5000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._clients = {}  # client_id -> record, or None to delete
+        self._devices = {}  # device id -> record, or None to delete
+        self._history = []  # (client_id, timestamp, severity, previous, data)
+        self._cond = threading.Condition()  # guards the pending batch
+        self._db_lock = threading.Lock()  # serializes database access
+        self._closed = False
+        self.commits = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commits are durable against crashes, fsync happens at checkpoints
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def put_client(self, client_id: str, record: Dict[str, Any]):
+        self._queue(self._clients, client_id, record)
+
+    def delete_client(self, client_id: str):
+        self._queue(self._clients, client_id, None)
+
+    def put_device(self, record: Dict[str, Any]):
+        if record.get("removed"):
+            self._queue(self._devices, record["id"], None)
+        else:
+            self._queue(self._devices, record["id"], record)
+
+    def add_vulnerability(self, result: Dict[str, Any], previous: Optional[str] = None):
+        """Append a severity change to the client's vulnerability history"""
+        with self._cond:
+            self._history.append((result["client_id"], time.time(), result["severity"], previous,
+                                  json.dumps(result, separators=(",", ":"))))
+            if len(self._history) >= self.max_batch:
+                self._cond.notify()
+
+    def _queue(self, pending: Dict[str, Any], key: str, record: Optional[Dict[str, Any]]):
+        with self._cond:
+            pending[key] = record
+            if len(pending) >= self.max_batch:
+                self._cond.notify()
+
+    def load_clients(self) -> Dict[str, Dict[str, Any]]:
+        with self._db_lock:
+            rows = self._db.execute("SELECT client_id, data FROM clients").fetchall()
+        return {client_id: json.loads(data) for client_id, data in rows}
+
+    def load_devices(self) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            rows = self._db.execute("SELECT data FROM devices").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def latest_severities(self) -> Dict[str, str]:
+        """Most recently recorded severity of every client in the history"""
+        with self._db_lock:
+            # SQLite returns the bare severity column from the row holding MAX(id)
+            rows = self._db.execute(
+                "SELECT client_id, severity, MAX(id) FROM vulnerability_history GROUP BY client_id").fetchall()
+        return {client_id: severity for client_id, severity, _ in rows}
+
+    def vulnerability_history(self, client_id: str, start: float = 0, end: Optional[float] = None,
+                              limit: int = 500) -> List[Dict[str, Any]]:
+        """Severity changes of one client, newest first (pending writes are flushed first)"""
+        self.flush()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT timestamp, severity, previous_severity, data FROM vulnerability_history"
+                " WHERE client_id = ? AND timestamp >= ? AND timestamp <= ?"
+                " ORDER BY timestamp DESC LIMIT ?",
+                (client_id, start, end if end is not None else time.time(), limit)).fetchall()
+        return [{"timestamp": ts, "severity": severity, "previousSeverity": previous,
+                 "vulnerabilities": json.loads(data).get("vulnerabilities", [])}
+                for ts, severity, previous, data in rows]
+
+    def flush(self):
+        """Write everything queued so far (group commit)"""
+        # Writers keep queueing while the batch is committed; only the swap blocks them
+        with self._db_lock:
+            with self._cond:
+                clients, self._clients = self._clients, {}
+                devices, self._devices = self._devices, {}
+                history, self._history = self._history, []
+            if not (clients or devices or history):
+                return
+            now = time.time()
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO clients (client_id, data, updated_at) VALUES (?, ?, ?)",
+                        [(k, json.dumps(v, separators=(",", ":")), now) for k, v in clients.items() if v is not None])
+                    self._db.executemany("DELETE FROM clients WHERE client_id = ?",
+                                         [(k,) for k, v in clients.items() if v is None])
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO devices (id, data, updated_at) VALUES (?, ?, ?)",
+                        [(k, json.dumps(v, separators=(",", ":")), now) for k, v in devices.items() if v is not None])
+                    self._db.executemany("DELETE FROM devices WHERE id = ?",
+                                         [(k,) for k, v in devices.items() if v is None])
+                    self._db.executemany(
+                        "INSERT INTO vulnerability_history (client_id, timestamp, severity, previous_severity, data)"
+                        " VALUES (?, ?, ?, ?, ?)", history)
+                self.commits += 1
+            except sqlite3.Error as e:
+                logger.error("State store write failed ({} clients, {} devices): {}".format(
+                    len(clients), len(devices), str(e)))
+
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(5)
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
 
-class VulnerabilityAnalyzer:
-    """Analyze vulnerabilities in connected systems with predefined recommendations"""
-    
-    # Predefined vulnerability database with Russian recommendations
-    VULNERABILITY_DATABASE = {
-        "high_cpu": {
-            "type": "Производительность",
-            "severity": "High",
-            "description": "Высокое использование процессора ({}%)",
-            "recommendation": "Завершите неиспользуемые приложения. Проверьте наличие вредоноса или служб фоновой работы. Рассмотрите обновление оборудования."
-        },
-        "critical_cpu": {
-            "type": "Производительность",
-            "severity": "Critical",
-            "description": "Критическое использование процессора ({}%)",
-            "recommendation": "Немедленно завершите неиспользуемые приложения. Проверьте наличие вредоноса. При необходимости перезагрузитесь."
-        },
-        "high_ram": {
-            "type": "Память",
-            "severity": "High",
-            "description": "Критическое использование оперативной памяти ({}%)",
-            "recommendation": "Увеличьте объём ОЗУ или закройте ненужные программы. Проверьте утечки памяти в запущенных приложениях."
-        },
-        "medium_ram": {
-            "type": "Память",
-            "severity": "Medium",
-            "description": "Высокое использование оперативной памяти ({}%)",
-            "recommendation": "Следите за использованием памяти. Закройте ненужные вкладки браузера и приложения."
-        },
-        "high_disk": {
-            "type": "Хранилище",
-            "severity": "High",
-            "description": "Критическое использование дискового пространства ({}% занято)",
-            "recommendation": "Немедленно освободите место на диске. Удалите временные файлы, старые логи и ненужные программы."
-        },
-        "medium_disk": {
-            "type": "Хранилище",
-            "severity": "Medium",
-            "description": "Низкое дисковое пространство ({}% занято)",
-            "recommendation": "Освободите место на диске. Используйте встроенную утилиту очистки диска или удалите старые файлы."
-        },
-        "firewall_disabled": {
-            "type": "Безопасность",
-            "severity": "Critical",
-            "description": "Брандмауэр Windows отключён",
-            "recommendation": "Немедленно включите брандмауэр Windows. Перейдите в параметры безопасности > Брандмауэр и защита сети."
-        },
-        "antivirus_disabled": {
-            "type": "Безопасность",
-            "severity": "Critical",
-            "description": "Антивирус отключён или отсутствует",
-            "recommendation": "Установите и включите антивирусную программу. Рекомендуется Windows Defender или Kaspersky. Выполните полное сканирование."
-        },
-        "high_temp": {
-            "type": "Оборудование",
-            "severity": "High",
-            "description": "Критическая температура процессора ({}°C)",
-            "recommendation": "Проверьте систему охлаждения. Очистите воздуховоды от пыли. Переустановите термопасту. Если проблема сохранится, обратитесь в IT-отдел."
-        },
-        "medium_temp": {
-            "type": "Оборудование",
-            "severity": "Medium",
-            "description": "Повышенная температура процессора ({}°C)",
-            "recommendation": "Следите за температурой. Убедитесь, что воздухозаборы процессора не заблокированы."
-        },
-        "outdated_windows": {
-            "type": "Обновления",
-            "severity": "High",
-            "description": "Windows не обновлён",
-            "recommendation": "Установите все доступные обновления Windows. Перейдите в параметры > Обновление и безопасность > Windows Update."
-        },
-        "no_backup": {
-            "type": "Резервное копирование",
-            "severity": "Medium",
-            "description": "Резервные копии не настроены",
-            "recommendation": "Включите резервное копирование файлов. Используйте Windows Backup или облачные сервисы (OneDrive, Google Drive)."
-        }
-    }
-    
-    @staticmethod
-    def analyze_client(client_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze vulnerabilities in a single client with predefined recommendations"""
-        vulnerabilities = []
-        severity = "Low"
-        
-        # Check CPU
-        cpu = client_data.get("cpu", 0)
-        if cpu > 90:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["critical_cpu"].copy()
-            vuln["description"] = vuln["description"].format(int(cpu))
-            vulnerabilities.append(vuln)
-            severity = "Critical"
-        elif cpu > 75:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["high_cpu"].copy()
-            vuln["description"] = vuln["description"].format(int(cpu))
-            vulnerabilities.append(vuln)
-            if severity != "Critical":
-                severity = "High"
-        
-        # Check RAM
-        ram = client_data.get("ram", 0)
-        if ram > 90:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["high_ram"].copy()
-            vuln["description"] = vuln["description"].format(int(ram))
-            vulnerabilities.append(vuln)
-            if severity == "Low" or severity == "Medium":
-                severity = "High"
-        elif ram > 80:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["medium_ram"].copy()
-            vuln["description"] = vuln["description"].format(int(ram))
-            vulnerabilities.append(vuln)
-            if severity == "Low":
-                severity = "Medium"
-        
-        # Check Disk
-        disk = client_data.get("disk", 0)
-        if disk > 95:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["high_disk"].copy()
-            vuln["description"] = vuln["description"].format(int(disk))
-            vulnerabilities.append(vuln)
-            if severity == "Low" or severity == "Medium":
-                severity = "High"
-        elif disk > 85:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["medium_disk"].copy()
-            vuln["description"] = vuln["description"].format(int(disk))
-            vulnerabilities.append(vuln)
-            if severity == "Low":
-                severity = "Medium"
-        
-        # Check Security
-        firewall = client_data.get("firewall", "Unknown").lower()
-        av_status = client_data.get("avStatus", "Unknown").lower()
-        
-        if "disabled" in firewall:
-            vulnerabilities.append(VulnerabilityAnalyzer.VULNERABILITY_DATABASE["firewall_disabled"].copy())
-            severity = "Critical"
-        
-        if "disabled" in av_status or "unknown" in av_status:
-            vulnerabilities.append(VulnerabilityAnalyzer.VULNERABILITY_DATABASE["antivirus_disabled"].copy())
-            if severity != "Critical":
-                severity = "Critical"
-        
-        # Check Temperature
-        temp = client_data.get("temp", 0)
-        if temp > 85:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["high_temp"].copy()
-            vuln["description"] = vuln["description"].format(int(temp))
-            vulnerabilities.append(vuln)
-            if severity == "Low" or severity == "Medium":
-                severity = "High"
-        elif temp > 75:
-            vuln = VulnerabilityAnalyzer.VULNERABILITY_DATABASE["medium_temp"].copy()
-            vuln["description"] = vuln["description"].format(int(temp))
-            vulnerabilities.append(vuln)
-            if severity == "Low":
-                severity = "Medium"
-        
-        # If no vulnerabilities, mark as secure
-        if not vulnerabilities:
-            vulnerabilities = [{
-                "type": "Статус",
-                "description": "Система здорова и защищена",
-                "severity": "None",
-                "recommendation": "Продолжайте регулярный мониторинг. Выполняйте еженедельные проверки безопасности."
-            }]
-            severity = "Low"
-        
-        return {
-            "client_id": client_data.get("client_id"),
-            "hostname": client_data.get("hostname"),
-            "severity": severity,
-            "count": len([v for v in vulnerabilities if v.get("severity") != "None"]),
-            "vulnerabilities": vulnerabilities,
-            "timestamp": datetime.now().isoformat()
-        }
-    
-    @staticmethod
-    def analyze_all_clients(clients: Dict[str, Dict]) -> List[Dict[str, Any]]:
-        """Analyze all connected clients"""
-        results = []
-        for client_id, client_data in clients.items():
-            analysis = VulnerabilityAnalyzer.analyze_client(client_data)
-            results.append(analysis)
-        return results
 
+# Serving configuration
+SERVER_MODE = os.environ.get("CYBERSHIELD_SERVER", "waitress")  # "waitress" or "dev"
+SERVER_HOST = os.environ.get("CYBERSHIELD_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("CYBERSHIELD_PORT", "5000"))
+SERVER_THREADS = int(os.environ.get("CYBERSHIELD_THREADS", "32"))
+SERVER_CONNECTION_LIMIT = int(os.environ.get("CYBERSHIELD_CONNECTION_LIMIT", "1000"))
+# Clients that do not declare their report interval are expected every CLIENT_INTERVAL seconds
+CLIENT_INTERVAL = float(os.environ.get("CYBERSHIELD_CLIENT_INTERVAL", "60"))
+CLIENT_EXPIRE_DAYS = float(os.environ.get("CYBERSHIELD_CLIENT_EXPIRE_DAYS", "7"))
+# Federation: this agent's name in a parent's view, and the child agents it aggregates
+AGENT_NAME = os.environ.get("CYBERSHIELD_AGENT_NAME", socket.gethostname())
+FEDERATION_CHILDREN = [u.strip() for u in os.environ.get("CYBERSHIELD_CHILDREN", "").split(",") if u.strip()]
+# Passive discovery (CYBERSHIELD_PASSIVE=1) keeps the inventory current, so sweeps run hourly by default
+PASSIVE_MODE = os.environ.get("CYBERSHIELD_PASSIVE") == "1"
+PASSIVE_IFACES = [i.strip() for i in os.environ.get("CYBERSHIELD_PASSIVE_IFACES", "").split(",") if i.strip()]
+SCAN_INTERVAL = float(os.environ.get("CYBERSHIELD_SCAN_INTERVAL", "3600" if PASSIVE_MODE else "600"))
+# SQLite state file; an empty value keeps all state in memory only
+STATE_DB = os.environ.get("CYBERSHIELD_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "data", "cybershield.db"))
 
 # Initialize components
-scanner = NetworkScanner()
-monitor = SystemMonitor()
+# Slow, blocking work (WiFi scans) runs here, never on request threads
+blocking_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("CYBERSHIELD_BLOCKING_WORKERS", "2")),
+                                   thread_name_prefix="blocking")
+# Long-lived requests (SSE streams, scan long-polls) may hold at most half of the request threads
+long_request_slots = threading.BoundedSemaphore(max(1, SERVER_THREADS // 2))
+_wifi_lock = threading.Lock()
+_wifi_future = None
 vulnerability_analyzer = VulnerabilityAnalyzer()
-connected_clients = {}  # Store data from connected clients
+scanner = NetworkScanner(analyzer=vulnerability_analyzer)
+scan_scheduler = ScanScheduler(scanner, interval=SCAN_INTERVAL)
+passive_discovery = PassiveDiscovery(scanner, ifaces=PASSIVE_IFACES) if PASSIVE_MODE else None
+monitor = SystemMonitor()
+client_store = ClientStore()  # Store data from connected clients
+metrics_store = MetricsStore()  # Per-client telemetry history
+telemetry_ingestor = TelemetryIngestor()
+federation = FederationAggregator(FEDERATION_CHILDREN,
+                                  timeout=float(os.environ.get("CYBERSHIELD_CHILD_TIMEOUT", "3")))
+AGENT_INSTANCE = uuid.uuid4().hex[:12]  # lets parents notice a restart and resync device deltas
+event_broker = EventBroker()
+state_store = None  # opened by open_state_store() when the agent starts, not at import
+
+
+def _on_severity_change(result: Dict[str, Any], old: Optional[str]):
+    event_broker.publish("vulnerabilities", dict(result, previousSeverity=old))
+    if state_store is not None:
+        state_store.add_vulnerability(result, old)
+
+
+vulnerability_cache = VulnerabilityCache(vulnerability_analyzer, client_store,
+                                         on_severity_change=_on_severity_change)
+
+
+def _reported_before(record: "ClientRecord", seen_at: float) -> bool:
+    """True unless the record holds a report newer than seen_at"""
+    try:
+        # lastSeen has microsecond resolution; allow for the float round trip
+        return datetime.fromisoformat(record.lastSeen).timestamp() <= seen_at + 0.001
+    except (TypeError, ValueError):
+        return True
+
+
+def _on_client_status(client_id: str, old: str, new: str, seen_at: float):
+    # A report that landed after the deadline fired must not be overwritten with Stale/Offline
+    record = client_store.update_if(client_id, {"status": new}, lambda r: _reported_before(r, seen_at))
+    if record is None:
+        return
+    event_broker.publish("clients", dict(record, previousStatus=old))
+    if state_store is not None:
+        state_store.put_client(client_id, record)
+
+
+def _on_client_expire(client_id: str):
+    client_store.remove(client_id)
+    metrics_store.remove(client_id)
+    telemetry_ingestor.forget(client_id)
+    event_broker.publish("clients", {"client_id": client_id, "removed": True})
+    if state_store is not None:
+        state_store.delete_client(client_id)
+
+
+client_liveness = ClientLiveness(default_interval=CLIENT_INTERVAL, expire_after=CLIENT_EXPIRE_DAYS * 86400,
+                                 on_transition=_on_client_status, on_expire=_on_client_expire)
+scanner.inventory.listeners.append(lambda record: event_broker.publish("devices", record))
+
+
+def open_state_store(path: str = STATE_DB):
+    """Open the SQLite state file, restore clients, devices and severities, and persist changes from now on"""
+    global state_store
+    if not path or state_store is not None:
+        return
+    state_store = StateStore(path)
+    client_store.load(state_store.load_clients())
+    # Restored clients are re-judged from their last report once the liveness worker starts
+    for client_id, record in client_store.snapshot().items():
+        try:
+            seen_at = datetime.fromisoformat(record["lastSeen"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            seen_at = time.time()
+        client_liveness.touch(client_id, seen_at, record.get("reportInterval"))
+    vulnerability_cache.seed(state_store.latest_severities())
+    scanner.inventory.load(state_store.load_devices())
+    scanner.inventory.listeners.append(state_store.put_device)
+    scanner.inventory.seen_listeners.append(state_store.put_device)
+    logger.info("Restored {} clients and {} devices from {}".format(
+        len(client_store), len(scanner.inventory.known_ips()), path))
+
+
+def _event_pump(interval: float = 2.0):
+    """Push periodic system stats and severity changes while anyone is listening"""
+    while True:
+        time.sleep(interval)
+        try:
+            # Severity changes are recorded as they happen, not only when someone polls for them
+            if state_store is not None or event_broker.has_subscribers("vulnerabilities"):
+                vulnerability_cache.update()
+            if event_broker.has_subscribers("system"):
+                event_broker.publish("system", monitor.get_system_stats())
+        except Exception as e:
+            logger.error("Event pump error: {}".format(str(e)))
 
 
 @app.route("/api/system", methods=["GET"])
@@ -751,25 +3702,85 @@ def api_system():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/api/system/posture", methods=["GET", "POST"])
+def api_system_posture():
+    """Cached firewall/antivirus checks; POST re-runs them ahead of schedule"""
+    if request.method == "POST":
+        monitor.posture.refresh(request.args.get("check"))
+        return jsonify({"status": "refreshing"}), 202
+    return jsonify(monitor.posture.status()), 200
+
+
 @app.route("/api/scan", methods=["POST", "GET"])
 def api_scan():
-    """Network scan endpoint"""
+    """Network scan endpoint - returns the last completed scan from cache
+
+    With ?since=<version> only inventory changes after that version are returned.
+    """
     try:
-        devices = scanner.scan_network()
-        return jsonify({
-            "timestamp": datetime.now().isoformat(),
-            "deviceCount": len(devices),
-            "devices": devices
-        }), 200
+        wait = min(float(request.args.get("wait", 0)), 300.0)
+        since = request.args.get("since")
+        since = int(since) if since is not None else None
+    except ValueError:
+        return jsonify({"error": "wait must be a number and since an integer version"}), 400
+
+    try:
+        job = scan_scheduler.active_job()
+        refresh = request.method == "POST" or request.args.get("refresh") == "1"
+        if refresh or scan_scheduler.last_result is None:
+            job = scan_scheduler.request_scan()
+
+        # Without a free long-request slot answer at once; the caller can poll the job
+        if job and wait > 0 and long_request_slots.acquire(blocking=False):
+            try:
+                job = scan_scheduler.wait(job["id"], wait)
+            finally:
+                long_request_slots.release()
+
+        if since is not None:
+            delta = scanner.inventory.changes_since(since)
+            return jsonify(dict(delta, timestamp=datetime.now().isoformat(), job=job)), 200
+
+        result = scan_scheduler.last_result or {
+            "timestamp": None,
+            "deviceCount": 0,
+            "devices": []
+        }
+        return jsonify(dict(result, job=job)), 200
+    except Exception as e:
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route("/api/scan/jobs", methods=["POST"])
+def api_scan_jobs_create():
+    """Start a network scan job (joins the in-flight one if present)"""
+    try:
+        job = scan_scheduler.request_scan()
+        return jsonify(job), 202
     except Exception as e:
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/api/scan/jobs/<job_id>", methods=["GET"])
+def api_scan_jobs_status(job_id):
+    """Scan job progress and status"""
+    job = scan_scheduler.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
 @app.route("/api/wifi", methods=["GET"])
 def api_wifi():
     """WiFi networks scan endpoint"""
+    global _wifi_future
     try:
-        networks = scanner.scan_wifi()
+        # Concurrent requests share one scan running in the blocking pool
+        with _wifi_lock:
+            if _wifi_future is None or _wifi_future.done():
+                _wifi_future = blocking_pool.submit(scanner.scan_wifi)
+            future = _wifi_future
+        networks = future.result(timeout=30)
         return jsonify({
             "timestamp": datetime.now().isoformat(),
             "networkCount": len(networks),
@@ -786,13 +3797,19 @@ def api_clients_register():
         data = request.json
         client_id = data.get("client_id") or data.get("hostname", "Unknown")
         
-        connected_clients[client_id] = {
+        record = client_store.register(client_id, {
             "hostname": data.get("hostname", "Unknown"),
             "ip": data.get("ip", "0.0.0.0"),
             "os": data.get("os", "Unknown"),
             "lastSeen": datetime.now().isoformat(),
-            "status": "Online"
-        }
+            "status": "Online",
+            "reportInterval": float(data.get("reportInterval") or CLIENT_INTERVAL)
+        })
+        client_liveness.touch(client_id, interval=record["reportInterval"])
+        if event_broker.has_subscribers("clients"):
+            event_broker.publish("clients", record)
+        if state_store is not None:
+            state_store.put_client(client_id, record)
         
         logger.info("Client registered: {}".format(client_id))
         return jsonify({"status": "registered", "client_id": client_id}), 200
@@ -800,6 +3817,43 @@ def api_clients_register():
         return jsonify({"error": "Registration failed"}), 500
 
 
+def _apply_client_update(client_id: str, data: Dict[str, Any], timestamp: Optional[float] = None,
+                         history_only: bool = False):
+    """Store one telemetry sample for a client, registering it if needed"""
+    timestamp = timestamp or time.time()
+    if history_only:
+        metrics_store.record(client_id, timestamp, data)
+        return
+    # Update only metrics, don't change IP/hostname/OS of a registered client
+    record, created = client_store.update(client_id, {
+        "cpu": data.get("cpu", 0),
+        "ram": data.get("ram", 0),
+        "disk": data.get("disk", 0),
+        "temp": data.get("temp", 0),
+        "processes": data.get("processes", 0),
+        "firewall": data.get("firewall", "Unknown"),
+        "avStatus": data.get("avStatus", "Unknown"),
+        "lastSeen": datetime.fromtimestamp(timestamp).isoformat(),
+        "uptime": data.get("uptime", "Unknown"),
+        "status": "Online"
+    }, defaults={
+        "hostname": data.get("hostname", "Unknown"),
+        "ip": data.get("ip", "0.0.0.0"),
+        "os": data.get("os", "Unknown"),
+        "reportInterval": CLIENT_INTERVAL
+    })
+    if created:
+        logger.warning("Client not registered before update, registering now: {}".format(client_id))
+    previous = client_liveness.touch(client_id, timestamp, record.get("reportInterval"))
+    if previous is not None:
+        logger.info("Client {} is back Online (was {})".format(client_id, previous))
+    metrics_store.record(client_id, timestamp, data)
+    if event_broker.has_subscribers("clients"):
+        event_broker.publish("clients", record)
+    if state_store is not None:
+        state_store.put_client(client_id, record)
+
+
 @app.route("/api/clients/update", methods=["POST"])
 def api_clients_update():
     """Update client system data"""
@@ -807,39 +3861,9 @@ def api_clients_update():
         data = request.json
         client_id = data.get("client_id", "Unknown")
         
-        if client_id in connected_clients:
-            # Update only metrics, don't change IP/hostname/OS
-            connected_clients[client_id].update({
-                "cpu": data.get("cpu", 0),
-                "ram": data.get("ram", 0),
-                "disk": data.get("disk", 0),
-                "temp": data.get("temp", 0),
-                "processes": data.get("processes", 0),
-                "firewall": data.get("firewall", "Unknown"),
-                "avStatus": data.get("avStatus", "Unknown"),
-                "lastSeen": datetime.now().isoformat(),
-                "uptime": data.get("uptime", "Unknown")
-            })
-        else:
-            # Client not registered, register it now
-            client_ip = data.get("ip", "0.0.0.0")
-            logger.warning("Client not registered before update, registering now: {}".format(client_id))
-            connected_clients[client_id] = {
-                "client_id": client_id,
-                "hostname": data.get("hostname", "Unknown"),
-                "ip": client_ip,
-                "os": data.get("os", "Unknown"),
-                "cpu": data.get("cpu", 0),
-                "ram": data.get("ram", 0),
-                "disk": data.get("disk", 0),
-                "temp": data.get("temp", 0),
-                "processes": data.get("processes", 0),
-                "firewall": data.get("firewall", "Unknown"),
-                "avStatus": data.get("avStatus", "Unknown"),
-                "lastSeen": datetime.now().isoformat(),
-                "status": "Online",
-                "uptime": data.get("uptime", "Unknown")
-            }
+        now = time.time()
+        _apply_client_update(client_id, data, now)
+        telemetry_ingestor.note_live(client_id, now)
         
         logger.info("Client updated: {} - CPU={}%, RAM={}%, Disk={}%".format(
             client_id, 
@@ -853,11 +3877,47 @@ def api_clients_update():
         return jsonify({"error": "Update failed"}), 500
 
 
+@app.route("/api/clients/ingest", methods=["POST"])
+def api_clients_ingest():
+    """Batched, delta-encoded, optionally gzip/zstd-compressed client telemetry"""
+    try:
+        payload = TelemetryIngestor.decode_body(request.get_data(), request.headers.get("Content-Encoding"))
+        accepted, ack = telemetry_ingestor.ingest(payload, _apply_client_update)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("Ingest failed: {}".format(str(e)))
+        return jsonify({"error": "Ingest failed"}), 500
+
+    if not accepted:
+        return jsonify({"status": "resync"}), 409
+    logger.info("Client batch ingested: {} - {} samples".format(
+        payload.get("client_id"), len(payload.get("samples") or [])))
+    return jsonify({"status": "ok", "ack": ack}), 200
+
+
+@app.route("/api/clients/ingest/bulk", methods=["POST"])
+def api_clients_ingest_bulk():
+    """Idempotent bulk backfill of spooled client samples (full state per sample)"""
+    try:
+        payload = TelemetryIngestor.decode_body(request.get_data(), request.headers.get("Content-Encoding"))
+        applied = telemetry_ingestor.backfill(payload, _apply_client_update)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("Bulk ingest failed: {}".format(str(e)))
+        return jsonify({"error": "Bulk ingest failed"}), 500
+
+    received = len(payload.get("samples") or [])
+    logger.info("Client backfill: {} - {} samples, {} new".format(payload.get("client_id"), received, applied))
+    return jsonify({"status": "ok", "received": received, "applied": applied}), 200
+
+
 @app.route("/api/clients", methods=["GET"])
 def api_clients():
     """Get list of all connected clients"""
     try:
-        clients = list(connected_clients.values())
+        clients = list(client_store.snapshot().values())
         return jsonify({
             "timestamp": datetime.now().isoformat(),
             "clientCount": len(clients),
@@ -867,6 +3927,139 @@ def api_clients():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/api/clients/<client_id>/metrics", methods=["GET"])
+def api_client_metrics(client_id):
+    """Telemetry history for one client
+
+    Query: metric=cpu|ram|disk|temp, from/to as unix seconds (default: last hour),
+    resolution=raw|1m|15m|1h (default: finest available for the range)
+    """
+    try:
+        end = float(request.args.get("to", time.time()))
+        start = float(request.args.get("from", end - 3600))
+        result = metrics_store.query(client_id, request.args.get("metric", "cpu"), start, end,
+                                     request.args.get("resolution"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if result is None:
+        return jsonify({"error": "Client not found"}), 404
+    return jsonify(result), 200
+
+
+@app.route("/api/clients/<client_id>/vulnerabilities", methods=["GET"])
+def api_client_vulnerability_history(client_id):
+    """Severity changes of one client (from/to as unix seconds, newest first)"""
+    if state_store is None:
+        return jsonify({"error": "Persistent storage is disabled"}), 404
+    try:
+        end = float(request.args.get("to", time.time()))
+        start = float(request.args.get("from", 0))
+        limit = min(int(request.args.get("limit", 500)), 5000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    history = state_store.vulnerability_history(client_id, start, end, limit)
+    return jsonify({"client_id": client_id, "count": len(history), "history": history}), 200
+
+
+def _local_summary() -> Dict[str, Any]:
+    """Compact counters for this agent alone"""
+    clients = client_liveness.counts()
+    clients["total"] = len(client_store)
+    return {
+        "clients": clients,
+        "severity": vulnerability_cache.severity_counts(),
+        "devices": len(scanner.inventory.known_ips())
+    }
+
+
+def _subtree_totals(local: Dict[str, Any]) -> Dict[str, Any]:
+    """This agent's counters plus the last known totals of every child subtree"""
+    totals = federation.totals()
+    FederationAggregator.add_totals(totals, {
+        "agents": 1,
+        "clients": {k: v for k, v in local["clients"].items() if k != "total"},
+        "severity": local["severity"],
+        "devices": local["devices"]
+    })
+    return totals
+
+
+@app.route("/api/summary", methods=["GET"])
+def api_summary():
+    """Compact summary for a parent agent: counters, subtree totals and a device delta
+
+    Query: since=<device version the caller has>, instance=<agent instance it came from>
+    """
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return jsonify({"error": "since must be an integer"}), 400
+    if request.args.get("instance") != AGENT_INSTANCE:
+        since = 0  # the caller's device state is from another run of this agent
+    local = _local_summary()
+    totals = _subtree_totals(local)
+    delta = scanner.inventory.changes_since(since)
+    fields = ("id", "ip", "mac", "hostname", "vendor", "type", "status", "lastSeen")
+    delta["changes"] = [{k: d.get(k) for k in fields} for d in delta["changes"]]
+    delta["full"] = delta["full"] or since == 0
+
+    body = json.dumps({
+        "agent": AGENT_NAME,
+        "instance": AGENT_INSTANCE,
+        "timestamp": datetime.now().isoformat(),
+        "local": local,
+        "totals": totals,
+        "devices": delta
+    }, separators=(",", ":")).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if len(body) > 1024 and "gzip" in request.headers.get("Accept-Encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=200, headers=headers)
+
+
+@app.route("/api/federation", methods=["GET"])
+def api_federation():
+    """District view: this agent plus the last known summary of every child agent
+
+    ?refresh=1 polls the children now (in parallel, per-child timeout); ?devices=1 adds their devices.
+    """
+    if request.args.get("refresh") == "1":
+        federation.refresh()
+    local = _local_summary()
+    totals = _subtree_totals(local)
+    return jsonify({
+        "agent": AGENT_NAME,
+        "timestamp": datetime.now().isoformat(),
+        "local": local,
+        "totals": totals,
+        "children": federation.view(include_devices=request.args.get("devices") == "1")
+    }), 200
+
+
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    """Server-Sent Events stream of live updates (?topics=clients,devices,vulnerabilities,system)"""
+    topics = [t for t in request.args.get("topics", ",".join(EventBroker.TOPICS)).split(",") if t]
+    unknown = [t for t in topics if t not in EventBroker.TOPICS]
+    if unknown or not topics:
+        return jsonify({"error": "Unknown topics: {}".format(",".join(unknown)),
+                        "topics": list(EventBroker.TOPICS)}), 400
+    if not long_request_slots.acquire(blocking=False):
+        return jsonify({"error": "Too many open streams"}), 503, {"Retry-After": "30"}
+    subscriber = event_broker.subscribe(topics)
+    response = Response(event_broker.stream(subscriber), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+    @response.call_on_close
+    def release():
+        event_broker.unsubscribe(subscriber)
+        long_request_slots.release()
+    return response
+
+
 @app.route("/api/health", methods=["GET"])
 def api_health():
     """Health check endpoint"""
@@ -881,22 +4074,28 @@ def api_health():
 def api_vulnerabilities():
     """Get vulnerabilities analysis for all connected clients"""
     try:
-        vulnerabilities = vulnerability_analyzer.analyze_all_clients(connected_clients)
-        
-        # Calculate statistics
-        critical_count = sum(1 for v in vulnerabilities if v.get("severity") == "Critical")
-        high_count = sum(1 for v in vulnerabilities if v.get("severity") == "High")
-        medium_count = sum(1 for v in vulnerabilities if v.get("severity") == "Medium")
+        vulnerabilities, counts = vulnerability_cache.refresh()
+        # Findings from service discovery on network devices (empty unless it is enabled)
+        devices = [{
+            "id": d["id"],
+            "ip": d["ip"],
+            "hostname": d.get("hostname"),
+            "type": d.get("type"),
+            "severity": d["severity"],
+            "count": len(d["findings"]),
+            "vulnerabilities": d["findings"]
+        } for d in scanner.inventory.snapshot() if d.get("findings")]
         
         return jsonify({
             "timestamp": datetime.now().isoformat(),
-            "totalClients": len(connected_clients),
+            "totalClients": len(vulnerabilities),
             "vulnerabilityCount": {
-                "critical": critical_count,
-                "high": high_count,
-                "medium": medium_count
+                "critical": counts["Critical"],
+                "high": counts["High"],
+                "medium": counts["Medium"]
             },
-            "details": vulnerabilities
+            "details": vulnerabilities,
+            "devices": devices
         }), 200
     except Exception as e:
         logger.error("Vulnerabilities error: {}".format(str(e)))
@@ -912,15 +4111,74 @@ def index():
         "endpoints": {
             "/api/health": "Health check",
             "/api/system": "System statistics",
-            "/api/scan": "Network scan",
+            "/api/system/posture": "Cached firewall/antivirus checks (POST to refresh)",
+            "/api/scan": "Network scan (cached, ?refresh=1 to rescan, ?wait=N to wait, ?since=V for changes)",
+            "/api/scan/jobs": "Start scan job / job status",
             "/api/wifi": "WiFi networks scan",
             "/api/vulnerabilities": "Vulnerability analysis with recommendations",
             "/api/clients": "Connected clients list",
-            "/api/clients/register": "Register new client"
+            "/api/clients/register": "Register new client",
+            "/api/clients/ingest": "Batched compressed client telemetry",
+            "/api/clients/ingest/bulk": "Idempotent backfill of spooled client telemetry",
+            "/api/clients/<client_id>/metrics": "Client telemetry history (raw, 1m/15m/1h rollups)",
+            "/api/clients/<client_id>/vulnerabilities": "Client vulnerability severity history",
+            "/api/summary": "Compact summary for a parent agent (federation)",
+            "/api/federation": "Aggregated view of this agent and its child agents",
+            "/api/stream": "Live updates via Server-Sent Events (?topics=clients,devices,vulnerabilities,system)"
         }
     }), 200
 
 
+def shutdown():
+    """Stop background work after the server has stopped accepting requests"""
+    logger.info("Shutting down School CyberShield Agent")
+    event_broker.close()
+    scan_scheduler.stop()
+    if passive_discovery is not None:
+        passive_discovery.stop()
+    blocking_pool.shutdown(wait=False, cancel_futures=True)
+    if state_store is not None:
+        state_store.close()
+
+
+def serve():
+    """Run the agent: waitress thread pool in production, Flask dev server otherwise"""
+    def on_signal(signum, frame):
+        # Close SSE streams first so in-flight requests can drain before the pool stops
+        event_broker.close()
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    open_state_store()
+    if passive_discovery is not None:
+        if passive_discovery.start():
+            scanner.passive = passive_discovery
+        elif "CYBERSHIELD_SCAN_INTERVAL" not in os.environ:
+            scan_scheduler.interval = 600.0  # no listener: keep the regular sweep rate
+    scan_scheduler.start()
+    client_liveness.start()
+    federation.start()
+    threading.Thread(target=_event_pump, name="event-pump", daemon=True).start()
+
+    try:
+        if SERVER_MODE == "waitress" and waitress is not None:
+            logger.info("Starting School CyberShield Agent on http://{}:{} (waitress, {} threads)".format(
+                SERVER_HOST, SERVER_PORT, SERVER_THREADS))
+            # run() drains in-flight requests (up to 5 s) when SystemExit reaches it
+            waitress.create_server(app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS,
+                                   connection_limit=SERVER_CONNECTION_LIMIT, channel_timeout=60).run()
+        else:
+            if SERVER_MODE == "waitress":
+                logger.warning("waitress is not installed, falling back to the Flask development server")
+            logger.info("Starting School CyberShield Agent on http://{}:{} (development server)".format(
+                SERVER_HOST, SERVER_PORT))
+            app.run(host=SERVER_HOST, port=SERVER_PORT, debug=False, threaded=True)
+    except SystemExit:
+        pass
+    finally:
+        shutdown()
+
+
 if __name__ == "__main__":
-    logger.info("Starting School CyberShield Agent on http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    serve()
@@ -10,19 +10,58 @@ import subprocess
 import requests
 import time
 import logging
+import gzip
+import json
+import os
+import random
+import uuid
 from datetime import datetime
 import platform
 import sys
+import threading
 
 logging.basicConfig(level=logging.ERROR, handlers=[logging.FileHandler("client_agent.log")])
 logger = logging.getLogger(__name__)
 
 
 class ClientSystemMonitor:
+    # Background sampler state shared by all callers
+    sample_interval = 5
+    _snapshot = None
+    _sampler = None
+    _sampler_lock = threading.Lock()
+    # Firewall/AV checks spawn slow processes; cache them and refresh in the background
+    posture_ttl = 600
+    _posture = {}
+    _posture_thread = None
+    _posture_wake = threading.Event()
+    
+    @classmethod
+    def start_sampler(cls):
+        """Sample metrics in a background thread so get_system_stats() never blocks"""
+        with cls._sampler_lock:
+            if cls._sampler is None:
+                psutil.cpu_percent(interval=None)
+                cls._sampler = threading.Thread(target=cls._sampler_loop, daemon=True)
+                cls._sampler.start()
+    
+    @classmethod
+    def _sampler_loop(cls):
+        while True:
+            cls._snapshot = cls._sample()
+            time.sleep(cls.sample_interval)
+    
+    @classmethod
+    def get_system_stats(cls):
+        cls.start_sampler()
+        snapshot = cls._snapshot or cls._sample()
+        return dict(snapshot)
+    
     @staticmethod
-    def get_system_stats():
+    def _sample():
         try:
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # Non-blocking: utilisation since the previous sampler tick
+            cpu_percent = psutil.cpu_percent(interval=None)
             ram = psutil.virtual_memory()
             disk = psutil.disk_usage("C:/")
             
@@ -87,8 +126,40 @@ class ClientSystemMonitor:
         except:
             return "Unknown"
     
+    @classmethod
+    def _posture_loop(cls):
+        while True:
+            cls._posture_wake.wait(cls.posture_ttl)
+            cls._posture_wake.clear()
+            cls._posture = {
+                "firewall": cls._probe_firewall(),
+                "avStatus": cls._probe_av()
+            }
+    
+    @classmethod
+    def _cached_posture(cls, name):
+        with cls._sampler_lock:
+            if cls._posture_thread is None:
+                cls._posture = {"firewall": cls._probe_firewall(), "avStatus": cls._probe_av()}
+                cls._posture_thread = threading.Thread(target=cls._posture_loop, daemon=True)
+                cls._posture_thread.start()
+        return cls._posture.get(name, "Unknown")
+    
+    @classmethod
+    def refresh_posture(cls):
+        """Re-run firewall/AV checks now instead of waiting for the TTL"""
+        cls._posture_wake.set()
+    
+    @classmethod
+    def get_firewall_status(cls):
+        return cls._cached_posture("firewall")
+    
+    @classmethod
+    def get_av_status(cls):
+        return cls._cached_posture("avStatus")
+    
     @staticmethod
-    def get_firewall_status():
+    def _probe_firewall():
         try:
             result = subprocess.run(
                 ["netsh", "advfirewall", "show", "allprofiles", "state"],
@@ -99,7 +170,7 @@ class ClientSystemMonitor:
             return "Unknown"
     
     @staticmethod
-    def get_av_status():
+    def _probe_av():
         try:
             result = subprocess.run(
                 ["powershell", "-Command", 
@@ -162,10 +233,137 @@ class ClientSystemMonitor:
             return {"hostname": "Unknown", "ip": "0.0.0.0"}
 
 
+class TelemetrySpool:
+    """Append-only on-disk spool of samples that could not be delivered
+    
+    One JSON sample per line, oldest first. Delivered samples are not removed
+    from the file; a read offset persisted next to it (path + ".offset") moves
+    past them, and the file is truncated once the offset reaches its end. When
+    the file grows past max_bytes the oldest samples are evicted.
+    """
+    
+    def __init__(self, path="client_spool.jsonl", max_bytes=5 * 1024 * 1024):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.max_bytes = max_bytes
+        self.offset = self._load_offset()
+    
+    def _load_offset(self):
+        try:
+            with open(self.offset_path, "r", encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        # A spool rewritten behind our back (or lost) starts over from the beginning
+        return offset if 0 <= offset <= self._size() else 0
+    
+    def _save_offset(self):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(self.offset))
+        os.replace(tmp_path, self.offset_path)
+    
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+    
+    def append(self, samples):
+        if not samples:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                for sample in samples:
+                    f.write(json.dumps(sample, separators=(",", ":")) + "\n")
+            if self._size() > self.max_bytes:
+                self._evict()
+        except Exception as e:
+            logger.error("Spool write error: {}".format(str(e)))
+    
+    def _read_lines(self):
+        """Undelivered lines (after the read offset)"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                return [line.decode("utf-8", "replace") for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+    
+    def _rewrite(self, lines):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self.offset = 0
+        self._save_offset()
+    
+    def _evict(self):
+        """Drop delivered and oldest samples until the spool fits in 3/4 of max_bytes"""
+        lines = self._read_lines()
+        budget = self.max_bytes * 3 // 4
+        kept = []
+        size = 0
+        for line in reversed(lines):
+            size += len(line.encode("utf-8"))
+            if size > budget:
+                break
+            kept.append(line)
+        kept.reverse()
+        if len(kept) < len(lines):
+            logger.error("Spool full, evicted {} oldest samples".format(len(lines) - len(kept)))
+        self._rewrite(kept)
+    
+    def _scan(self, count):
+        """Yield (sample, end offset) for the oldest `count` samples, reading only that far"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.offset)
+            found = 0
+            while found < count:
+                line = f.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    continue
+                found += 1
+                yield sample, f.tell()
+    
+    def peek(self, count):
+        """Oldest `count` samples"""
+        return [sample for sample, _ in self._scan(count)]
+    
+    def discard(self, count):
+        """Move the read offset past the oldest `count` samples after they were delivered"""
+        end = self.offset
+        for _, end in self._scan(count):
+            pass
+        if end == self.offset:
+            return
+        self.offset = end
+        if self.offset >= self._size():
+            # Everything was delivered: start the file over instead of rewriting it
+            with open(self.path, "w", encoding="utf-8"):
+                pass
+            self.offset = 0
+        self._save_offset()
+    
+    def is_empty(self):
+        return self._size() <= self.offset
+
+
 class CyberShieldClient:
-    def __init__(self, server_url="http://localhost:5000", update_interval=60):
+    def __init__(self, server_url="http://localhost:5000", update_interval=60, batch_size=1):
         self.server_url = server_url
         self.update_interval = update_interval
+        self.batch_size = batch_size
         self.monitor = ClientSystemMonitor()
         network_info = self.monitor.get_network_info()
         self.hostname = network_info["hostname"]
@@ -173,6 +371,21 @@ class CyberShieldClient:
         self.os = platform.system()
         self.client_id = self.hostname
         self.is_registered = False
+        # One keep-alive connection pool for every request to the server
+        self.session = requests.Session()
+        # Batch mode state: unsent samples and the last state the server acked
+        self.pending = []
+        self.seq = 0
+        self.acked_seq = None
+        self.acked_state = {}
+        self.max_pending = batch_size * 10
+        # Samples are spooled to disk while the server is unreachable and
+        # backfilled later; ids make the replay idempotent on the server
+        self.session_id = uuid.uuid4().hex[:8]
+        self.spool = TelemetrySpool()
+        self.drain_batch_size = 500
+        self.drain_failures = 0
+        self.next_drain_at = 0.0
     
     def register_with_server(self):
         try:
@@ -180,9 +393,11 @@ class CyberShieldClient:
                 "client_id": self.client_id,
                 "hostname": self.hostname,
                 "ip": self.ip,
-                "os": self.os
+                "os": self.os,
+                # How often the server should expect to hear from us
+                "reportInterval": self.update_interval * max(1, self.batch_size)
             }
-            response = requests.post("{}/api/clients/register".format(self.server_url), json=data, timeout=5)
+            response = self.session.post("{}/api/clients/register".format(self.server_url), json=data, timeout=5)
             if response.status_code == 200:
                 self.is_registered = True
                 return True
@@ -193,45 +408,141 @@ class CyberShieldClient:
             logger.error("Registration error: {}".format(str(e)))
             return False
     
+    def collect_sample(self):
+        system_stats = self.monitor.get_system_stats()
+        firewall = self.monitor.get_firewall_status()
+        av = self.monitor.get_av_status()
+        return {
+            "hostname": self.hostname,
+            "ip": self.ip,
+            "os": self.os,
+            "cpu": system_stats["cpu"],
+            "ram": system_stats["ram"],
+            "disk": system_stats["disk"],
+            "temp": system_stats["temp"],
+            "processes": system_stats["processes"],
+            "firewall": firewall,
+            "avStatus": av,
+            "uptime": system_stats["uptime"],
+            "bytes_sent": system_stats.get("bytes_sent", 0),
+            "bytes_recv": system_stats.get("bytes_recv", 0)
+        }
+    
+    def _sample_id(self, seq):
+        return "{}:{}".format(self.session_id, seq)
+    
     def send_system_data(self):
+        self.seq += 1
+        sample = {"id": self._sample_id(self.seq), "ts": time.time(), "fields": None}
         try:
+            sample["fields"] = self.collect_sample()
             if not self.is_registered:
                 if not self.register_with_server():
+                    self.spool.append([sample])
                     return False
-            system_stats = self.monitor.get_system_stats()
-            firewall = self.monitor.get_firewall_status()
-            av = self.monitor.get_av_status()
-            data = {
-                "client_id": self.client_id,
-                "hostname": self.hostname,
-                "ip": self.ip,
-                "os": self.os,
-                "cpu": system_stats["cpu"],
-                "ram": system_stats["ram"],
-                "disk": system_stats["disk"],
-                "temp": system_stats["temp"],
-                "processes": system_stats["processes"],
-                "firewall": firewall,
-                "avStatus": av,
-                "uptime": system_stats["uptime"],
-                "bytes_sent": system_stats.get("bytes_sent", 0),
-                "bytes_recv": system_stats.get("bytes_recv", 0)
-            }
-            response = requests.post("{}/api/clients/update".format(self.server_url), json=data, timeout=5)
+            data = dict(sample["fields"], client_id=self.client_id)
+            response = self.session.post("{}/api/clients/update".format(self.server_url), json=data, timeout=5)
             if response.status_code == 200:
                 return True
             else:
                 logger.error("Send failed: {}".format(response.status_code))
+                self.spool.append([sample])
                 return False
         except Exception as e:
             logger.error("Error: {}".format(str(e)))
+            if sample["fields"] is not None:
+                self.spool.append([sample])
+            return False
+    
+    def queue_sample(self):
+        """Batch mode: collect a sample for the next upload"""
+        self.seq += 1
+        self.pending.append((self.seq, time.time(), self.collect_sample()))
+        if len(self.pending) > self.max_pending:
+            # Server unreachable for a while: move the oldest samples to disk
+            overflow = self.pending[:-self.max_pending]
+            self.pending = self.pending[-self.max_pending:]
+            self.spool.append([{"id": self._sample_id(seq), "ts": ts, "fields": fields}
+                               for seq, ts, fields in overflow])
+    
+    def drain_spool(self):
+        """Backfill spooled samples in large batches; back off with jitter on failure"""
+        if time.time() < self.next_drain_at:
+            return False
+        while True:
+            samples = self.spool.peek(self.drain_batch_size)
+            if not samples:
+                self.drain_failures = 0
+                return True
+            try:
+                payload = {"client_id": self.client_id, "samples": samples}
+                body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+                response = self.session.post(
+                    "{}/api/clients/ingest/bulk".format(self.server_url), data=body, timeout=30,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+                )
+                if response.status_code != 200:
+                    raise RuntimeError("HTTP {}".format(response.status_code))
+            except Exception as e:
+                self.drain_failures += 1
+                backoff = min(600, self.update_interval * (2 ** min(self.drain_failures, 6)))
+                self.next_drain_at = time.time() + backoff * random.uniform(0.5, 1.0)
+                logger.error("Spool drain failed ({}), retry in {:.0f}s".format(str(e), self.next_drain_at - time.time()))
+                return False
+            self.spool.discard(len(samples))
+    
+    def _build_batch(self):
+        """Delta-encode pending samples against the last acked state"""
+        previous = dict(self.acked_state) if self.acked_seq is not None else {}
+        samples = []
+        for seq, ts, fields in self.pending:
+            delta = {k: v for k, v in fields.items() if previous.get(k) != v}
+            # The id lets the server drop samples it applied before a lost ack
+            samples.append({"id": self._sample_id(seq), "seq": seq, "ts": ts, "fields": delta})
+            previous = fields
+        payload = {"client_id": self.client_id, "base": self.acked_seq, "samples": samples}
+        return payload, previous
+    
+    def send_batch(self):
+        """Batch mode: upload pending samples as one gzip-compressed request"""
+        if not self.pending:
+            return True
+        try:
+            for _ in range(2):
+                payload, state = self._build_batch()
+                body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+                response = self.session.post(
+                    "{}/api/clients/ingest".format(self.server_url), data=body, timeout=10,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+                )
+                if response.status_code == 409:
+                    # Server lost our base state (e.g. restart): resend full values
+                    self.acked_seq = None
+                    self.acked_state = {}
+                    continue
+                if response.status_code == 200:
+                    self.acked_seq = response.json().get("ack")
+                    self.acked_state = state
+                    self.pending = []
+                    return True
+                logger.error("Batch send failed: {}".format(response.status_code))
+                return False
+            return False
+        except Exception as e:
+            logger.error("Batch error: {}".format(str(e)))
             return False
     
     def run(self):
         self.register_with_server()
         while True:
             try:
-                self.send_system_data()
+                if self.batch_size > 1:
+                    self.queue_sample()
+                    online = self.send_batch() if len(self.pending) >= self.batch_size else False
+                else:
+                    online = self.send_system_data()
+                if online and not self.spool.is_empty():
+                    self.drain_spool()
                 time.sleep(self.update_interval)
             except KeyboardInterrupt:
                 break
@@ -243,7 +554,8 @@ class CyberShieldClient:
 def main():
     server_url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:5000"
     update_interval = int(sys.argv[2]) if len(sys.argv) > 2 else 60
-    client = CyberShieldClient(server_url=server_url, update_interval=update_interval)
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    client = CyberShieldClient(server_url=server_url, update_interval=update_interval, batch_size=batch_size)
     client.run()
 
 
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+School CyberShield - Performance benchmarks for agent subsystems
+Run: python benchmark.py <name> [options]   (python benchmark.py --help for the list)
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import agent
+
+
+def bench_clients(args):
+    """Stress the client store with concurrent updates and snapshot readers"""
+    store = agent.ClientStore()
+    client_ids = ["PC-{:05d}".format(i) for i in range(args.clients)]
+    for client_id in client_ids:
+        store.register(client_id, {"hostname": client_id, "ip": "10.0.0.1", "os": "Windows"})
+
+    errors = []
+    stop = threading.Event()
+    snapshots = [0]
+
+    def writer(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(args.updates // args.threads):
+                store.update(rng.choice(client_ids), {
+                    "cpu": rng.random() * 100,
+                    "ram": rng.random() * 100,
+                    "disk": rng.random() * 100,
+                    "lastSeen": time.time()
+                })
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                if len(store.snapshot()) != len(client_ids):
+                    errors.append(AssertionError("inconsistent snapshot"))
+                snapshots[0] += 1
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+    writers = [threading.Thread(target=writer, args=(i,)) for i in range(args.threads)]
+    for t in readers:
+        t.start()
+    start = time.perf_counter()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for t in readers:
+        t.join()
+
+    total = (args.updates // args.threads) * args.threads
+    print("clients={} writers={} readers={}".format(args.clients, args.threads, args.readers))
+    print("updates: {} in {:.2f}s ({:.0f}/s)".format(total, elapsed, total / elapsed))
+    print("snapshots: {}".format(snapshots[0]))
+    print("errors: {}".format(len(errors)))
+    return 1 if errors else 0
+
+
+def bench_rules(args):
+    """Evaluate the vulnerability rule set across a synthetic fleet"""
+    rng = random.Random(42)
+    clients = {}
+    for i in range(args.clients):
+        client_id = "PC-{:05d}".format(i)
+        clients[client_id] = {
+            "client_id": client_id,
+            "hostname": client_id,
+            "cpu": rng.random() * 100,
+            "ram": rng.random() * 100,
+            "disk": rng.random() * 100,
+            "temp": rng.random() * 100,
+            "firewall": rng.choice(["Enabled", "Disabled"]),
+            "avStatus": rng.choice(["Active", "Disabled", "Unknown"])
+        }
+
+    analyzer = agent.VulnerabilityAnalyzer()
+    analyzer.analyze_all_clients(clients)  # warm up formatted-finding caches
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        analyzer.analyze_all_clients(clients)
+        timings.append(time.perf_counter() - start)
+
+    print("clients={} rules={}".format(args.clients, len(analyzer.rules)))
+    print("best {:.1f} ms, mean {:.1f} ms".format(min(timings) * 1000, sum(timings) / len(timings) * 1000))
+    return 0
+
+
+IW_BSS_TEMPLATE = """BSS {bssid}(on wlan0)
+\tlast seen: 1520.318s [boottime]
+\tTSF: 78461320 usec (0d, 00:01:18)
+\tfreq: {freq}
+\tbeacon interval: 100 TUs
+\tcapability: ESS{privacy} ShortSlotTime (0x0431)
+\tsignal: {signal:.2f} dBm
+\tlast seen: 40 ms ago
+\tInformation elements from Probe Response frame:
+\tSSID: {ssid}
+\tSupported rates: 1.0* 2.0* 5.5* 11.0* 6.0 9.0 12.0 18.0 
+\tDS Parameter set: channel {channel}
+\tCountry: RU\tEnvironment: Indoor/Outdoor
+\t\tChannels [1 - 13] @ 20 dBm
+\tERP: Barker_Preamble_Mode
+\tExtended supported rates: 24.0 36.0 48.0 54.0 
+{security}\tHT capabilities:
+\t\tCapabilities: 0x1ad
+\t\t\tRX LDPC
+\t\t\tHT20
+\t\tMaximum RX AMPDU length 65535 bytes (exponent: 0x003)
+\tHT operation:
+\t\t * primary channel: {channel}
+\t\t * secondary channel offset: no secondary
+\t\t * STA channel width: 20 MHz
+\tExtended capabilities:
+\t\t * Extended Channel Switching
+\t\t * BSS Transition
+\tWMM:\t * Parameter version 1
+\t\t * BE: CW 15-1023, AIFSN 3
+\t\t * BK: CW 15-1023, AIFSN 7
+"""
+
+IW_SECURITY = {
+    "WPA2-PSK": "\tRSN:\t * Version: 1\n\t\t * Group cipher: CCMP\n\t\t * Pairwise ciphers: CCMP\n"
+                "\t\t * Authentication suites: PSK\n\t\t * Capabilities: 16-PTKSA-RC 1-GTKSA-RC (0x000c)\n",
+    "WPA3-SAE": "\tRSN:\t * Version: 1\n\t\t * Group cipher: CCMP\n\t\t * Pairwise ciphers: CCMP\n"
+                "\t\t * Authentication suites: SAE\n\t\t * Capabilities: 16-PTKSA-RC 1-GTKSA-RC MFP-required (0x00cc)\n",
+    "WPA2-Enterprise": "\tRSN:\t * Version: 1\n\t\t * Group cipher: CCMP\n\t\t * Pairwise ciphers: CCMP\n"
+                       "\t\t * Authentication suites: IEEE 802.1X\n",
+    "WPA-PSK": "\tWPA:\t * Version: 1\n\t\t * Group cipher: TKIP\n\t\t * Pairwise ciphers: TKIP\n"
+               "\t\t * Authentication suites: PSK\n",
+    "WEP": "",
+    "None": "",
+}
+
+
+def make_iw_dump(count, seed=7):
+    """Synthetic `iw dev wlan0 scan` output with `count` BSS blocks; returns (text, expected)"""
+    rng = random.Random(seed)
+    blocks = []
+    expected = []
+    for i in range(count):
+        security = rng.choice(list(IW_SECURITY))
+        channel = rng.choice([1, 6, 11, 36, 44, 149])
+        freq = 2407 + channel * 5 if channel <= 13 else 5000 + channel * 5
+        bssid = "02:{:02x}:{:02x}:{:02x}:{:02x}:{:02x}".format(*(rng.randrange(256) for _ in range(5)))
+        ssid = "School-{}".format(i % 300)
+        blocks.append(IW_BSS_TEMPLATE.format(
+            bssid=bssid, freq=freq, privacy="" if security == "None" else " Privacy",
+            signal=-30 - rng.random() * 60, ssid=ssid, channel=channel, security=IW_SECURITY[security]))
+        expected.append((bssid.upper(), ssid, channel, security))
+    return "".join(blocks), expected
+
+
+def bench_wifi(args):
+    """Parse large `iw` scan dumps (synthetic, or a captured one via --file)"""
+    if args.file:
+        with open(args.file, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        expected = None
+    else:
+        text, expected = make_iw_dump(args.networks)
+
+    networks = agent.IwWifiBackend.parse(text)
+    if expected is not None:
+        got = [(n["bssid"], n["ssid"], n["channel"], n["security"]) for n in networks]
+        if got != expected:
+            mismatches = sum(1 for a, b in zip(got, expected) if a != b) + abs(len(got) - len(expected))
+            print("parse mismatch: {} of {} networks".format(mismatches, len(expected)))
+            return 1
+
+    timings = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        agent.IwWifiBackend.parse(text)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print("dump: {:.1f} KB, {} networks".format(len(text) / 1024, len(networks)))
+    print("parse best {:.2f} ms, mean {:.2f} ms ({:.0f} networks/s)".format(
+        best * 1000, sum(timings) / len(timings) * 1000, len(networks) / best if best else 0))
+    return 0
+
+
+def bench_rogue(args):
+    """Per-observation cost of the rogue-AP detector as its history grows"""
+    rng = random.Random(3)
+    detector = agent.RogueApDetector(school_ssids=["School-0"], learning_period=0,
+                                     max_profiles=args.bssids * 2)
+    securities = ["WPA2-PSK", "WPA3-SAE", "WPA2-Enterprise", "None"]
+    created = [0]
+
+    def observe(index):
+        bssid = "02:00:{:02x}:{:02x}:{:02x}:{:02x}".format(*index.to_bytes(4, "big"))
+        network = {"ssid": "School-{}".format(index % 500), "bssid": bssid,
+                   "security": securities[index % len(securities)], "signal": -40 - rng.random() * 50,
+                   "channel": 6}
+        return bool(detector.observe(network, time.time()))
+
+    flagged = 0
+    print("history  obs/s")
+    for step in range(1, args.steps + 1):
+        # Grow the history untimed, then time a mix of repeat sightings and new BSSIDs
+        while created[0] < args.bssids * step // args.steps:
+            observe(created[0])
+            created[0] += 1
+        start = time.perf_counter()
+        for i in range(args.observations):
+            if i % 10 == 0:
+                flagged += observe(created[0])
+                created[0] += 1
+            else:
+                flagged += observe(rng.randrange(created[0]))
+        elapsed = time.perf_counter() - start
+        print("{:7d}  {:.0f}".format(created[0], args.observations / elapsed))
+    print("flagged during timed runs: {}".format(flagged))
+    return 0
+
+
+def make_scan_observations(prefix, seed=11):
+    """Synthetic ARP, ICMP and passive results for one 10.x.0.0/`prefix` sweep"""
+    rng = random.Random(seed)
+    network = ipaddress.ip_network("10.0.0.0/{}".format(prefix))
+    arp, icmp, passive = [], [], []
+    for index, host in enumerate(network.hosts()):
+        ip = str(host)
+        roll = rng.random()
+        if roll < 0.7:
+            mac = "02:00:{:02X}:{:02X}:{:02X}:{:02X}".format(*index.to_bytes(4, "big"))
+            arp.append({"id": mac, "ip": ip, "mac": mac})
+            if roll < 0.05:
+                arp.append({"id": mac, "ip": ip, "mac": mac})  # answered a retry as well
+            if roll < 0.1:
+                passive.append(arp[-1])
+        elif roll < 0.9:
+            icmp.append({"id": "ip:" + ip, "ip": ip, "mac": "Unknown"})
+    return arp, icmp, passive
+
+
+def bench_dedup(args):
+    """Merging scan results: indexed ScanResultSet vs. the former list scan per reply"""
+    def legacy(arp, icmp, passive):
+        devices, seen_ids = [], set()
+        for record in arp:
+            if any(d["ip"] == record["ip"] and d["mac"] != "Unknown" for d in devices):
+                continue
+            if record["id"] not in seen_ids:
+                seen_ids.add(record["id"])
+                devices.append(record)
+        known_ips = set(d["ip"] for d in devices)
+        for record in icmp:
+            if record["ip"] not in known_ips and record["id"] not in seen_ids:
+                seen_ids.add(record["id"])
+                devices.append(record)
+        return len(seen_ids | {r["id"] for r in passive})
+
+    def indexed(arp, icmp, passive):
+        results = agent.ScanResultSet()
+        for record in arp:
+            found = results.get_by_ip(record["ip"])
+            if found is not None and found["mac"] != "Unknown":
+                continue
+            results.add(record)
+        for record in icmp:
+            if not results.has_ip(record["ip"]):
+                results.add(record)
+        for record in passive:
+            results.add(record)
+        return len(results)
+
+    print("network  observations  indexed ms  legacy ms")
+    for prefix in range(args.from_prefix, args.to_prefix - 1, -2):
+        arp, icmp, passive = make_scan_observations(prefix)
+        count = len(arp) + len(icmp) + len(passive)
+        start = time.perf_counter()
+        found = indexed(arp, icmp, passive)
+        indexed_ms = (time.perf_counter() - start) * 1000
+        legacy_ms = "skipped"
+        if count <= args.legacy_max:
+            start = time.perf_counter()
+            if legacy(arp, icmp, passive) != found:
+                print("result mismatch for /{}".format(prefix))
+                return 1
+            legacy_ms = "{:.1f}".format((time.perf_counter() - start) * 1000)
+        print("{:>7}  {:12d}  {:10.1f}  {:>9}".format("/{}".format(prefix), count, indexed_ms, legacy_ms))
+    return 0
+
+
+def bench_load(args):
+    """Sustained client updates against a waitress-served agent while scans and WiFi calls run"""
+    import logging
+    import requests
+
+    # Per-request logging would dominate the measurement
+    agent.logger.setLevel(logging.WARNING)
+    logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+    url = args.url
+    if url is None:
+        if agent.waitress is None:
+            print("waitress is not installed; pass --url of a running agent instead")
+            return 1
+
+        # Model slow network work without touching the real network
+        def slow_scan(progress=None, incremental=False):
+            time.sleep(args.scan_seconds)
+            return []
+
+        def slow_wifi():
+            time.sleep(args.scan_seconds)
+            return []
+
+        agent.scanner.scan_network = slow_scan
+        agent.scanner.scan_wifi = slow_wifi
+        # Keep the group-commit write path in the measurement, but away from the real database
+        if agent.STATE_DB:
+            agent.open_state_store(os.path.join(tempfile.mkdtemp(), "load.db"))
+        agent.scan_scheduler.start()
+        server = agent.waitress.create_server(agent.app, host="127.0.0.1", port=0, threads=args.threads,
+                                              connection_limit=args.clients + 100)
+        threading.Thread(target=server.run, daemon=True).start()
+        url = "http://127.0.0.1:{}".format(server.effective_port)
+
+    stop = threading.Event()
+    latencies = []
+    errors = [0]
+    slow_calls = [0]
+    lock = threading.Lock()
+
+    def client(i):
+        session = requests.Session()
+        client_id = "LOAD-{:04d}".format(i)
+        rng = random.Random(i)
+        session.post(url + "/api/clients/register", json={"client_id": client_id, "hostname": client_id})
+        mine = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                r = session.post(url + "/api/clients/update", json={
+                    "client_id": client_id, "cpu": rng.random() * 100,
+                    "ram": rng.random() * 100, "disk": rng.random() * 100
+                }, timeout=10)
+                ok = r.status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                mine.append(time.perf_counter() - start)
+            else:
+                with lock:
+                    errors[0] += 1
+            if args.interval:
+                stop.wait(args.interval)
+        with lock:
+            latencies.extend(mine)
+
+    def slow(path):
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                session.get(url + path, timeout=args.scan_seconds + 10)
+                with lock:
+                    slow_calls[0] += 1
+            except requests.RequestException:
+                pass
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for i in range(args.slow):
+        path = "/api/scan?refresh=1&wait=60" if i % 2 == 0 else "/api/wifi"
+        threads.append(threading.Thread(target=slow, args=(path,)))
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    # An in-process server runs on a daemon thread and goes away with the process
+
+    latencies.sort()
+    total = len(latencies)
+    print("url={} clients={} slow={} duration={}s".format(url, args.clients, args.slow, args.duration))
+    print("updates: {} ({:.0f}/s), errors: {}".format(total, total / args.duration, errors[0]))
+    if total:
+        print("latency p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+            latencies[total // 2] * 1000, latencies[int(total * 0.99)] * 1000, latencies[-1] * 1000))
+    print("completed scan/wifi calls: {}".format(slow_calls[0]))
+    return 1 if errors[0] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CyberShield agent benchmarks")
+    sub = parser.add_subparsers(dest="name", required=True)
+
+    p = sub.add_parser("clients", help="ClientStore concurrent update stress test")
+    p.add_argument("--clients", type=int, default=2000)
+    p.add_argument("--updates", type=int, default=200000)
+    p.add_argument("--threads", type=int, default=16)
+    p.add_argument("--readers", type=int, default=2)
+    p.set_defaults(func=bench_clients)
+
+    p = sub.add_parser("rules", help="Vulnerability rule engine over a synthetic fleet")
+    p.add_argument("--clients", type=int, default=10000)
+    p.add_argument("--rounds", type=int, default=10)
+    p.set_defaults(func=bench_rules)
+
+    p = sub.add_parser("wifi", help="iw scan dump parser throughput")
+    p.add_argument("--networks", type=int, default=2000, help="BSS blocks in the synthetic dump")
+    p.add_argument("--file", help="captured `iw dev <iface> scan` output to parse instead")
+    p.add_argument("--rounds", type=int, default=20)
+    p.set_defaults(func=bench_wifi)
+
+    p = sub.add_parser("rogue", help="Rogue-AP detector cost per observation vs. history size")
+    p.add_argument("--bssids", type=int, default=100000, help="history size reached in the last step")
+    p.add_argument("--steps", type=int, default=5)
+    p.add_argument("--observations", type=int, default=50000, help="minimum observations per step")
+    p.set_defaults(func=bench_rogue)
+
+    p = sub.add_parser("dedup", help="Scan result merging on synthetic /24../16 sweeps")
+    p.add_argument("--from-prefix", type=int, default=24)
+    p.add_argument("--to-prefix", type=int, default=16)
+    p.add_argument("--legacy-max", type=int, default=20000,
+                   help="skip the quadratic reference above this many observations")
+    p.set_defaults(func=bench_dedup)
+
+    p = sub.add_parser("load", help="HTTP load test: concurrent client updates during long scans")
+    p.add_argument("--url", help="running agent to test (default: start one in-process)")
+    p.add_argument("--clients", type=int, default=200)
+    p.add_argument("--interval", type=float, default=0.0, help="pause between updates per client")
+    p.add_argument("--duration", type=float, default=20.0)
+    p.add_argument("--slow", type=int, default=8, help="concurrent /api/scan?wait and /api/wifi callers")
+    p.add_argument("--scan-seconds", type=float, default=10.0, help="simulated scan duration (in-process)")
+    p.add_argument("--threads", type=int, default=32, help="waitress threads (in-process)")
+    p.set_defaults(func=bench_load)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -26,9 +26,9 @@ interface ConnectedClientsProps {
 
 const ConnectedClients: React.FC<ConnectedClientsProps> = ({ clients = [], onAudit, isScanning = false }) => {
   const getStatusIcon = (status: string) => {
-    return status === 'Online' 
-      ? <CheckCircle className="w-5 h-5 text-green-500" />
-      : <AlertCircle className="w-5 h-5 text-red-500" />;
+    if (status === 'Online') return <CheckCircle className="w-5 h-5 text-green-500" />;
+    if (status === 'Stale') return <Clock className="w-5 h-5 text-yellow-500" />;
+    return <AlertCircle className="w-5 h-5 text-red-500" />;
   };
 
   const getSecurityStatus = (firewall: string, av: string) => {
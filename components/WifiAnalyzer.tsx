@@ -123,7 +123,8 @@ const WifiAnalyzer: React.FC<WifiAnalyzerProps> = ({ realNetworks = [], onAudit,
                   <td className="px-6 py-4">
                     <div>
                       {net.isRogue ? (
-                        <span className="flex items-center gap-1 text-red-600 font-bold text-xs uppercase mb-2">
+                        <span className="flex items-center gap-1 text-red-600 font-bold text-xs uppercase mb-2"
+                              title={net.rogueReasons?.join('\n')}>
                           <ShieldAlert size={14} /> Rogue AP
                         </span>
                       ) : (
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests import the agent modules from the repository root and never touch the state database
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CYBERSHIELD_DB", "")
@@ -0,0 +1,33 @@
+import agent
+
+
+def test_scan_rejects_malformed_query():
+    client = agent.app.test_client()
+    assert client.get("/api/scan?since=abc").status_code == 400
+    assert client.get("/api/scan?wait=soon").status_code == 400
+
+
+def test_scan_since_returns_inventory_changes(monkeypatch):
+    # A finished scan on record keeps the endpoint from starting a real sweep of the test host's networks
+    monkeypatch.setattr(agent.scan_scheduler, "last_result", {"timestamp": None, "deviceCount": 0, "devices": []})
+    agent.scanner.inventory.observe({"ip": "10.9.0.5", "mac": "02:00:00:00:09:05"})
+    response = agent.app.test_client().get("/api/scan?since=0")
+    assert response.status_code == 200
+    assert "02:00:00:00:09:05" in [d["id"] for d in response.get_json()["changes"]]
+    assert response.get_json()["job"] is None
+
+
+def test_ip_taken_over_by_another_mac_leaves_the_old_device():
+    inventory = agent.DeviceInventory()
+    old = inventory.observe({"ip": "10.9.0.7", "mac": "02:00:00:00:09:07"})
+    version = inventory.version
+    inventory.observe({"ip": "10.9.0.7", "mac": "02:00:00:00:09:08"})
+    changes = inventory.changes_since(version)["changes"]
+    assert sorted((d["id"], d["ip"]) for d in changes) == [
+        ("02:00:00:00:09:07", "Unknown"), ("02:00:00:00:09:08", "10.9.0.7")]
+    assert inventory.get_by_ip("10.9.0.7")["id"] == "02:00:00:00:09:08"
+
+    # The old device shows up again at a new address
+    inventory.observe({"ip": "10.9.0.9", "mac": "02:00:00:00:09:07"})
+    assert old["ip"] == "10.9.0.9"
+    assert inventory.get_by_ip("10.9.0.7")["id"] == "02:00:00:00:09:08"
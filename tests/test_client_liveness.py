@@ -0,0 +1,33 @@
+import time
+from datetime import datetime
+
+import agent
+
+
+def test_late_deadline_does_not_overwrite_a_fresh_report(monkeypatch):
+    store = agent.ClientStore()
+    monkeypatch.setattr(agent, "client_store", store)
+    judged_at = time.time() - 200
+    store.update("pc-1", {"status": "Online", "lastSeen": datetime.fromtimestamp(judged_at).isoformat()})
+
+    # The worker judged the client from judged_at, but a report arrived before the callback ran
+    store.update("pc-1", {"status": "Online", "lastSeen": datetime.now().isoformat()})
+    agent._on_client_status("pc-1", "Online", "Stale", judged_at)
+    assert store.get("pc-1")["status"] == "Online"
+
+    store.update("pc-1", {"lastSeen": datetime.fromtimestamp(judged_at).isoformat()})
+    agent._on_client_status("pc-1", "Online", "Stale", judged_at)
+    assert store.get("pc-1")["status"] == "Stale"
+
+
+def test_transition_reports_the_last_seen_time():
+    calls = []
+    liveness = agent.ClientLiveness(default_interval=0.01, stale_after=1, offline_after=1000,
+                                    on_transition=lambda *args: calls.append(args))
+    seen_at = time.time()
+    liveness.touch("pc-1", seen_at)
+    liveness.start()
+    deadline = time.time() + 2
+    while not calls and time.time() < deadline:
+        time.sleep(0.01)
+    assert calls == [("pc-1", "Online", "Stale", seen_at)]
@@ -0,0 +1,25 @@
+import os
+import shutil
+
+import agent
+
+BUNDLED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "oui-bundled.csv.gz")
+
+
+def test_bundled_registry_is_used_without_ieee_csvs(tmp_path):
+    shutil.copy(BUNDLED, str(tmp_path))
+    registry = agent.OUIRegistry(str(tmp_path))
+    assert registry.lookup("b8:27:eb:12:34:56") == "Raspberry Pi Foundation"
+    assert registry.lookup("00-00-0C-AA-BB-CC") == "Cisco Systems, Inc"
+    assert registry.lookup("02:00:00:00:00:01") == "Unknown"
+    assert sum(len(i) for i in registry.indexes.values()) > 30000
+
+    # The compiled cache is reused on the next start
+    assert os.path.exists(str(tmp_path / "oui.bin"))
+    assert agent.OUIRegistry(str(tmp_path)).lookup("b8:27:eb:12:34:56") == "Raspberry Pi Foundation"
+
+
+def test_fallback_only_logs_a_warning(tmp_path, caplog):
+    registry = agent.OUIRegistry(str(tmp_path))
+    assert registry.lookup("00:0C:29:00:00:01") == "VMware"
+    assert any(r.levelname == "WARNING" and "update_oui.py" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,34 @@
+import agent
+
+
+class FullBufferSocket:
+    """Send buffer that is full for the first few attempts, then drops every probe"""
+
+    def __init__(self, full_for):
+        self.full_for = full_for
+        self.sends = 0
+
+    def setblocking(self, flag):
+        pass
+
+    def sendto(self, data, address):
+        self.sends += 1
+        if self.sends <= self.full_for:
+            raise BlockingIOError()
+        raise OSError("unreachable")
+
+
+def test_full_send_buffer_waits_for_writability(monkeypatch):
+    waits = []
+
+    def fake_select(readable, writable, errors, timeout):
+        waits.append((bool(readable), bool(writable)))
+        return [], writable, []
+
+    monkeypatch.setattr(agent.select, "select", fake_select)
+    sock = FullBufferSocket(full_for=3)
+    alive = agent.PingSweeper()._sweep_socket(sock, True, ["10.0.0.1", "10.0.0.2"], 16)
+    assert alive == set()
+    # Every refused send is followed by one wait for room in the send buffer, not a busy retry
+    assert waits == [(False, True)] * 3
+    assert sock.sends == 5
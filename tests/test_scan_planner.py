@@ -0,0 +1,31 @@
+import socket
+from collections import namedtuple
+
+import agent
+
+Addr = namedtuple("Addr", "family address netmask")
+
+
+def hosts_by_unit(units):
+    return {cidr: hosts for _, cidr, hosts in units}
+
+
+def test_configured_range_inside_interface_network_keeps_its_bounds():
+    planner = agent.ScanRangePlanner(["10.160.46.0/24", "10.160.47.0/24"])
+    arp, icmp = planner.plan({"eth0": [Addr(socket.AF_INET, "10.160.40.7", "255.255.240.0")]})
+    assert icmp == []
+    units = hosts_by_unit(arp)
+    assert len(units) == 16
+    assert "10.160.46.0" in units["10.160.46.0/24"] and "10.160.46.255" in units["10.160.46.0/24"]
+    # The interface network's own bounds are still skipped
+    assert "10.160.32.0" not in units["10.160.32.0/24"]
+    assert "10.160.47.255" not in units["10.160.47.0/24"]
+
+
+def test_routed_range_skips_its_network_and_broadcast():
+    planner = agent.ScanRangePlanner(["10.20.0.0/23"])
+    arp, icmp = planner.plan({"eth0": [Addr(socket.AF_INET, "192.168.1.10", "255.255.255.0")]})
+    units = hosts_by_unit(icmp)
+    assert len(units["10.20.0.0/24"]) == 255 and "10.20.0.0" not in units["10.20.0.0/24"]
+    assert len(units["10.20.1.0/24"]) == 255 and "10.20.1.255" not in units["10.20.1.0/24"]
+    assert len(hosts_by_unit(arp)["192.168.1.0/24"]) == 254
@@ -0,0 +1,57 @@
+import agent
+
+
+def make_cache(store, clients):
+    def on_change(result, old):
+        store.add_vulnerability(result, old)
+        changes.append((result["client_id"], old, result["severity"]))
+
+    changes = []
+    cache = agent.VulnerabilityCache(agent.VulnerabilityAnalyzer(), clients, on_severity_change=on_change)
+    cache.seed(store.latest_severities())
+    return cache, changes
+
+
+def test_restart_does_not_repeat_unchanged_severities(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = agent.StateStore(path)
+    clients = agent.ClientStore()
+    clients.update("pc-1", {"cpu": 99, "firewall": "Enabled", "avStatus": "Enabled"})
+    cache, changes = make_cache(store, clients)
+    cache.update()
+    assert changes == [("pc-1", None, "Critical")]
+    store.close()
+
+    # Same client state after a restart: nothing new is logged
+    store = agent.StateStore(path)
+    assert store.latest_severities() == {"pc-1": "Critical"}
+    clients = agent.ClientStore()
+    clients.load({"pc-1": {"cpu": 99, "firewall": "Enabled", "avStatus": "Enabled"}})
+    cache, changes = make_cache(store, clients)
+    cache.update()
+    assert changes == []
+
+    clients.update("pc-1", {"cpu": 10})
+    cache.update()
+    assert changes == [("pc-1", "Critical", "Low")]
+    assert [h["severity"] for h in store.vulnerability_history("pc-1")] == ["Low", "Critical"]
+    store.close()
+
+
+def test_device_last_seen_is_persisted(tmp_path):
+    store = agent.StateStore(str(tmp_path / "state.db"))
+    inventory = agent.DeviceInventory()
+    inventory.listeners.append(store.put_device)
+    inventory.seen_listeners.append(store.put_device)
+    record = inventory.observe({"ip": "10.0.0.5", "mac": "aa:bb:cc:dd:ee:ff"})
+    store.put_device(dict(record, lastSeen="2000-01-01T00:00:00"))
+    store.flush()
+    # A sighting that changes nothing but lastSeen still reaches the database
+    inventory.observe({"ip": "10.0.0.5", "mac": "aa:bb:cc:dd:ee:ff"})
+    store.flush()
+    assert store.load_devices()[0]["lastSeen"] == record["lastSeen"] != "2000-01-01T00:00:00"
+    store.close()
+
+
+def test_import_does_not_open_the_database():
+    assert agent.state_store is None
@@ -0,0 +1,90 @@
+import gzip
+import json
+
+import requests
+
+import agent
+import agent_client
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class IngestSession:
+    """Routes client uploads to a TelemetryIngestor; can drop the next response"""
+
+    def __init__(self, ingestor, applied):
+        self.ingestor = ingestor
+        self.applied = applied
+        self.lose_next_ack = False
+
+    def post(self, url, data=None, **kwargs):
+        payload = json.loads(gzip.decompress(data))
+        accepted, ack = self.ingestor.ingest(payload, lambda cid, fields, ts: self.applied.append(fields))
+        if self.lose_next_ack:
+            self.lose_next_ack = False
+            raise requests.ConnectionError("connection reset before the response arrived")
+        if not accepted:
+            return FakeResponse(409, {"status": "resync"})
+        return FakeResponse(200, {"status": "ok", "ack": ack})
+
+
+def make_client(session):
+    client = agent_client.CyberShieldClient.__new__(agent_client.CyberShieldClient)
+    client.server_url = "http://agent"
+    client.client_id = "pc-01"
+    client.session = session
+    client.session_id = "s1"
+    client.pending = []
+    client.seq = 0
+    client.acked_seq = None
+    client.acked_state = {}
+    return client
+
+
+def queue(client, cpu):
+    client.seq += 1
+    client.pending.append((client.seq, 1000.0 + client.seq, {"cpu": cpu, "ram": 40}))
+
+
+def test_resend_after_lost_ack_is_not_applied_twice():
+    applied = []
+    session = IngestSession(agent.TelemetryIngestor(), applied)
+    client = make_client(session)
+
+    queue(client, 10)
+    queue(client, 20)
+    session.lose_next_ack = True
+    assert client.send_batch() is False
+    assert len(applied) == 2
+
+    # Same base is now stale on the server: 409, then a full resend with base=None
+    assert client.send_batch() is True
+    assert len(applied) == 2
+    assert client.acked_seq == 2
+
+    queue(client, 30)
+    assert client.send_batch() is True
+    assert [s["cpu"] for s in applied] == [10, 20, 30]
+    assert applied[-1] == {"cpu": 30, "ram": 40}
+
+
+def test_restarted_client_session_is_applied():
+    applied = []
+    ingestor = agent.TelemetryIngestor()
+    first = make_client(IngestSession(ingestor, applied))
+    queue(first, 10)
+    assert first.send_batch() is True
+
+    # A new process restarts seq at 1 with a new session id
+    second = make_client(IngestSession(ingestor, applied))
+    second.session_id = "s2"
+    queue(second, 50)
+    assert second.send_batch() is True
+    assert [s["cpu"] for s in applied] == [10, 50]
@@ -0,0 +1,34 @@
+import os
+
+import agent_client
+
+
+def test_drain_advances_a_persisted_offset(tmp_path):
+    path = str(tmp_path / "spool.jsonl")
+    spool = agent_client.TelemetrySpool(path)
+    spool.append([{"id": i} for i in range(10)])
+    size = os.path.getsize(path)
+
+    assert [s["id"] for s in spool.peek(4)] == [0, 1, 2, 3]
+    spool.discard(4)
+    # Delivered samples are skipped by offset, the file itself is left alone
+    assert os.path.getsize(path) == size
+
+    # A restarted client resumes after the delivered samples
+    spool = agent_client.TelemetrySpool(path)
+    assert [s["id"] for s in spool.peek(100)] == [4, 5, 6, 7, 8, 9]
+    spool.append([{"id": 10}])
+    spool.discard(7)
+    assert spool.is_empty()
+    assert os.path.getsize(path) == 0 and spool.offset == 0
+    assert spool.peek(10) == []
+
+
+def test_eviction_keeps_only_undelivered_samples(tmp_path):
+    spool = agent_client.TelemetrySpool(str(tmp_path / "spool.jsonl"), max_bytes=200)
+    spool.append([{"id": i} for i in range(5)])
+    spool.discard(5)
+    spool.append([{"id": i} for i in range(5, 30)])
+    ids = [s["id"] for s in spool.peek(100)]
+    assert ids and ids == list(range(30 - len(ids), 30))
+    assert os.path.getsize(spool.path) <= 150
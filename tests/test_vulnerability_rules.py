@@ -0,0 +1,63 @@
+import json
+
+import agent
+
+
+def write_rules(path, rules):
+    path.write_text(json.dumps({"version": 1, "rules": rules}), encoding="utf-8")
+
+
+def level(description, threshold, severity="High"):
+    return {"id": "r", "threshold": threshold, "severity": severity, "type": "Test",
+            "description": description, "recommendation": "Fix it"}
+
+
+def test_text_rule_with_value_placeholder(tmp_path):
+    rules = tmp_path / "rules.json"
+    write_rules(rules, [
+        {"metric": "avStatus", "comparator": "contains", "levels": [level("Antivirus state: {value}", "off")]},
+        {"metric": "cpu", "comparator": ">", "levels": [level("CPU {value}%", 90, "Critical")]},
+    ])
+    analyzer = agent.VulnerabilityAnalyzer(str(rules))
+    results = analyzer.analyze_all_clients({
+        "a": {"client_id": "a", "avStatus": "Turned OFF", "cpu": 95.6},
+        "b": {"client_id": "b", "avStatus": "Turned OFF", "cpu": 12},
+    })
+    assert [v["description"] for v in results[0]["vulnerabilities"]] == [
+        "Antivirus state: turned off", "CPU 95%"]
+    assert results[0]["severity"] == "Critical"
+    assert [v["description"] for v in results[1]["vulnerabilities"]] == ["Antivirus state: turned off"]
+
+
+def test_bad_placeholder_is_rejected_at_load(tmp_path):
+    rules = tmp_path / "rules.json"
+    write_rules(rules, [{"metric": "cpu", "comparator": ">", "levels": [level("CPU {value}%", 90)]}])
+    analyzer = agent.VulnerabilityAnalyzer(str(rules))
+    assert len(analyzer.rules) == 1
+
+    write_rules(rules, [{"metric": "cpu", "comparator": ">", "levels": [level("CPU {load}%", 90)]}])
+    analyzer.reload(force=True)
+    # The broken file is refused and the previous rule set keeps serving
+    assert len(analyzer.rules) == 1
+    result = analyzer.analyze_client({"client_id": "a", "cpu": 99})
+    assert result["vulnerabilities"][0]["description"] == "CPU 99%"
+
+
+def test_shipped_device_rules_cover_services():
+    analyzer = agent.VulnerabilityAnalyzer()
+    findings = analyzer.analyze_services([
+        {"port": 22, "service": "ssh", "banner": "SSH-1.99-OpenSSH_3.9"},
+        {"port": 23, "service": "telnet", "banner": ""},
+        {"port": 8080, "service": "http", "banner": ""},
+    ])
+    assert [(f["id"], f["severity"]) for f in findings] == [("port_23", "Critical"), ("ssh_v1", "High")]
+    assert analyzer.analyze_services([{"port": 22, "service": "ssh", "banner": "SSH-2.0-OpenSSH_9.6"}]) == []
+    # Telemetry rules never match against device records and vice versa
+    assert all(not f.get("id", "").startswith("port_")
+               for f in analyzer.analyze_client({"client_id": "a"})["vulnerabilities"])
+
+
+def test_client_findings_keep_the_original_fields():
+    result = agent.VulnerabilityAnalyzer().analyze_client({"client_id": "a", "cpu": 99, "firewall": "Disabled"})
+    assert result["vulnerabilities"]
+    assert all(set(v) == {"type", "severity", "description", "recommendation"} for v in result["vulnerabilities"])
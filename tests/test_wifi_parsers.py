@@ -0,0 +1,53 @@
+import os
+
+import agent
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_fixture(name):
+    # netsh fixtures keep the CRLF line endings Windows produces
+    with open(os.path.join(FIXTURES, name), encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def fields(networks):
+    return [(n["ssid"], n["bssid"], n["signal"], n["channel"], n["frequency"], n["security"]) for n in networks]
+
+
+def test_iw_scan_dump():
+    networks = agent.IwWifiBackend.parse(read_fixture("iw_scan_dump.txt"))
+    assert fields(networks) == [
+        ("School-Staff", "3C:84:6A:11:22:33", -48, 6, 2437, "WPA2-PSK"),
+        ("School-Staff", "3C:84:6A:11:22:44", -67, 36, 5180, "WPA3-SAE"),
+        ("School-Edu", "0A:1B:2C:3D:4E:5F", -71, 1, 2412, "WPA2-Enterprise"),
+        ("Guest WiFi", "0A:1B:2C:3D:4E:60", -80, 11, 2462, "None"),
+        ("", "5E:AA:BB:CC:DD:01", -55, 6, 2437, "WPA2-PSK"),
+        ("", "5E:AA:BB:CC:DD:02", -59, 6, 2437, "WPA2-PSK"),
+        ("Школа № 5", "00:11:22:33:44:55", -88, 3, 2422, "WEP"),
+        ("OldRouter", "00:11:22:33:44:66", -90, 13, 2472, "WPA-PSK"),
+    ]
+
+
+def test_iw_empty_output():
+    assert agent.IwWifiBackend.parse("") == []
+
+
+def test_netsh_english():
+    networks = agent.NetshWifiBackend.parse(read_fixture("netsh_en.txt"))
+    assert fields(networks) == [
+        ("School-Staff", "3C:84:6A:11:22:33", -54, 6, 2437, "WPA2-PSK"),
+        ("School-Staff", "3C:84:6A:11:22:44", -80, 44, 5220, "WPA2-PSK"),
+        ("", "5E:AA:BB:CC:DD:01", -65, 1, 2412, "WPA2-PSK"),
+        ("Guest WiFi", "0A:1B:2C:3D:4E:60", -90, 11, 2462, "None"),
+        ("Lab-WPA3", "0A:1B:2C:3D:4E:61", -50, 36, 5180, "WPA3-SAE"),
+    ]
+
+
+def test_netsh_russian():
+    networks = agent.NetshWifiBackend.parse(read_fixture("netsh_ru.txt"))
+    assert fields(networks) == [
+        ("Школа-Учителя", "3C:84:6A:11:22:33", -60, 11, 2462, "WPA2-PSK"),
+        ("Гости", "0A:1B:2C:3D:4E:60", -83, 1, 2412, "None"),
+        ("", "5E:AA:BB:CC:DD:02", -75, 48, 5240, "WPA2-Enterprise"),
+    ]
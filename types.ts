@@ -34,6 +34,7 @@ export interface WifiNetwork {
   security: string;
   channel: number;
   isRogue: boolean;
+  rogueReasons?: string[];
 }
 
 export interface SecurityScan {
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+School CyberShield - IEEE OUI registry updater
+Downloads the IEEE MA-L/MA-M/MA-S registries into data/ and compiles data/oui.bin.
+
+Run: python update_oui.py                       (download the full registries)
+     python update_oui.py --bundle              (also regenerate data/oui-bundled.csv.gz)
+     python update_oui.py --bundle --from-txt oui.txt   (bundle from an IEEE oui.txt, offline)
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import os
+import re
+import sys
+import urllib.request
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+BUNDLED = os.path.join(DATA_DIR, "oui-bundled.csv.gz")
+SOURCES = {
+    "oui.csv": "https://standards-oui.ieee.org/oui/oui.csv",
+    "mam.csv": "https://standards-oui.ieee.org/oui28/mam.csv",
+    "oui36.csv": "https://standards-oui.ieee.org/oui36/oui36.csv",
+}
+TXT_LINE = re.compile(r"^([0-9A-F]{2})-([0-9A-F]{2})-([0-9A-F]{2})\s+\(hex\)\s+(.*)$")
+
+
+def download(timeout):
+    """Fetch every registry CSV into data/; returns False if any download failed"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    ok = True
+    for name, url in SOURCES.items():
+        path = os.path.join(DATA_DIR, name)
+        try:
+            # The IEEE server rejects requests without a browser-like user agent
+            request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0 CyberShield"})
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = response.read()
+        except OSError as e:
+            print("download failed: {} ({})".format(url, e))
+            ok = False
+            continue
+        with open(path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".tmp", path)
+        print("saved {} ({:.1f} MB)".format(path, len(body) / 1e6))
+    return ok
+
+
+def read_ma_l(txt_path=None):
+    """(assignment, organization) rows of the MA-L registry from oui.csv or an IEEE oui.txt"""
+    rows = {}
+    if txt_path:
+        with open(txt_path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match = TXT_LINE.match(line.strip())
+                if match:
+                    rows["".join(match.group(1, 2, 3))] = " ".join(match.group(4).split())
+    else:
+        with open(os.path.join(DATA_DIR, "oui.csv"), newline="", encoding="utf-8", errors="replace") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) >= 3 and row[1].strip():
+                    rows[row[1].strip().upper()] = " ".join(row[2].split())
+    return sorted(rows.items())
+
+
+def write_bundle(rows):
+    """Write the compact MA-L registry shipped with the agent (IEEE CSV columns, no addresses)"""
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(["Registry", "Assignment", "Organization Name"])
+    for assignment, name in rows:
+        writer.writerow(["MA-L", assignment, name])
+    # mtime=0 keeps the file byte-identical when the registry did not change
+    with open(BUNDLED, "wb") as f:
+        with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+            gz.write(text.getvalue().encode("utf-8"))
+    print("wrote {} ({} prefixes, {:.0f} KB)".format(BUNDLED, len(rows), os.path.getsize(BUNDLED) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the IEEE OUI vendor registry")
+    parser.add_argument("--bundle", action="store_true", help="regenerate data/oui-bundled.csv.gz")
+    parser.add_argument("--from-txt", help="build the bundle from an IEEE oui.txt instead of downloading")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if not args.from_txt and not download(args.timeout):
+        return 1
+    if args.bundle:
+        write_bundle(read_ma_l(args.from_txt))
+
+    # Compile data/oui.bin now so the agent starts without parsing CSVs
+    os.environ.setdefault("CYBERSHIELD_DB", "")
+    import agent
+    registry = agent.OUIRegistry()
+    print("registry: {} prefixes, {} vendors".format(
+        sum(len(i) for i in registry.indexes.values()), len(registry.vendors)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())